@@ -0,0 +1,434 @@
+"""Load tests a server on top of a local Eurostat stand-in.
+
+Usage:
+    python -m benchmarks.load_test --server sync --concurrency 8 --duration 30
+    python -m benchmarks.load_test --server async --workers 4 --latency 0.5
+    python -m benchmarks.load_test --url http://localhost:5000 --duration 60
+
+Unless a URL is given, a stub Eurostat server is started, the time a refresh takes
+with an empty cache (cold start) and with a filled one is measured, and the chosen
+server is started on the published snapshot. Simulated frontend users then send
+requests for the given duration and the throughput and latency percentiles per
+route are reported.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from typing import Any, Optional
+
+import numpy as np
+import requests
+
+from benchmarks.stub_eurostat import StubEurostat, add_stub_arguments, create_stub
+from mortality_monitor.cache import DataFrameFileCache
+from mortality_monitor.constants import AGE_COLUMN, GEO_COLUMN
+from mortality_monitor.refresh import refresh
+
+ALL_ROUTES = "all"
+SERVERS = ("sync", "async")
+
+# The frontend preselects the age groups above 65 and week 53.
+_DEFAULT_AGES = ("Y65-69", "Y70-74", "Y75-79", "Y80-84", "Y85-89", "Y_GE90")
+_DEFAULT_MAX_WEEK = 53
+_AVAILABLE_ROUTES = ("/available_geos", "/available_ages", "/available_years")
+_SERVER_STARTUP_TIMEOUT_SECONDS = 120.0
+_REQUEST_TIMEOUT_SECONDS = 60.0
+_OK = 200
+
+
+@dataclass(frozen=True)
+class Request:
+    method: str
+    route: str
+    payload: Optional[dict[str, Any]] = None
+
+
+@dataclass(frozen=True)
+class RouteReport:
+    """Latencies of all requests to a route.
+
+    Args:
+        requests: Number of requests sent.
+        errors: Number of requests which failed or were not answered with 200.
+        throughput: Requests answered per second.
+        p50_seconds: Median latency.
+        p99_seconds: 99th percentile of the latency.
+        max_seconds: Highest latency.
+    """
+
+    requests: int
+    errors: int
+    throughput: float
+    p50_seconds: float
+    p99_seconds: float
+    max_seconds: float
+
+
+@dataclass
+class _Results:
+    latencies: dict[str, list[float]] = field(default_factory=lambda: defaultdict(list))
+    errors: dict[str, int] = field(default_factory=lambda: defaultdict(int))
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def add(self, route: str, seconds: float, is_error: bool) -> None:
+        with self.lock:
+            self.latencies[route].append(seconds)
+            self.errors[route] += int(is_error)
+
+
+def generate_session(
+    rng: random.Random,
+    geos: list[str],
+    ages: list[str],
+    years: list[int],
+    num_queries: int,
+) -> list[Request]:
+    """Generates the requests of a single visit to the frontend.
+
+    The frontend fetches the available geos, ages and years once when it is opened.
+    Every query afterwards requests the excess deaths and the yearly deaths for the
+    same selection. Half of the queries keep the preselected ages, the others pick
+    all ages or a random range of them.
+
+    Args:
+        rng: Source of randomness.
+        geos: Geos to choose from.
+        ages: Ages to choose from, in order.
+        years: Years to choose from.
+        num_queries: Number of queries after opening the frontend.
+    """
+    session = [Request(method="GET", route=route) for route in _AVAILABLE_ROUTES]
+    for _ in range(num_queries):
+        selection = {
+            GEO_COLUMN: rng.choice(geos),
+            AGE_COLUMN: _choose_ages(rng=rng, ages=ages),
+            "year": rng.choice(years),
+        }
+        session.append(
+            Request(method="POST", route="/excess_deaths", payload=selection)
+        )
+        session.append(
+            Request(
+                method="POST",
+                route="/yearly_deaths",
+                payload={
+                    **selection,
+                    "max_week": rng.choice((_DEFAULT_MAX_WEEK, rng.randint(1, 53))),
+                },
+            )
+        )
+    return session
+
+
+def run_traffic(
+    url: str,
+    concurrency: int,
+    duration_seconds: float,
+    queries_per_session: int = 5,
+    think_time_seconds: float = 0.0,
+    seed: int = 0,
+) -> dict[str, RouteReport]:
+    """Simulates frontend users sending requests to a server.
+
+    Every user runs sessions back to back until the duration is over, waiting for
+    each response before sending the next request.
+
+    Args:
+        url: URL of the server, e.g. 'http://localhost:5000'.
+        concurrency: Number of simultaneous users.
+        duration_seconds: Time to send requests for.
+        queries_per_session: Number of queries per visit to the frontend.
+        think_time_seconds: Time a user waits between two requests.
+        seed: Seed of the random selections.
+
+    Returns:
+        Report per route and across all routes.
+    """
+    geos = _get_json(url=f"{url}/available_geos")
+    ages = list(_get_json(url=f"{url}/available_ages"))
+    years = _get_json(url=f"{url}/available_years")
+    results = _Results()
+    deadline = time.perf_counter() + duration_seconds
+
+    def simulate_user(user: int) -> None:
+        rng = random.Random(seed * 1000 + user)
+        with requests.Session() as http:
+            while time.perf_counter() < deadline:
+                for request in generate_session(
+                    rng=rng,
+                    geos=geos,
+                    ages=ages,
+                    years=years,
+                    num_queries=queries_per_session,
+                ):
+                    if time.perf_counter() >= deadline:
+                        return
+                    _send(http=http, url=url, request=request, results=results)
+                    time.sleep(think_time_seconds)
+
+    start = time.perf_counter()
+    users = [
+        threading.Thread(target=simulate_user, args=(user,))
+        for user in range(concurrency)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    return summarize(
+        latencies=results.latencies,
+        errors=results.errors,
+        elapsed_seconds=time.perf_counter() - start,
+    )
+
+
+def summarize(
+    latencies: dict[str, list[float]],
+    errors: dict[str, int],
+    elapsed_seconds: float,
+) -> dict[str, RouteReport]:
+    """Computes throughput and latency percentiles per route and across routes."""
+    reports = {
+        route: _to_report(
+            latencies=route_latencies,
+            errors=errors.get(route, 0),
+            elapsed_seconds=elapsed_seconds,
+        )
+        for route, route_latencies in sorted(latencies.items())
+    }
+    reports[ALL_ROUTES] = _to_report(
+        latencies=[latency for values in latencies.values() for latency in values],
+        errors=sum(errors.values()),
+        elapsed_seconds=elapsed_seconds,
+    )
+    return reports
+
+
+def measure_refresh(base_url: str, folder: str) -> dict[str, float]:
+    """Times a refresh against the given Eurostat URL with an empty and a full cache.
+
+    The snapshots are published to {folder}/snapshots.
+
+    Returns:
+        Duration of the cold and the warm refresh in seconds.
+    """
+    cache = DataFrameFileCache(
+        data_folder=os.path.join(folder, "data"),
+        archive_folder=os.path.join(folder, "archive"),
+    )
+    timings = {}
+    for name in ("cold_refresh_seconds", "warm_refresh_seconds"):
+        start = time.perf_counter()
+        refresh(
+            cache=cache,
+            snapshot_folder=os.path.join(folder, "snapshots"),
+            base_url=base_url,
+        )
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def start_server(
+    server: str, folder: str, workers: int
+) -> tuple[subprocess.Popen, str, float]:
+    """Starts a server in a new process on the snapshots in {folder}/snapshots.
+
+    Returns:
+        The process, the URL of the server and the time until it first answered.
+
+    Raises:
+        RuntimeError if the server does not answer in time.
+    """
+    port = _get_free_port()
+    if server == "async":
+        command = [
+            sys.executable,
+            "-m",
+            "mortality_monitor.async_server",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--queued",
+            str(2 * workers),
+        ]
+    else:
+        command = [
+            sys.executable,
+            "-c",
+            "from mortality_monitor.server import app; "
+            f"app.run(host='127.0.0.1', port={port}, threaded=True)",
+        ]
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    environment = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(
+            path for path in (repository, os.environ.get("PYTHONPATH")) if path
+        ),
+    }
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=folder,
+        env=environment,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    while time.perf_counter() - start < _SERVER_STARTUP_TIMEOUT_SECONDS:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}.")
+        try:
+            if requests.get(f"{url}/available_geos", timeout=1).status_code == _OK:
+                return process, url, time.perf_counter() - start
+        except requests.ConnectionError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("Server did not answer in time.")
+
+
+def print_report(reports: dict[str, RouteReport]) -> None:
+    print(
+        f"{'route':<18}{'requests':>10}{'errors':>8}{'req/s':>10}"
+        f"{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    )
+    for route, report in reports.items():
+        print(
+            f"{route:<18}{report.requests:>10}{report.errors:>8}"
+            f"{report.throughput:>10.1f}{report.p50_seconds * 1000:>10.1f}"
+            f"{report.p99_seconds * 1000:>10.1f}{report.max_seconds * 1000:>10.1f}"
+        )
+
+
+def _choose_ages(rng: random.Random, ages: list[str]) -> list[str]:
+    choice = rng.random()
+    if choice < 0.5:
+        return [age for age in _DEFAULT_AGES if age in ages] or ages
+    if choice < 0.75:
+        return ages
+    start = rng.randrange(len(ages))
+    return ages[start : rng.randint(start + 1, len(ages))]
+
+
+def _send(
+    http: requests.Session, url: str, request: Request, results: _Results
+) -> None:
+    start = time.perf_counter()
+    try:
+        response = http.request(
+            request.method,
+            f"{url}{request.route}",
+            json=request.payload,
+            timeout=_REQUEST_TIMEOUT_SECONDS,
+        )
+        is_error = response.status_code != _OK
+    except requests.RequestException:
+        is_error = True
+    results.add(
+        route=request.route, seconds=time.perf_counter() - start, is_error=is_error
+    )
+
+
+def _to_report(
+    latencies: list[float], errors: int, elapsed_seconds: float
+) -> RouteReport:
+    if not latencies:
+        return RouteReport(
+            requests=0,
+            errors=errors,
+            throughput=0.0,
+            p50_seconds=float("nan"),
+            p99_seconds=float("nan"),
+            max_seconds=float("nan"),
+        )
+    p50, p99 = np.percentile(latencies, (50, 99))
+    return RouteReport(
+        requests=len(latencies),
+        errors=errors,
+        throughput=(len(latencies) - errors) / elapsed_seconds,
+        p50_seconds=float(p50),
+        p99_seconds=float(p99),
+        max_seconds=float(max(latencies)),
+    )
+
+
+def _get_json(url: str) -> Any:
+    response = requests.get(url, timeout=_REQUEST_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.json()
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="Load test a running server instead.")
+    parser.add_argument("--server", choices=SERVERS, default="sync")
+    parser.add_argument("--workers", type=int, default=2, help="Of the async server.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="In seconds.")
+    parser.add_argument("--queries-per-session", type=int, default=5)
+    parser.add_argument("--think-time", type=float, default=0.0, help="In seconds.")
+    parser.add_argument("--output", help="Path to write the report JSON to.")
+    add_stub_arguments(parser)
+    return parser.parse_args()
+
+
+def _run(arguments: argparse.Namespace, url: str) -> dict[str, RouteReport]:
+    reports = run_traffic(
+        url=url,
+        concurrency=arguments.concurrency,
+        duration_seconds=arguments.duration,
+        queries_per_session=arguments.queries_per_session,
+        think_time_seconds=arguments.think_time,
+        seed=arguments.seed,
+    )
+    print_report(reports)
+    return reports
+
+
+if __name__ == "__main__":
+    arguments = _parse_arguments()
+    results: dict[str, Any] = {"arguments": vars(arguments)}
+    if arguments.url:
+        reports = _run(arguments=arguments, url=arguments.url)
+    else:
+        stub: StubEurostat = create_stub(arguments=arguments)
+        stub.start()
+        with tempfile.TemporaryDirectory() as folder:
+            results.update(measure_refresh(base_url=stub.base_url, folder=folder))
+            process, url, startup_seconds = start_server(
+                server=arguments.server, folder=folder, workers=arguments.workers
+            )
+            results["server_startup_seconds"] = startup_seconds
+            print(
+                f"Cold refresh: {results['cold_refresh_seconds']:.2f}s, warm "
+                f"refresh: {results['warm_refresh_seconds']:.2f}s, server "
+                f"startup: {startup_seconds:.2f}s"
+            )
+            try:
+                reports = _run(arguments=arguments, url=url)
+            finally:
+                process.terminate()
+                process.wait()
+        stub.shutdown()
+    results["routes"] = {route: asdict(report) for route, report in reports.items()}
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
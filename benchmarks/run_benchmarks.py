@@ -0,0 +1,361 @@
+"""Runs the benchmark suite on synthetic data and records the timings as JSON.
+
+Usage:
+    python -m benchmarks.run_benchmarks --output results.json
+    python -m benchmarks.run_benchmarks --output new.json --baseline results.json
+
+When a baseline is given, every benchmark whose median time grew by more than the
+tolerance is reported as a regression and the process exits with status 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Iterator
+
+import numpy as np
+import pandas as pd
+from pyjstat import pyjstat  # type: ignore
+
+from benchmarks.synthetic_data import (
+    DatasetSize,
+    generate_mortality_data,
+    generate_mortality_jsonstat,
+    generate_population_data,
+    generate_raw_population_data,
+)
+from mortality_monitor.cache import DataFrameFileCache
+from mortality_monitor.constants import AGE_COLUMN, DEFAULT_SNAPSHOT_FOLDER, GEO_COLUMN
+from mortality_monitor.deaths import get_deaths, get_deaths_per_million
+from mortality_monitor.eurostat import (
+    _create_yearly_period,
+    _preprocess_mortality_data,
+    _propagate_values_to_current_year,
+    _split_mortality_data_by_geo,
+)
+from mortality_monitor.expected_deaths import get_expected_deaths
+from mortality_monitor.jsonstat import decode_stream
+from mortality_monitor.models import get_model, get_model_names
+from mortality_monitor.snapshot import (
+    Snapshot,
+    build_snapshot,
+    load_latest_snapshot,
+    publish_snapshot,
+)
+from mortality_monitor.util import read_csv_with_weekly_period
+
+_DEFAULT_TOLERANCE = 0.2
+_CACHE_FILENAME = "benchmark_data"
+_SERVER_READY_TIMEOUT_SECONDS = 60.0
+_RESPONSE_CHUNK_BYTES = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Timing:
+    repeat: int
+    min_seconds: float
+    median_seconds: float
+    mean_seconds: float
+
+
+@dataclass(frozen=True)
+class Regression:
+    name: str
+    baseline_seconds: float
+    current_seconds: float
+
+    @property
+    def ratio(self) -> float:
+        return self.current_seconds / self.baseline_seconds
+
+
+def run_benchmarks(
+    size: DatasetSize,
+    repeat: int = 5,
+    name_filter: str = "",
+    seed: int = 0,
+) -> dict[str, Any]:
+    """Times every benchmark on a synthetic dataset of the given size.
+
+    Returns:
+        Dictionary with the dataset size, the environment and one Timing per
+        benchmark, ready to be dumped as JSON.
+    """
+    results: OrderedDict[str, Timing] = OrderedDict()
+    with _benchmarks(size=size, seed=seed) as benchmarks:
+        for name, function in benchmarks.items():
+            if name_filter not in name:
+                continue
+            function()  # Warm up caches and lazy imports.
+            times = timeit.Timer(function).repeat(repeat=repeat, number=1)
+            results[name] = Timing(
+                repeat=repeat,
+                min_seconds=min(times),
+                median_seconds=statistics.median(times),
+                mean_seconds=statistics.mean(times),
+            )
+            print(f"{name:<40} {results[name].median_seconds:>10.4f}s")
+    return {
+        "size": asdict(size),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+        },
+        "results": {name: asdict(timing) for name, timing in results.items()},
+    }
+
+
+def compare_results(
+    current: dict[str, Any],
+    baseline: dict[str, Any],
+    tolerance: float = _DEFAULT_TOLERANCE,
+) -> tuple[Regression, ...]:
+    """Finds benchmarks whose median time grew by more than the tolerance.
+
+    Benchmarks only present in one of the two results are ignored. Results recorded
+    for a different dataset size are not comparable and raise a ValueError.
+    """
+    if current["size"] != baseline["size"]:
+        raise ValueError(
+            f"Cannot compare results for size {current['size']} with a baseline "
+            f"recorded for size {baseline['size']}."
+        )
+    return tuple(
+        Regression(
+            name=name,
+            baseline_seconds=baseline["results"][name]["median_seconds"],
+            current_seconds=timing["median_seconds"],
+        )
+        for name, timing in current["results"].items()
+        if name in baseline["results"]
+        and timing["median_seconds"]
+        > baseline["results"][name]["median_seconds"] * (1 + tolerance)
+    )
+
+
+@contextmanager
+def _benchmarks(size: DatasetSize, seed: int) -> Iterator[dict[str, Callable]]:
+    mortality_data = generate_mortality_data(size=size, seed=seed)
+    population_data = generate_population_data(size=size, seed=seed)
+    mortality_jsonstat = generate_mortality_jsonstat(size=size, seed=seed)
+    raw_mortality_data = pyjstat.Dataset.read(mortality_jsonstat).write("dataframe")
+    mortality_response = json.dumps(mortality_jsonstat).encode()
+    mortality_response_chunks = [
+        mortality_response[i : i + _RESPONSE_CHUNK_BYTES]
+        for i in range(0, len(mortality_response), _RESPONSE_CHUNK_BYTES)
+    ]
+    yearly_population_data = (
+        generate_raw_population_data(size=size, seed=seed)
+        .drop(columns=["Unit of measure", "Sex"])
+        .dropna()
+        .pipe(_create_yearly_period)
+        .set_index([GEO_COLUMN, AGE_COLUMN], append=True)
+    )
+    geo, ages = size.geo_labels[0], size.age_codes
+    deaths = get_deaths(mortality_data=mortality_data, geo=geo, ages=ages)
+    snapshot = build_snapshot(
+        mortality_data=mortality_data, population_data=population_data
+    )
+
+    with tempfile.TemporaryDirectory() as folder, _working_directory(folder):
+        cache = DataFrameFileCache(
+            data_folder=os.path.join(folder, "cache"),
+            archive_folder=os.path.join(folder, "archive"),
+        )
+        cache.put_data(data=mortality_data, filename=_CACHE_FILENAME)
+        benchmarks: OrderedDict[str, Callable] = OrderedDict(
+            [
+                (
+                    "get_expected_deaths",
+                    lambda: get_expected_deaths(deaths=deaths),
+                ),
+                (
+                    "get_deaths",
+                    lambda: get_deaths(
+                        mortality_data=mortality_data, geo=geo, ages=ages
+                    ),
+                ),
+                (
+                    "get_deaths_per_million",
+                    lambda: get_deaths_per_million(
+                        mortality_data=mortality_data,
+                        population_data=population_data,
+                        geo=geo,
+                        ages=ages,
+                    ),
+                ),
+                (
+                    "preprocess_mortality_data",
+                    lambda: _preprocess_mortality_data(raw_mortality_data),
+                ),
+                (
+                    "decode_mortality_response[pyjstat]",
+                    lambda: pyjstat.Dataset.read(mortality_response.decode())
+                    .write("dataframe")
+                    .pipe(_preprocess_mortality_data),
+                ),
+                (
+                    "decode_mortality_response[streaming]",
+                    lambda: list(
+                        _split_mortality_data_by_geo(
+                            dataset=decode_stream(mortality_response_chunks)
+                        )
+                    ),
+                ),
+                (
+                    "propagate_values_to_current_year",
+                    lambda: _propagate_values_to_current_year(yearly_population_data),
+                ),
+                (
+                    "cache_put_data",
+                    lambda: cache.put_data(
+                        data=mortality_data, filename=_CACHE_FILENAME
+                    ),
+                ),
+                (
+                    "cache_get_data",
+                    lambda: cache.get_data(
+                        filename=_CACHE_FILENAME,
+                        read_function=read_csv_with_weekly_period,
+                    ),
+                ),
+                (
+                    "build_snapshot",
+                    lambda: build_snapshot(
+                        mortality_data=mortality_data, population_data=population_data
+                    ),
+                ),
+            ]
+        )
+        for name in get_model_names():
+            benchmarks[f"predict_all_geos[{name}]"] = lambda model=get_model(
+                name
+            ): snapshot.predict(model=model)
+        benchmarks.update(_endpoint_benchmarks(snapshot=snapshot, geo=geo, ages=ages))
+        yield benchmarks
+
+
+def _endpoint_benchmarks(
+    snapshot: Snapshot, geo: str, ages: tuple[str, ...]
+) -> OrderedDict[str, Callable]:
+    """Imports the server on top of a snapshot published in the working directory."""
+    publish_snapshot(snapshot=snapshot, folder=DEFAULT_SNAPSHOT_FOLDER)
+    sys.modules.pop("mortality_monitor.server", None)
+    server = importlib.import_module("mortality_monitor.server")
+    if not server.wait_until_ready(timeout_seconds=_SERVER_READY_TIMEOUT_SECONDS):
+        raise RuntimeError("The server did not load the snapshot in time.")
+    client = server.app.test_client()
+    year = int(snapshot.periods[-1].year)
+    payload = {GEO_COLUMN: geo, AGE_COLUMN: list(ages), "year": year}
+    subset_payload = {**payload, AGE_COLUMN: list(ages[::2])}
+    return OrderedDict(
+        [
+            (
+                "load_latest_snapshot",
+                lambda: load_latest_snapshot(folder=DEFAULT_SNAPSHOT_FOLDER),
+            ),
+            (
+                "endpoint_available_geos",
+                lambda: _check_ok(client.get("/available_geos")),
+            ),
+            (
+                "endpoint_available_ages",
+                lambda: _check_ok(client.get("/available_ages")),
+            ),
+            (
+                "endpoint_available_years",
+                lambda: _check_ok(client.get("/available_years")),
+            ),
+            (
+                "endpoint_excess_deaths",
+                lambda: _check_ok(client.post("/excess_deaths", json=payload)),
+            ),
+            (
+                "endpoint_excess_deaths_age_subset",
+                lambda: _check_ok(client.post("/excess_deaths", json=subset_payload)),
+            ),
+            (
+                "endpoint_leaderboard",
+                lambda: _check_ok(client.get("/leaderboard?by_age=true")),
+            ),
+            (
+                "endpoint_yearly_deaths",
+                lambda: _check_ok(
+                    client.post("/yearly_deaths", json={**payload, "max_week": 53})
+                ),
+            ),
+        ]
+    )
+
+
+def _check_ok(response: Any) -> Any:
+    if response.status_code != 200:
+        raise RuntimeError(f"Benchmarked request failed: {response.status}")
+    return response
+
+
+@contextmanager
+def _working_directory(path: str) -> Iterator[None]:
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def _parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--geos", type=int, default=5)
+    parser.add_argument("--ages", type=int, default=19)
+    parser.add_argument("--years", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--filter", default="", help="Only run benchmarks containing this string."
+    )
+    parser.add_argument("--output", help="Path to write the results JSON to.")
+    parser.add_argument("--baseline", help="Results JSON to compare against.")
+    parser.add_argument("--tolerance", type=float, default=_DEFAULT_TOLERANCE)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = _parse_arguments()
+    results = run_benchmarks(
+        size=DatasetSize(
+            num_geos=arguments.geos, num_ages=arguments.ages, num_years=arguments.years
+        ),
+        repeat=arguments.repeat,
+        name_filter=arguments.filter,
+        seed=arguments.seed,
+    )
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            regressions = compare_results(
+                current=results,
+                baseline=json.load(file),
+                tolerance=arguments.tolerance,
+            )
+        for regression in regressions:
+            print(
+                f"REGRESSION {regression.name}: {regression.baseline_seconds:.4f}s -> "
+                f"{regression.current_seconds:.4f}s ({regression.ratio:.2f}x)"
+            )
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,236 @@
+"""Local stand-in for the Eurostat API replaying recorded JSON-stat responses.
+
+Usage:
+    python -m benchmarks.stub_eurostat record --recordings recordings
+    python -m benchmarks.stub_eurostat serve --recordings recordings --latency 0.5
+
+Without recordings, synthetic tables are served instead. Point the refresh at the
+stub via `python -m mortality_monitor.refresh --base-url <printed URL>`.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from benchmarks.synthetic_data import (
+    DatasetSize,
+    generate_mortality_jsonstat,
+    generate_population_jsonstat,
+)
+from mortality_monitor.constants import COUNTRIES
+from mortality_monitor.eurostat import (
+    _MORTALITY_TABLE,
+    _POPULATION_TABLE,
+    BASE_URL,
+    _build_query,
+)
+from mortality_monitor.util import get_all_age_groups_for_query
+
+TABLES = (_MORTALITY_TABLE, _POPULATION_TABLE)
+
+_NOT_FOUND = 404
+_NOT_MODIFIED = 304
+_OK = 200
+_RECORDING_TIMEOUT_SECONDS = 600
+
+
+class StubEurostat(ThreadingHTTPServer):
+    """Serves JSON-stat tables under /{table} like the Eurostat API.
+
+    Query parameters are ignored, so every request for a table returns all of it.
+    Responses carry an ETag derived from the table content and conditional
+    requests for an unchanged table are answered with 304 Not Modified.
+
+    Args:
+        responses: JSON-stat response per table name.
+        latency_seconds: Time every request is delayed by.
+        jitter_seconds: Maximum random time added to the latency.
+        host: Host to listen on.
+        port: Port to listen on. Defaults to any free port.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        responses: dict[str, dict[str, Any]],
+        latency_seconds: float = 0.0,
+        jitter_seconds: float = 0.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        super().__init__((host, port), _StubEurostatHandler)
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.requested_paths: list[str] = []
+        self._bodies: dict[str, bytes] = {}
+        for table, response in responses.items():
+            self.set_response(table=table, response=response)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        if isinstance(host, bytes):
+            host = host.decode()
+        return f"http://{host}:{port}/{{table}}?format=JSON&lang=EN"
+
+    def set_response(self, table: str, response: dict[str, Any]) -> None:
+        """Replaces the response of a table, e.g. to simulate an update."""
+        self._bodies[table] = json.dumps(response).encode()
+
+    def get_etag(self, table: str) -> str:
+        return f'"{hashlib.sha256(self._bodies[table]).hexdigest()[:16]}"'
+
+    def start(self) -> threading.Thread:
+        """Serves requests in a background thread until shutdown is called."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class _StubEurostatHandler(BaseHTTPRequestHandler):
+    server: StubEurostat
+
+    def do_GET(self):
+        self.server.requested_paths.append(self.path)
+        time.sleep(
+            self.server.latency_seconds
+            + random.uniform(0.0, self.server.jitter_seconds)
+        )
+        table = urlparse(self.path).path.strip("/")
+        if table not in self.server._bodies:
+            self.send_error(_NOT_FOUND, f"Unknown table {table}")
+            return
+        etag = self.server.get_etag(table=table)
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(_NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        body = self.server._bodies[table]
+        self.send_response(_OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def record_responses(folder: str, base_url: str = BASE_URL) -> tuple[str, ...]:
+    """Downloads the tables the refresh uses and stores them as {table}.json.
+
+    Returns:
+        Paths of the recorded responses.
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for table in TABLES:
+        response = requests.get(
+            _build_query(
+                geos=COUNTRIES,
+                ages=get_all_age_groups_for_query(),
+                table=table,
+                base_url=base_url,
+            ),
+            timeout=_RECORDING_TIMEOUT_SECONDS,
+        )
+        response.raise_for_status()
+        path = os.path.join(folder, f"{table}.json")
+        with open(path, "wb") as file:
+            file.write(response.content)
+        paths.append(path)
+    return tuple(paths)
+
+
+def load_recordings(folder: str) -> dict[str, dict[str, Any]]:
+    """Reads the responses stored by record_responses.
+
+    Raises:
+        FileNotFoundError if a table has not been recorded.
+    """
+    responses = {}
+    for table in TABLES:
+        with open(os.path.join(folder, f"{table}.json")) as file:
+            responses[table] = json.load(file)
+    return responses
+
+
+def get_synthetic_responses(
+    size: DatasetSize, seed: int = 0
+) -> dict[str, dict[str, Any]]:
+    return {
+        _MORTALITY_TABLE: generate_mortality_jsonstat(size=size, seed=seed),
+        _POPULATION_TABLE: generate_population_jsonstat(size=size, seed=seed),
+    }
+
+
+def get_responses(
+    recordings: Optional[str], size: DatasetSize, seed: int = 0
+) -> dict[str, dict[str, Any]]:
+    """Recorded responses if a folder is given, otherwise synthetic ones."""
+    if recordings:
+        return load_recordings(folder=recordings)
+    return get_synthetic_responses(size=size, seed=seed)
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """Adds the arguments describing what and how the stub serves."""
+    parser.add_argument(
+        "--recordings",
+        help="Folder with recorded responses. Serves synthetic data if omitted.",
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="In seconds.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="In seconds.")
+    parser.add_argument("--geos", type=int, default=30)
+    parser.add_argument("--ages", type=int, default=19)
+    parser.add_argument("--years", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def create_stub(arguments: argparse.Namespace, port: int = 0) -> StubEurostat:
+    return StubEurostat(
+        responses=get_responses(
+            recordings=arguments.recordings,
+            size=DatasetSize(
+                num_geos=arguments.geos,
+                num_ages=arguments.ages,
+                num_years=arguments.years,
+            ),
+            seed=arguments.seed,
+        ),
+        latency_seconds=arguments.latency,
+        jitter_seconds=arguments.jitter,
+        port=port,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="Record Eurostat responses.")
+    record_parser.add_argument("--recordings", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Serve recorded responses.")
+    add_stub_arguments(serve_parser)
+    serve_parser.add_argument("--port", type=int, default=8081)
+    arguments = parser.parse_args()
+    if arguments.command == "record":
+        for path in record_responses(folder=arguments.recordings):
+            print(f"Recorded {path}")
+    else:
+        stub = create_stub(arguments=arguments, port=arguments.port)
+        print(f"Serving Eurostat stub at {stub.base_url}")
+        stub.serve_forever()
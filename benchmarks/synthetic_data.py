@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+import datetime as dt
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from mortality_monitor.constants import GEO_COLUMN
+from mortality_monitor.eurostat import (
+    _preprocess_mortality_data,
+    _preprocess_population_data,
+)
+from mortality_monitor.util import QUERY_AGE_TO_DATA_AGE
+
+_START_YEAR = 2015
+_UNKNOWN_WEEK = "W99"
+_DIMENSION_LABELS = OrderedDict(
+    [
+        ("unit", "Unit of measure"),
+        ("sex", "Sex"),
+        ("age", "Age class"),
+        ("geo", GEO_COLUMN),
+        ("time", "Time"),
+    ]
+)
+_UNIT = ("NR", "Number")
+_SEX = ("T", "Total")
+
+
+@dataclass(frozen=True)
+class DatasetSize:
+    """Shape of a synthetic dataset.
+
+    Args:
+        num_geos: Number of regions.
+        num_ages: Number of 5-year age classes, at most the number Eurostat publishes.
+        num_years: Number of consecutive years starting in 2015.
+    """
+
+    num_geos: int
+    num_ages: int
+    num_years: int
+
+    def __post_init__(self) -> None:
+        if not 0 < self.num_ages <= len(QUERY_AGE_TO_DATA_AGE):
+            raise ValueError(
+                f"num_ages must be between 1 and {len(QUERY_AGE_TO_DATA_AGE)}."
+            )
+        if (self.num_geos <= 0) or (self.num_years <= 0):
+            raise ValueError("num_geos and num_years must be positive.")
+
+    @property
+    def geo_codes(self) -> tuple[str, ...]:
+        return tuple(f"G{i:04d}" for i in range(self.num_geos))
+
+    @property
+    def geo_labels(self) -> tuple[str, ...]:
+        return tuple(f"Region {i:04d}" for i in range(self.num_geos))
+
+    @property
+    def age_codes(self) -> tuple[str, ...]:
+        return tuple(QUERY_AGE_TO_DATA_AGE.keys())[: self.num_ages]
+
+    @property
+    def age_labels(self) -> tuple[str, ...]:
+        return tuple(QUERY_AGE_TO_DATA_AGE.values())[: self.num_ages]
+
+    @property
+    def years(self) -> tuple[int, ...]:
+        return tuple(range(_START_YEAR, _START_YEAR + self.num_years))
+
+    @property
+    def weeks(self) -> tuple[str, ...]:
+        """Eurostat time codes, including the 'unknown week' W99 of every year."""
+        return tuple(
+            f"{year}-W{week:02d}" if week != 99 else f"{year}-{_UNKNOWN_WEEK}"
+            for year in self.years
+            for week in tuple(range(1, _num_iso_weeks(year=year) + 1)) + (99,)
+        )
+
+
+def generate_weekly_deaths(size: DatasetSize, seed: int = 0) -> np.ndarray:
+    """Generates weekly deaths with an age gradient, a winter peak and noise.
+
+    Returns:
+        Array of shape (geos, ages, weeks) aligned with DatasetSize.weeks.
+    """
+    rng = np.random.default_rng(seed)
+    week_numbers = np.array([int(week.split("W")[1]) for week in size.weeks])
+    seasonality = 1 + 0.15 * np.cos(2 * np.pi * (week_numbers - 2) / 52)
+    seasonality = np.where(week_numbers == 99, 0.02, seasonality)
+    age_profile = np.exp(np.linspace(0, 6, size.num_ages))
+    geo_scale = rng.uniform(0.2, 5.0, size=size.num_geos)
+    expectation = (
+        geo_scale[:, np.newaxis, np.newaxis]
+        * age_profile[np.newaxis, :, np.newaxis]
+        * seasonality[np.newaxis, np.newaxis, :]
+    )
+    return rng.poisson(expectation).astype(float)
+
+
+def generate_population(size: DatasetSize, seed: int = 0) -> np.ndarray:
+    """Generates population on January 1st.
+
+    Returns:
+        Array of shape (geos, ages, years) aligned with DatasetSize.years.
+    """
+    rng = np.random.default_rng(seed)
+    base = rng.uniform(5e4, 2e6, size=(size.num_geos, size.num_ages, 1))
+    growth = 1 + 0.005 * np.arange(size.num_years)[np.newaxis, np.newaxis, :]
+    return np.round(base * growth)
+
+
+def generate_mortality_jsonstat(
+    size: DatasetSize, seed: int = 0, missing_fraction: float = 0.01
+) -> OrderedDict:
+    """Generates a demo_r_mweek3-like JSON-stat 2.0 response.
+
+    Values are stored sparsely the way Eurostat does, i.e. missing observations are
+    simply absent from the 'value' mapping.
+    """
+    deaths = generate_weekly_deaths(size=size, seed=seed)
+    return _to_jsonstat(
+        values=_drop_random_values(
+            values=deaths, missing_fraction=missing_fraction, seed=seed
+        ),
+        size=size,
+        time_codes=size.weeks,
+        label="Deaths by week, sex, 5-year age group and NUTS 3 region",
+    )
+
+
+def generate_population_jsonstat(size: DatasetSize, seed: int = 0) -> OrderedDict:
+    """Generates a demo_r_pjangrp3-like JSON-stat 2.0 response."""
+    return _to_jsonstat(
+        values=generate_population(size=size, seed=seed),
+        size=size,
+        time_codes=tuple(str(year) for year in size.years),
+        label="Population on 1 January by age group, sex and NUTS 3 region",
+    )
+
+
+def generate_raw_mortality_data(
+    size: DatasetSize, seed: int = 0, missing_fraction: float = 0.01
+) -> pd.DataFrame:
+    """Generates mortality data as pyjstat returns it for demo_r_mweek3."""
+    deaths = _drop_random_values(
+        values=generate_weekly_deaths(size=size, seed=seed),
+        missing_fraction=missing_fraction,
+        seed=seed,
+    )
+    return _to_raw_frame(values=deaths, size=size, time_codes=size.weeks)
+
+
+def generate_raw_population_data(size: DatasetSize, seed: int = 0) -> pd.DataFrame:
+    """Generates population data as pyjstat returns it for demo_r_pjangrp3."""
+    return _to_raw_frame(
+        values=generate_population(size=size, seed=seed),
+        size=size,
+        time_codes=tuple(str(year) for year in size.years),
+    )
+
+
+def generate_mortality_data(
+    size: DatasetSize, seed: int = 0, missing_fraction: float = 0.01
+) -> pd.DataFrame:
+    """Generates long-format mortality data as get_mortality_data returns it."""
+    return generate_raw_mortality_data(
+        size=size, seed=seed, missing_fraction=missing_fraction
+    ).pipe(_preprocess_mortality_data)
+
+
+def generate_population_data(size: DatasetSize, seed: int = 0) -> pd.DataFrame:
+    """Generates long-format population data as get_population_data returns it."""
+    return generate_raw_population_data(size=size, seed=seed).pipe(
+        _preprocess_population_data
+    )
+
+
+def _num_iso_weeks(year: int) -> int:
+    return dt.date(year, 12, 28).isocalendar()[1]
+
+
+def _drop_random_values(
+    values: np.ndarray, missing_fraction: float, seed: int
+) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    return np.where(rng.random(values.shape) < missing_fraction, np.nan, values)
+
+
+def _to_jsonstat(
+    values: np.ndarray, size: DatasetSize, time_codes: tuple[str, ...], label: str
+) -> OrderedDict:
+    categories: OrderedDict[str, tuple[tuple[str, ...], tuple[str, ...]]] = OrderedDict(
+        [
+            ("unit", ((_UNIT[0],), (_UNIT[1],))),
+            ("sex", ((_SEX[0],), (_SEX[1],))),
+            ("age", (size.age_codes, size.age_labels)),
+            ("geo", (size.geo_codes, size.geo_labels)),
+            ("time", (time_codes, time_codes)),
+        ]
+    )
+    # JSON-stat values are laid out row-major over the dimensions, i.e. with
+    # (unit, sex, age, geo, time) as the order of the axes.
+    flat_values = values.transpose(1, 0, 2).ravel()
+    present = np.flatnonzero(~np.isnan(flat_values))
+    # Like Eurostat, the values of the latest year are flagged as provisional.
+    num_times = len(time_codes)
+    provisional = present[
+        present % num_times >= num_times - num_times // len(size.years)
+    ]
+    dimension: OrderedDict[str, Any] = OrderedDict(
+        (
+            dimension_id,
+            OrderedDict(
+                [
+                    ("label", _DIMENSION_LABELS[dimension_id]),
+                    (
+                        "category",
+                        OrderedDict(
+                            [
+                                (
+                                    "index",
+                                    OrderedDict(
+                                        (code, i) for i, code in enumerate(codes)
+                                    ),
+                                ),
+                                ("label", OrderedDict(zip(codes, labels))),
+                            ]
+                        ),
+                    ),
+                ]
+            ),
+        )
+        for dimension_id, (codes, labels) in categories.items()
+    )
+    return OrderedDict(
+        [
+            ("version", "2.0"),
+            ("class", "dataset"),
+            ("label", label),
+            ("source", "ESTAT"),
+            ("updated", dt.datetime(2022, 1, 1).isoformat()),
+            (
+                "value",
+                OrderedDict((str(i), float(flat_values[i])) for i in present.tolist()),
+            ),
+            ("status", OrderedDict((str(i), "p") for i in provisional.tolist())),
+            ("id", list(categories.keys())),
+            ("size", [len(codes) for codes, _ in categories.values()]),
+            ("dimension", dimension),
+        ]
+    )
+
+
+def _to_raw_frame(
+    values: np.ndarray, size: DatasetSize, time_codes: tuple[str, ...]
+) -> pd.DataFrame:
+    num_ages, num_geos, num_times = size.num_ages, size.num_geos, len(time_codes)
+    return pd.DataFrame(
+        {
+            _DIMENSION_LABELS["unit"]: _UNIT[1],
+            _DIMENSION_LABELS["sex"]: _SEX[1],
+            _DIMENSION_LABELS["age"]: np.repeat(
+                np.array(size.age_labels, dtype=object), num_geos * num_times
+            ),
+            _DIMENSION_LABELS["geo"]: np.tile(
+                np.repeat(np.array(size.geo_labels, dtype=object), num_times),
+                num_ages,
+            ),
+            _DIMENSION_LABELS["time"]: np.tile(
+                np.array(time_codes, dtype=object), num_ages * num_geos
+            ),
+            "value": values.transpose(1, 0, 2).ravel(),
+        }
+    )
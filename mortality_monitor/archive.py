@@ -0,0 +1,318 @@
+"""Content-addressed store keeping every archived version of the cached files.
+
+Files are split into chunks of whole lines whose boundaries depend on the content of
+the lines only, so a new or revised line only changes the chunks around it. New
+weeks therefore only add chunks if they are appended to the end of a file, which is
+why the cache archives its tables ordered by period.
+Every chunk is compressed and stored once under the hash of its content, and every
+archived version of a file is a small manifest listing its chunks:
+
+    {folder}/objects/ab/abcdef...          zlib compressed chunk
+    {folder}/manifests/{filename}/{archived_at}.json
+"""
+
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+import os
+import zlib
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+_OBJECTS_FOLDER = "objects"
+_MANIFESTS_FOLDER = "manifests"
+_MANIFEST_EXTENSION = ".json"
+_TIMESTAMP_FORMAT = "%Y%m%dT%H%M%S%f"
+_TEMPORARY_SUFFIX = ".tmp"
+
+# A chunk ends after a line whose checksum is divisible by the divisor, which gives
+# chunks of about 1000 lines, but never before the minimum or after the maximum size.
+_CHUNK_DIVISOR = 1024
+_MIN_CHUNK_BYTES = 4 * 1024
+_MAX_CHUNK_BYTES = 1024 * 1024
+_COMPRESSION_LEVEL = 6
+
+
+@dataclass(frozen=True)
+class ArchivedVersion:
+    """A version of a file in the archive.
+
+    Args:
+        filename: Name of the archived file.
+        archived_at: Time the version was archived.
+        chunks: Hashes of the chunks making up the file, in order.
+        metadata: Metadata archived with the file, e.g. its HTTP validators.
+    """
+
+    filename: str
+    archived_at: datetime.datetime
+    chunks: tuple[str, ...]
+    metadata: dict
+
+
+@dataclass(frozen=True)
+class ArchiveStore:
+    folder: str
+
+    def put(
+        self,
+        content: bytes,
+        filename: str,
+        archived_at: Optional[datetime.datetime] = None,
+        metadata: Optional[dict] = None,
+    ) -> ArchivedVersion:
+        """Archives a version of a file, only storing chunks not archived before.
+
+        Args:
+            content: Content of the file.
+            filename: Name under which the versions of the file are archived.
+            archived_at: Time of the version. Defaults to now.
+            metadata: JSON serializable metadata to archive with the version.
+
+        Returns:
+            The archived version.
+        """
+        return self.put_stream(
+            parts=[content],
+            filename=filename,
+            archived_at=archived_at,
+            metadata=metadata,
+        )
+
+    def put_stream(
+        self,
+        parts: Iterable[bytes],
+        filename: str,
+        archived_at: Optional[datetime.datetime] = None,
+        metadata: Optional[dict] = None,
+    ) -> ArchivedVersion:
+        """Archives a version of a file arriving in parts, see put.
+
+        Chunks are stored as soon as they are complete, so only about one chunk of
+        the file is held in memory. The version is only listed once all parts have
+        been archived.
+
+        Args:
+            parts: Consecutive parts of the content of the file, split anywhere.
+            filename: Name under which the versions of the file are archived.
+            archived_at: Time of the version. Defaults to now.
+            metadata: JSON serializable metadata to archive with the version.
+
+        Returns:
+            The archived version.
+        """
+        chunks = []
+        for chunk in split_stream_into_chunks(parts):
+            chunk_hash = hashlib.sha256(chunk).hexdigest()
+            path = self._object_path(chunk_hash=chunk_hash)
+            if not os.path.isfile(path):
+                _write_atomically(
+                    path=path, content=zlib.compress(chunk, _COMPRESSION_LEVEL)
+                )
+            chunks.append(chunk_hash)
+        version = ArchivedVersion(
+            filename=filename,
+            archived_at=archived_at or datetime.datetime.now(),
+            chunks=tuple(chunks),
+            metadata=metadata or {},
+        )
+        _write_atomically(
+            path=self._manifest_path(
+                filename=filename, archived_at=version.archived_at
+            ),
+            content=json.dumps(
+                {
+                    "archived_at": version.archived_at.isoformat(),
+                    "chunks": version.chunks,
+                    "metadata": version.metadata,
+                }
+            ).encode(),
+        )
+        return version
+
+    def get(self, version: ArchivedVersion) -> bytes:
+        """Reassembles the content of an archived version."""
+        return b"".join(
+            zlib.decompress(self._read(self._object_path(chunk_hash=chunk_hash)))
+            for chunk_hash in version.chunks
+        )
+
+    def get_version_as_of(
+        self, filename: str, as_of: datetime.datetime
+    ) -> ArchivedVersion:
+        """Gets the last version of a file archived at or before a point in time.
+
+        Raises:
+            FileNotFoundError if no version was archived at or before that time.
+        """
+        candidates = [
+            archived_at
+            for archived_at in self.list_archive_times(filename=filename)
+            if archived_at <= as_of
+        ]
+        if not candidates:
+            raise FileNotFoundError(
+                f"No version of {filename} was archived at or before {as_of}."
+            )
+        return self._read_manifest(filename=filename, archived_at=candidates[-1])
+
+    def list_archive_times(self, filename: str) -> tuple[datetime.datetime, ...]:
+        """Lists the times all versions of a file were archived at, oldest first."""
+        folder = os.path.join(self.folder, _MANIFESTS_FOLDER, filename)
+        if not os.path.isdir(folder):
+            return ()
+        return tuple(
+            sorted(
+                datetime.datetime.strptime(
+                    name[: -len(_MANIFEST_EXTENSION)], _TIMESTAMP_FORMAT
+                )
+                for name in os.listdir(folder)
+                if name.endswith(_MANIFEST_EXTENSION)
+            )
+        )
+
+    def prune(
+        self,
+        keep_days: float,
+        keep_months: int,
+        now: Optional[datetime.datetime] = None,
+    ) -> int:
+        """Applies the retention policy and deletes chunks no version refers to.
+
+        All versions of the last keep_days days are kept. Of older versions, only the
+        last one of each of the last keep_months calendar months is kept.
+
+        Returns:
+            Number of deleted versions.
+        """
+        now = now or datetime.datetime.now()
+        first_month = _shift_months(month=(now.year, now.month), months=-keep_months)
+        deleted = 0
+        for filename in self._list_filenames():
+            last_of_month: dict[tuple[int, int], datetime.datetime] = {}
+            for archived_at in self.list_archive_times(filename=filename):
+                last_of_month[(archived_at.year, archived_at.month)] = archived_at
+            for archived_at in self.list_archive_times(filename=filename):
+                month = (archived_at.year, archived_at.month)
+                is_recent = now - archived_at <= datetime.timedelta(days=keep_days)
+                is_kept_for_month = (month >= first_month) and (
+                    last_of_month[month] == archived_at
+                )
+                if not (is_recent or is_kept_for_month):
+                    os.remove(
+                        self._manifest_path(filename=filename, archived_at=archived_at)
+                    )
+                    deleted += 1
+        if deleted:
+            self.collect_garbage()
+        return deleted
+
+    def collect_garbage(self) -> int:
+        """Deletes all chunks no archived version refers to.
+
+        Returns:
+            Number of deleted chunks.
+        """
+        referenced = {
+            chunk_hash
+            for filename in self._list_filenames()
+            for archived_at in self.list_archive_times(filename=filename)
+            for chunk_hash in self._read_manifest(
+                filename=filename, archived_at=archived_at
+            ).chunks
+        }
+        deleted = 0
+        for chunk_hash in list(self._list_objects()):
+            if chunk_hash not in referenced:
+                os.remove(self._object_path(chunk_hash=chunk_hash))
+                deleted += 1
+        return deleted
+
+    def _read_manifest(
+        self, filename: str, archived_at: datetime.datetime
+    ) -> ArchivedVersion:
+        manifest = json.loads(
+            self._read(self._manifest_path(filename=filename, archived_at=archived_at))
+        )
+        return ArchivedVersion(
+            filename=filename,
+            archived_at=datetime.datetime.fromisoformat(manifest["archived_at"]),
+            chunks=tuple(manifest["chunks"]),
+            metadata=manifest["metadata"],
+        )
+
+    def _list_filenames(self) -> tuple[str, ...]:
+        folder = os.path.join(self.folder, _MANIFESTS_FOLDER)
+        return tuple(sorted(os.listdir(folder))) if os.path.isdir(folder) else ()
+
+    def _list_objects(self) -> Iterator[str]:
+        folder = os.path.join(self.folder, _OBJECTS_FOLDER)
+        if not os.path.isdir(folder):
+            return
+        for prefix in os.listdir(folder):
+            for name in os.listdir(os.path.join(folder, prefix)):
+                if not name.endswith(_TEMPORARY_SUFFIX):
+                    yield name
+
+    def _object_path(self, chunk_hash: str) -> str:
+        return os.path.join(self.folder, _OBJECTS_FOLDER, chunk_hash[:2], chunk_hash)
+
+    def _manifest_path(self, filename: str, archived_at: datetime.datetime) -> str:
+        return os.path.join(
+            self.folder,
+            _MANIFESTS_FOLDER,
+            filename,
+            f"{archived_at.strftime(_TIMESTAMP_FORMAT)}{_MANIFEST_EXTENSION}",
+        )
+
+    @staticmethod
+    def _read(path: str) -> bytes:
+        with open(path, "rb") as file:
+            return file.read()
+
+
+def split_into_chunks(content: bytes) -> Iterator[bytes]:
+    """Splits content into chunks of whole lines at content defined boundaries."""
+    return split_stream_into_chunks([content])
+
+
+def split_stream_into_chunks(parts: Iterable[bytes]) -> Iterator[bytes]:
+    """Splits content arriving in parts like split_into_chunks splits it as a whole.
+
+    Only the current chunk and the part it ends in are held in memory.
+    """
+    pending = bytearray()
+    start = 0
+    for part in parts:
+        pending += part
+        while True:
+            end = pending.find(b"\n", start)
+            if end == -1:
+                break
+            end += 1
+            if (end >= _MAX_CHUNK_BYTES) or (
+                end >= _MIN_CHUNK_BYTES
+                and zlib.crc32(pending[start:end]) % _CHUNK_DIVISOR == 0
+            ):
+                yield bytes(pending[:end])
+                del pending[:end]
+                start = 0
+            else:
+                start = end
+    if pending:
+        yield bytes(pending)
+
+
+def _shift_months(month: tuple[int, int], months: int) -> tuple[int, int]:
+    index = month[0] * 12 + month[1] - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def _write_atomically(path: str, content: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}{_TEMPORARY_SUFFIX}"
+    with open(temporary_path, "wb") as file:
+        file.write(content)
+    os.replace(temporary_path, path)
@@ -0,0 +1,314 @@
+"""Serves the routes of server.py but computes results in worker processes.
+
+The bulk /export route is intentionally only served by server.py since it streams
+its response from the serving process. /ready reports whether the snapshot has been
+loaded, which is retried on every call until a snapshot has been published.
+
+Model and aggregation work runs in a bounded process pool so it neither holds the
+GIL of the serving process nor piles up without limit: once all worker and queue
+slots are taken, further requests are rejected with 503 and requests whose result
+takes longer than the timeout are answered with 504. Request threads only wait on
+their result, so cheap metadata routes keep answering while the pool is busy.
+
+Usage:
+    python -m mortality_monitor.async_server --workers 4 --queued 8 --timeout 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import threading
+from concurrent import futures
+from dataclasses import asdict
+from typing import Any, Optional
+
+import pandas as pd
+from flask import Flask, abort, jsonify, request
+from flask_cors import CORS  # type: ignore
+
+from mortality_monitor.changes import UnknownVersionError, get_changes_since
+from mortality_monitor.constants import (
+    AGE_COLUMN,
+    DEFAULT_RESULT_STORE_PATH,
+    DEFAULT_SNAPSHOT_FOLDER,
+    GEO_COLUMN,
+    MODEL,
+)
+from mortality_monitor.export import parse_week
+from mortality_monitor.leaderboard import get_leaderboard_payload
+from mortality_monitor.models import ExpectedDeathsModel, get_model_names
+from mortality_monitor.payloads import (
+    YEAR,
+    get_available_geos,
+    get_available_years,
+    get_excess_deaths_payload,
+    get_requested_model,
+    get_yearly_deaths_payload,
+)
+from mortality_monitor.result_store import ResultStore
+from mortality_monitor.snapshot import (
+    Snapshot,
+    load_latest_snapshot,
+    load_snapshot,
+)
+from mortality_monitor.startup import FAILED, READY, LoadStatus
+from mortality_monitor.util import QUERY_AGE_TO_DATA_AGE
+from mortality_monitor.worker_pool import BoundedProcessPool, PoolSaturatedError
+
+app = Flask(__name__)
+app.config["JSON_SORT_KEYS"] = False
+CORS(app)
+
+SNAPSHOT_FOLDER = DEFAULT_SNAPSHOT_FOLDER
+RESULT_STORE_PATH = DEFAULT_RESULT_STORE_PATH
+
+_DEFAULT_WORKERS = 2
+_DEFAULT_QUEUED = 4
+_DEFAULT_TIMEOUT_SECONDS = 30.0
+_RETRY_AFTER_SECONDS = "1"
+
+_pool: Optional[BoundedProcessPool] = None
+_version: Optional[str] = None
+_available_geos: list[str] = []
+_available_years: list[int] = []
+_start_lock = threading.Lock()
+
+# Set once per worker process by _initialize_worker.
+_worker_snapshot: Optional[Snapshot] = None
+_worker_result_store: Optional[ResultStore] = None
+
+
+def start(
+    max_workers: int = _DEFAULT_WORKERS,
+    max_queued: int = _DEFAULT_QUEUED,
+    timeout_seconds: float = _DEFAULT_TIMEOUT_SECONDS,
+) -> None:
+    """Loads the latest snapshot and starts the worker pool unless already done.
+
+    Workers memory-map the same snapshot version as the serving process.
+    """
+    global _pool, _version, _available_geos, _available_years
+    with _start_lock:
+        if _pool is not None:
+            return
+        snapshot = load_latest_snapshot(folder=SNAPSHOT_FOLDER)
+        _version = snapshot.version
+        _available_geos = get_available_geos(snapshot=snapshot)
+        _available_years = get_available_years(snapshot=snapshot)
+        _pool = BoundedProcessPool(
+            max_workers=max_workers,
+            max_queued=max_queued,
+            timeout_seconds=timeout_seconds,
+            initializer=_initialize_worker,
+            initargs=(SNAPSHOT_FOLDER, snapshot.version, RESULT_STORE_PATH),
+        )
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    if request.method == "GET":
+        return jsonify({"status": "ok"})
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    if request.method == "GET":
+        try:
+            start()
+        except OSError as error:
+            status = LoadStatus(
+                state=FAILED,
+                stage=None,
+                elapsed_seconds=0.0,
+                error=f"{type(error).__name__}: {error}",
+            )
+            return jsonify(asdict(status)), 503
+        return jsonify(
+            asdict(LoadStatus(state=READY, stage=None, elapsed_seconds=0.0, error=None))
+        )
+
+
+@app.route("/available_geos", methods=["GET"])
+def available_geos():
+    if request.method == "GET":
+        start()
+        return jsonify(_available_geos)
+
+
+@app.route("/available_ages", methods=["GET"])
+def available_ages():
+    if request.method == "GET":
+        return jsonify(QUERY_AGE_TO_DATA_AGE)
+
+
+@app.route("/available_years", methods=["GET"])
+def available_years():
+    if request.method == "GET":
+        start()
+        return jsonify(_available_years)
+
+
+@app.route("/available_models", methods=["GET"])
+def available_models():
+    if request.method == "GET":
+        return jsonify(get_model_names())
+
+
+@app.route("/excess_deaths", methods=["POST"])
+def excess_deaths():
+    if request.method == "POST":
+        user_input = request.json
+        return jsonify(
+            _run_in_pool(
+                _get_excess_deaths_payload,
+                user_input[GEO_COLUMN],
+                tuple(user_input[AGE_COLUMN]),
+                user_input[YEAR],
+                _get_model(user_input),
+            )
+        )
+
+
+@app.route("/yearly_deaths", methods=["POST"])
+def yearly_deaths():
+    if request.method == "POST":
+        user_input = request.json
+        return jsonify(
+            _run_in_pool(
+                _get_yearly_deaths_payload,
+                user_input[GEO_COLUMN],
+                tuple(user_input[AGE_COLUMN]),
+                user_input["max_week"],
+            )
+        )
+
+
+@app.route("/leaderboard", methods=["GET"])
+def leaderboard():
+    """Ranks all geos by their excess deaths over a range of weeks, see server.py."""
+    if request.method == "GET":
+        try:
+            start_period = _parse_optional_week(request.args.get("start"))
+            end_period = _parse_optional_week(request.args.get("end"))
+        except ValueError as error:
+            abort(400, description=str(error))
+        model = _get_model(
+            {MODEL: request.args[MODEL]} if MODEL in request.args else {}
+        )
+        try:
+            payload = _run_in_pool(
+                _get_leaderboard_payload,
+                start_period,
+                end_period,
+                request.args.get("by_age", "false").lower() == "true",
+                model,
+            )
+        except ValueError as error:
+            abort(400, description=str(error))
+        return jsonify(payload)
+
+
+@app.route("/changes", methods=["GET"])
+def changes():
+    """Lists the deaths added or revised since a snapshot version, see server.py."""
+    if request.method == "GET":
+        if "since" not in request.args:
+            abort(400, description="The query parameter 'since' is required.")
+        start()
+        assert _version is not None
+        try:
+            payload = get_changes_since(
+                folder=SNAPSHOT_FOLDER,
+                version=request.args["since"],
+                latest_version=_version,
+            )
+        except UnknownVersionError as error:
+            abort(410, description=str(error))
+        return jsonify(payload)
+
+
+@app.errorhandler(PoolSaturatedError)
+def pool_saturated(error: PoolSaturatedError):
+    return (
+        jsonify({"error": str(error)}),
+        503,
+        {"Retry-After": _RETRY_AFTER_SECONDS},
+    )
+
+
+@app.errorhandler(futures.TimeoutError)
+def computation_timed_out(error: futures.TimeoutError):
+    return jsonify({"error": "The computation did not finish in time."}), 504
+
+
+def _get_model(user_input: dict[str, Any]) -> ExpectedDeathsModel:
+    try:
+        return get_requested_model(user_input)
+    except (KeyError, TypeError, ValueError) as error:
+        abort(400, description=str(error))
+
+
+def _parse_optional_week(week: Optional[str]) -> Optional[pd.Period]:
+    return None if week is None else parse_week(week)
+
+
+def _run_in_pool(function: Any, *args: Any) -> Any:
+    start()
+    assert _pool is not None
+    return _pool.run(function, *args)
+
+
+def _initialize_worker(folder: str, version: str, result_store_path: str) -> None:
+    global _worker_snapshot, _worker_result_store
+    _worker_snapshot = load_snapshot(folder=folder, version=version)
+    _worker_result_store = ResultStore(path=result_store_path)
+
+
+def _get_excess_deaths_payload(
+    geo: str, ages: tuple[str, ...], year: int, model: ExpectedDeathsModel
+) -> dict[str, Any]:
+    assert _worker_snapshot is not None
+    return get_excess_deaths_payload(
+        snapshot=_worker_snapshot,
+        geo=geo,
+        ages=ages,
+        year=year,
+        model=model,
+        result_store=_worker_result_store,
+    )
+
+
+def _get_leaderboard_payload(
+    start: Optional[pd.Period],
+    end: Optional[pd.Period],
+    by_age: bool,
+    model: ExpectedDeathsModel,
+) -> dict[str, Any]:
+    assert _worker_snapshot is not None
+    return get_leaderboard_payload(
+        snapshot=_worker_snapshot, start=start, end=end, by_age=by_age, model=model
+    )
+
+
+def _get_yearly_deaths_payload(
+    geo: str, ages: tuple[str, ...], max_week: int
+) -> dict[str, Any]:
+    assert _worker_snapshot is not None
+    return get_yearly_deaths_payload(
+        snapshot=_worker_snapshot, geo=geo, ages=ages, max_week=max_week
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=_DEFAULT_WORKERS)
+    parser.add_argument("--queued", type=int, default=_DEFAULT_QUEUED)
+    parser.add_argument("--timeout", type=float, default=_DEFAULT_TIMEOUT_SECONDS)
+    parser.add_argument("--port", type=int, default=5000)
+    arguments = parser.parse_args()
+    start(
+        max_workers=arguments.workers,
+        max_queued=arguments.queued,
+        timeout_seconds=arguments.timeout,
+    )
+    app.run(host="0.0.0.0", port=arguments.port, threaded=True)
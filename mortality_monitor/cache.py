@@ -1,46 +1,154 @@
+from __future__ import annotations
+
+import contextlib
 import datetime
+import heapq
+import io
+import itertools
+import json
 import os
+import tempfile
 from dataclasses import dataclass
-from typing import Callable
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional
 
 import pandas as pd
 
+from mortality_monitor.archive import ArchiveStore
+
+_READ_CHUNK_BYTES = 1024 * 1024
+_MERGE_ROWS = 10000
+
 
 @dataclass(frozen=True)
 class DataFrameFileCache:
+    """Caches tables as csv files which time out.
+
+    Every version of a cached file is also kept in a compressed, deduplicated
+    archive, from which the data as of any point in time can be read again. The
+    archived rows are ordered by their first column, i.e. the period of the tables
+    cached here, so that versions which differ in a few weeks share most chunks.
+
+    Args:
+        data_folder: Folder containing the cached files.
+        file_extension: Extension of the cached files.
+        timeout_hours: Time after which a cached file times out.
+        archive_folder: Folder containing the archive.
+        archive_keep_days: Number of days for which all archived versions are kept.
+        archive_keep_months: Number of months for which the last archived version
+            of each month is kept.
+    """
+
     data_folder: str
     file_extension: str = "csv"
     timeout_hours: float = 24.0
     archive_folder: str = "archive"
+    archive_keep_days: float = 30.0
+    archive_keep_months: int = 24
 
-    def put_data(self, data: pd.DataFrame, filename: str) -> None:
-        """Caches data by saving it as a csv.
+    def put_data(
+        self, data: pd.DataFrame, filename: str, metadata: Optional[dict] = None
+    ) -> None:
+        """Caches data by saving it as a csv and archives it.
 
         Args:
             data: Data to cache as a csv.
             filename: Name of the csv file the data is saved to.
+            metadata: Metadata to save next to the file and to archive with it, see
+                put_metadata.
 
         Raises:
             If the data contains a column named 'index' a ValueError is raised.
         """
-        if ("index" in data.columns) or ("index" in data.index.names):
-            raise ValueError("No column can be named 'index'.")
+        self.put_data_chunks(chunks=[data], filename=filename, metadata=metadata)
+
+    def put_data_chunks(
+        self,
+        chunks: Iterable[pd.DataFrame],
+        filename: str,
+        metadata: Optional[dict] = None,
+    ) -> None:
+        """Caches data arriving in chunks by appending each chunk to a csv.
+
+        Only one chunk is held in memory at a time. The csv replaces the cached file
+        once all chunks have been written, so a failing chunk leaves the cache as it
+        was.
+
+        Args:
+            chunks: Tables with the same columns to cache one after another.
+            filename: Name of the csv file the data is saved to.
+            metadata: Metadata to save next to the file and to archive with it, see
+                put_metadata.
+
+        Raises:
+            If a chunk contains a column named 'index' or there are no chunks, a
+            ValueError is raised.
+        """
 
         def drop_index_column(data: pd.DataFrame) -> pd.DataFrame:
             return data.drop(columns="index") if "index" in data.columns else data
 
+        def write_csv(
+            csv_file: BinaryIO, tables: Iterable[pd.DataFrame]
+        ) -> Iterator[list[bytes]]:
+            for num_chunks, data in enumerate(tables):
+                if ("index" in data.columns) or ("index" in data.index.names):
+                    raise ValueError("No column can be named 'index'.")
+                content = (
+                    data.reset_index()
+                    .pipe(drop_index_column)
+                    .to_csv(index=False, header=num_chunks == 0)
+                    .encode()
+                )
+                csv_file.write(content)
+                yield content.splitlines(keepends=True)
+
+        remaining_chunks = iter(chunks)
+        first_chunk = next(remaining_chunks, None)
+        if first_chunk is None:
+            raise ValueError(f"No data to cache as {filename}.")
         if not os.path.isdir(self.data_folder):
             os.makedirs(self.data_folder)
-        data.reset_index().pipe(drop_index_column).to_csv(
-            f"{self.data_folder}/{filename}.{self.file_extension}", index=False
+        path = f"{self.data_folder}/{filename}.{self.file_extension}"
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temporary_path, "wb") as csv_file:
+                runs = write_csv(
+                    csv_file=csv_file,
+                    tables=itertools.chain([first_chunk], remaining_chunks),
+                )
+                header, *first_rows = next(runs)
+                # Every chunk is sorted into a run for the archive right after it
+                # is written, so the csv is never read back into memory as a whole.
+                self._put_archive(
+                    runs=itertools.chain([first_rows], runs),
+                    header=header,
+                    filename=filename,
+                    metadata=metadata,
+                )
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+        if metadata is not None:
+            self.put_metadata(metadata=metadata, filename=filename)
+        self._archive.prune(
+            keep_days=self.archive_keep_days, keep_months=self.archive_keep_months
         )
 
-    def get_data(self, filename: str, read_function: Callable) -> pd.DataFrame:
+    def get_data(
+        self,
+        filename: str,
+        read_function: Callable,
+        revalidate: Optional[Callable[[], bool]] = None,
+    ) -> pd.DataFrame:
         """Reads data from csv file if possible.
 
         Args:
             filename: Name of the csv file for which to look for.
             read_function: Callable which consumes path to csv and outputs the data.
+            revalidate: Callable which is asked whether timed out data is still up to
+                date. If it returns True, the lifetime of the file is extended instead
+                of the file being archived.
 
         Returns:
             Table containing the data in the csv.
@@ -49,6 +157,11 @@ class DataFrameFileCache:
         """
         if self._file_already_exists(filename=filename):
             if self._is_timedout(filename=filename):
+                if (revalidate is not None) and revalidate():
+                    self.extend_lifetime(filename=filename)
+                    return read_function(
+                        f"{self.data_folder}/{filename}.{self.file_extension}"
+                    )
                 self._archive_data(filename=filename)
                 raise FileNotFoundError(f"File {filename} has timed out.")
             return read_function(f"{self.data_folder}/{filename}.{self.file_extension}")
@@ -57,19 +170,119 @@ class DataFrameFileCache:
                 f"This {filename} does not exist - please cache it first"
             )
 
+    def get_data_as_of(
+        self, filename: str, as_of: datetime.datetime, read_function: Callable
+    ) -> pd.DataFrame:
+        """Reads the data which was cached at a point in time from the archive.
+
+        Args:
+            filename: Name of the csv file.
+            as_of: Point in time, e.g. before Eurostat revised the data.
+            read_function: Callable which consumes a path or buffer of a csv and
+                outputs the data.
+
+        Returns:
+            Table containing the data last cached at or before the point in time,
+            with its rows ordered by the first column.
+        Raises:
+            FileNotFoundError if no data was cached at or before the point in time,
+            or the data has been removed by the retention policy since.
+        """
+        version = self._archive.get_version_as_of(filename=filename, as_of=as_of)
+        return read_function(io.BytesIO(self._archive.get(version)))
+
+    def list_archived_versions(self, filename: str) -> tuple[datetime.datetime, ...]:
+        """Lists the times at which the archived versions of a file were cached."""
+        return self._archive.list_archive_times(filename=filename)
+
+    def extend_lifetime(self, filename: str) -> None:
+        """Restarts the timeout of a cached file."""
+        os.utime(f"{self.data_folder}/{filename}.{self.file_extension}")
+
+    def put_metadata(self, metadata: dict, filename: str) -> None:
+        """Saves metadata such as HTTP validators next to a cached file.
+
+        Args:
+            metadata: JSON serializable metadata.
+            filename: Name of the csv file the metadata belongs to.
+        """
+        if not os.path.isdir(self.data_folder):
+            os.makedirs(self.data_folder)
+        with open(self._metadata_path(filename=filename), "w") as file:
+            json.dump(metadata, file)
+
+    def get_metadata(self, filename: str) -> dict:
+        """Reads the metadata of a cached file, which is empty if there is none."""
+        try:
+            with open(self._metadata_path(filename=filename)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    @property
+    def _archive(self) -> ArchiveStore:
+        return ArchiveStore(folder=self.archive_folder)
+
     def _archive_data(self, filename: str) -> None:
-        """Moves file from data- to archive folder and adds date of archiving."""
-        if not os.path.isdir(self.archive_folder):
-            os.makedirs(self.archive_folder)
-
-        os.rename(
-            f"{self.data_folder}/{filename}.{self.file_extension}",
-            (
-                f"{self.archive_folder}/"
-                f"{datetime.datetime.now().strftime('%d_%m_%Y')}_{filename}"
-                f".{self.file_extension}"
-            ),
-        )
+        """Removes a timed out file, archiving it first unless already archived."""
+        path = f"{self.data_folder}/{filename}.{self.file_extension}"
+        if not self._archive.list_archive_times(filename=filename):
+            with open(path, "rb") as csv_file:
+                header = csv_file.readline()
+                self._put_archive(
+                    runs=iter(lambda: csv_file.readlines(_READ_CHUNK_BYTES), []),
+                    header=header,
+                    filename=filename,
+                    metadata=self.get_metadata(filename=filename),
+                )
+        os.remove(path)
+
+    def _put_archive(
+        self,
+        runs: Iterator[list[bytes]],
+        header: bytes,
+        filename: str,
+        metadata: Optional[dict],
+    ) -> None:
+        """Archives the rows of a csv ordered by their first column.
+
+        The cached tables start with their period, so a new week is appended to the
+        end of the archived file and only changes its last chunks. Each run of rows
+        is sorted and spilled to a temporary file before the runs are merged, so
+        only one run is held in memory at a time. Rows of the same period keep
+        their order.
+
+        Args:
+            runs: Rows of the csv without its header, in runs of whole lines.
+            header: Header line of the csv, read before the first run.
+            filename: Name of the archived file.
+            metadata: Metadata to archive with the file.
+        """
+        with tempfile.TemporaryDirectory(dir=self.data_folder) as folder:
+            run_paths: list[str] = []
+            for run in runs:
+                run.sort(key=_get_first_column)
+                run_paths.append(os.path.join(folder, str(len(run_paths))))
+                with open(run_paths[-1], "wb") as run_file:
+                    run_file.writelines(run)
+            with contextlib.ExitStack() as stack:
+                rows = heapq.merge(
+                    *(stack.enter_context(open(path, "rb")) for path in run_paths),
+                    key=_get_first_column,
+                )
+                self._archive.put_stream(
+                    parts=itertools.chain(
+                        [header],
+                        iter(
+                            lambda: b"".join(itertools.islice(rows, _MERGE_ROWS)), b""
+                        ),
+                    ),
+                    filename=filename,
+                    metadata=metadata,
+                )
+
+    def _metadata_path(self, filename: str) -> str:
+        return f"{self.data_folder}/{filename}.metadata.json"
 
     def _file_already_exists(self, filename: str) -> bool:
         return os.path.isfile(f"{self.data_folder}/{filename}.{self.file_extension}")
@@ -81,3 +294,7 @@ class DataFrameFileCache:
         return (datetime.datetime.now() - last_modified_date_of_file) > (
             datetime.timedelta(hours=self.timeout_hours)
         )
+
+
+def _get_first_column(line: bytes) -> bytes:
+    return line.split(b",", 1)[0]
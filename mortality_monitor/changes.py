@@ -0,0 +1,204 @@
+"""Changes of the deaths between consecutive snapshots.
+
+Every refresh records how the deaths of the new snapshot differ from those of the
+snapshot it replaces, so clients holding an older version can catch up by applying
+the changes instead of downloading all series again:
+
+    {snapshot_folder}/changes/{previous_version}.json
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from mortality_monitor.constants import (
+    AGE_COLUMN,
+    DEATHS_COLUMN,
+    GEO_COLUMN,
+    PERIOD_COLUMN,
+)
+from mortality_monitor.export import format_week
+from mortality_monitor.snapshot import Snapshot
+
+PREVIOUS_DEATHS_COLUMN = "previous_deaths"
+
+_CHANGES_FOLDER = "changes"
+_EXTENSION = ".json"
+
+
+class UnknownVersionError(LookupError):
+    """Raised when no changes are recorded from a version, e.g. once it is pruned."""
+
+
+def compute_changes(previous: Snapshot, current: Snapshot) -> dict[str, Any]:
+    """Compares the deaths of two snapshots cell by cell.
+
+    Args:
+        previous: Snapshot which is replaced.
+        current: Snapshot replacing it.
+
+    Returns:
+        Dictionary with both versions, the weeks the current snapshot adds after the
+        last week of the previous one and one change per geo, age and week whose
+        deaths were added, revised or removed. Deaths which did not exist are None.
+    """
+    geos = _union(previous.geos, current.geos)
+    ages = _union(previous.ages, current.ages)
+    periods = pd.period_range(
+        start=min(previous.periods[0], current.periods[0]),
+        end=max(previous.periods[-1], current.periods[-1]),
+        freq="W",
+    )
+    previous_deaths = _align(snapshot=previous, geos=geos, ages=ages, periods=periods)
+    deaths = _align(snapshot=current, geos=geos, ages=ages, periods=periods)
+    with np.errstate(invalid="ignore"):
+        is_changed = (np.isnan(previous_deaths) != np.isnan(deaths)) | (
+            previous_deaths != deaths
+        ) & ~np.isnan(deaths)
+    period_labels = [format_week(period) for period in periods]
+    return {
+        "from_version": previous.version,
+        "to_version": current.version,
+        "new_periods": [
+            format_week(period)
+            for period in current.periods
+            if period > previous.periods[-1]
+        ],
+        "changes": [
+            {
+                GEO_COLUMN: geos[geo_index],
+                AGE_COLUMN: ages[age_index],
+                PERIOD_COLUMN: period_labels[period_index],
+                PREVIOUS_DEATHS_COLUMN: _to_optional_float(
+                    previous_deaths[geo_index, age_index, period_index]
+                ),
+                DEATHS_COLUMN: _to_optional_float(
+                    deaths[geo_index, age_index, period_index]
+                ),
+            }
+            for geo_index, age_index, period_index in zip(*np.nonzero(is_changed))
+        ],
+    }
+
+
+def save_changes(changes: dict[str, Any], folder: str) -> None:
+    """Records changes computed by compute_changes in a snapshot folder."""
+    path = _changes_path(folder=folder, version=changes["from_version"])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as file:
+        json.dump(changes, file)
+    os.replace(temporary_path, path)
+
+
+def get_changes_since(folder: str, version: str, latest_version: str) -> dict[str, Any]:
+    """Combines the changes recorded from a version up to the latest version.
+
+    Deaths revised several times are reported once, with their deaths before the
+    first and after the last revision, and deaths revised back to their original
+    value are not reported at all.
+
+    Args:
+        folder: Folder the snapshots are published to.
+        version: Version the client holds.
+        latest_version: Version the client should catch up to.
+
+    Returns:
+        Changes from the version to the latest version, see compute_changes.
+
+    Raises:
+        UnknownVersionError if no changes are recorded from the version, or the
+        recorded changes do not lead up to the latest version.
+    """
+    new_periods: set[str] = set()
+    combined: dict[tuple[str, str, str], dict[str, Any]] = {}
+    to_version = version
+    while to_version != latest_version:
+        recorded = _read_changes(folder=folder, version=to_version)
+        if recorded is None:
+            raise UnknownVersionError(
+                f"No changes from version {version} up to {latest_version} are "
+                "recorded - please download all data again."
+            )
+        new_periods.update(recorded["new_periods"])
+        for change in recorded["changes"]:
+            key = (change[GEO_COLUMN], change[AGE_COLUMN], change[PERIOD_COLUMN])
+            if key in combined:
+                combined[key] = {**combined[key], DEATHS_COLUMN: change[DEATHS_COLUMN]}
+            else:
+                combined[key] = change
+        to_version = recorded["to_version"]
+    return {
+        "from_version": version,
+        "to_version": latest_version,
+        "new_periods": sorted(new_periods),
+        "changes": [
+            change
+            for change in combined.values()
+            if change[PREVIOUS_DEATHS_COLUMN] != change[DEATHS_COLUMN]
+        ],
+    }
+
+
+def prune_changes(folder: str, versions: Iterable[str]) -> tuple[str, ...]:
+    """Deletes the changes recorded from versions other than the given ones.
+
+    Returns:
+        Versions whose changes were deleted.
+    """
+    changes_folder = os.path.join(folder, _CHANGES_FOLDER)
+    if not os.path.isdir(changes_folder):
+        return ()
+    kept = set(versions)
+    deleted = []
+    for name in sorted(os.listdir(changes_folder)):
+        version = name[: -len(_EXTENSION)]
+        if name.endswith(_EXTENSION) and version not in kept:
+            os.remove(os.path.join(changes_folder, name))
+            deleted.append(version)
+    return tuple(deleted)
+
+
+def _read_changes(folder: str, version: str) -> Optional[dict[str, Any]]:
+    if os.path.basename(version) != version:
+        return None
+    try:
+        with open(_changes_path(folder=folder, version=version)) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def _changes_path(folder: str, version: str) -> str:
+    return os.path.join(folder, _CHANGES_FOLDER, f"{version}{_EXTENSION}")
+
+
+def _union(first: tuple[str, ...], second: tuple[str, ...]) -> tuple[str, ...]:
+    return first + tuple(label for label in second if label not in first)
+
+
+def _align(
+    snapshot: Snapshot,
+    geos: tuple[str, ...],
+    ages: tuple[str, ...],
+    periods: pd.PeriodIndex,
+) -> np.ndarray:
+    """Deaths of a snapshot of shape (geos, ages, periods), NaN where it has none."""
+    aligned = np.full((len(geos), len(ages), len(periods)), np.nan)
+    aligned[
+        np.ix_(
+            [geos.index(geo) for geo in snapshot.geos],
+            [ages.index(age) for age in snapshot.ages],
+            periods.get_indexer(snapshot.periods),
+        )
+    ] = snapshot.deaths
+    return aligned
+
+
+def _to_optional_float(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
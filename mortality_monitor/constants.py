@@ -5,6 +5,11 @@ DEATHS_COLUMN = "deaths"
 POPULATION_COLUMN = "population"
 DEATHS_PER_MILLION_COLUMN = "deaths_per_million"
 SINCE_TIME_PERIOD = "2015-W01"
+DEFAULT_SNAPSHOT_FOLDER = "snapshots"
+DEFAULT_RESULT_STORE_PATH = "results.sqlite"
+YEAR = "year"
+MODEL = "model"
+MODEL_PARAMETERS = "model_parameters"
 COUNTRIES = (
     "BE",
     "BG",
@@ -42,3 +47,33 @@ COUNTRIES = (
     "AL",
     "RS",
 )
+EU_COUNTRIES = (
+    "BE",
+    "BG",
+    "CZ",
+    "DK",
+    "DE",
+    "EE",
+    "IE",
+    "EL",
+    "ES",
+    "FR",
+    "HR",
+    "IT",
+    "CY",
+    "LV",
+    "LT",
+    "LU",
+    "HU",
+    "MT",
+    "NL",
+    "AT",
+    "PL",
+    "PT",
+    "RO",
+    "SI",
+    "SK",
+    "FI",
+    "SE",
+)
+EU_AGGREGATE = "EU27_2020"
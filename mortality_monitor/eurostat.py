@@ -1,11 +1,17 @@
 from __future__ import annotations
 
 import datetime as dt
-from typing import Iterable
+import queue
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Iterable, Iterator, Optional, TypeVar
 
+import numpy as np
 import pandas as pd
+import requests
 from pyjstat import pyjstat  # type: ignore
 
+from mortality_monitor.cache import DataFrameFileCache
 from mortality_monitor.constants import (
     AGE_COLUMN,
     COUNTRIES,
@@ -15,10 +21,22 @@ from mortality_monitor.constants import (
     POPULATION_COLUMN,
     SINCE_TIME_PERIOD,
 )
+from mortality_monitor.jsonstat import (
+    SparseDataset,
+    StreamDecoder,
+    get_category_labels,
+)
+from mortality_monitor.regions import SparseDeaths, with_parent_population_totals
+from mortality_monitor.util import (
+    get_all_age_groups_for_query,
+    read_csv_with_weekly_period,
+    read_csv_with_yearly_period,
+)
 
+GEO_LEVELS = ("country", "nuts1", "nuts2", "nuts3")
 _MORTALITY_TABLE = "demo_r_mweek3"
 _POPULATION_TABLE = "demo_r_pjangrp3"
-_BASE_URL = (
+BASE_URL = (
     "https://ec.europa.eu/eurostat/api/dissemination/statistics/1.0/data/"
     "{table}?format=JSON&lang=EN"
 )
@@ -33,11 +51,60 @@ _TIME_COLUMN = "Time"
 _VALUE_COLUMN = "value"
 
 _1_MILLION = 1000000
+_NOT_MODIFIED = 304
+_PROBE_TIMEOUT_SECONDS = 60
+_DOWNLOAD_TIMEOUT_SECONDS = 600
+_DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+_MAX_QUEUED_CHUNKS = 16
+_QUEUE_POLL_SECONDS = 0.1
+_UNKNOWN_WEEK = "99"
+_WEEK_COLUMN = "week"
+_AGE_DIMENSION = "age"
+_GEO_DIMENSION = "geo"
+_TIME_DIMENSION = "time"
+
+_T = TypeVar("_T")
+
+
+@dataclass(frozen=True)
+class TableVersion:
+    """Update metadata of a Eurostat table.
+
+    Args:
+        updated: Date of the last update as stated in the JSON-stat response.
+        etag: ETag header of the last response, if any.
+        last_modified: Last-Modified header of the last response, if any.
+    """
+
+    updated: Optional[str] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def is_same_as(self, other: TableVersion) -> bool:
+        """Whether both versions describe the same table content.
+
+        The update dates must match and, if both versions carry an ETag, so must
+        the ETags, since a table can be revised without a new update date.
+        """
+        if self.etag is not None and other.etag is not None:
+            if self.etag != other.etag:
+                return False
+        return (self.updated is not None) and (self.updated == other.updated)
+
+    def to_headers(self) -> dict[str, str]:
+        """Builds the headers of a conditional request for this version."""
+        headers = {}
+        if self.etag is not None:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified is not None:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
 
 
 def get_mortality_data(
     geos: tuple[str, ...],
     ages: Iterable[str],
+    base_url: str = BASE_URL,
 ) -> pd.DataFrame:
     """Gets weekly mortality data from EUROSTAT.
 
@@ -51,17 +118,352 @@ def get_mortality_data(
     Args:
         ages: Ages for which to get data for.
         geo: At which region granularity to get data for.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
 
     Returns:
         A table containing deaths per age group, geo and weekly period.
     """
     return (
-        pyjstat.Dataset.read(_build_query(geos=geos, ages=ages, table=_MORTALITY_TABLE))
+        pyjstat.Dataset.read(
+            _build_query(
+                geos=geos, ages=ages, table=_MORTALITY_TABLE, base_url=base_url
+            )
+        )
         .write("dataframe")
         .pipe(_preprocess_mortality_data)
     )
 
 
+def stream_mortality_data(
+    geos: tuple[str, ...],
+    ages: Iterable[str],
+    base_url: str = BASE_URL,
+) -> Iterator[pd.DataFrame]:
+    """Downloads weekly mortality data from EUROSTAT and yields it geo by geo.
+
+    Yields the same rows as get_mortality_data, but the response is decoded while
+    it is being downloaded: a background thread receives the response in chunks
+    and hands them over through a bounded queue, so decoding overlaps with the
+    transfer and at most a few chunks of the raw response are held in memory. The
+    decoded values are kept as arrays and turned into a table one geo at a time,
+    with week 99 dropped and the weeks converted to periods once per week rather
+    than once per row.
+
+    Each geo is yielded as soon as all of its values have been decoded, so that it
+    is preprocessed and e.g. appended to the cache while later geos are still being
+    downloaded, see StreamDecoder. Eurostat sends the values before the dimensions
+    and orders them by age before geo though, so the geos of its responses are only
+    complete once the dimensions arrive at the end of the response.
+
+    Args:
+        geos: At which region granularity to get data for.
+        ages: Ages for which to get data for.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+
+    Returns:
+        Tables containing deaths per age group and weekly period, one per geo.
+    """
+    decoder = StreamDecoder(block_dimension=_GEO_DIMENSION)
+    with requests.get(
+        _build_query(geos=geos, ages=ages, table=_MORTALITY_TABLE, base_url=base_url),
+        stream=True,
+        timeout=_DOWNLOAD_TIMEOUT_SECONDS,
+    ) as response:
+        response.raise_for_status()
+        for chunk in _iter_in_background(
+            items=response.iter_content(chunk_size=_DOWNLOAD_CHUNK_BYTES),
+            max_queued=_MAX_QUEUED_CHUNKS,
+        ):
+            for block in decoder.feed(chunk):
+                yield from _split_mortality_data_by_geo(dataset=block)
+    yield from _split_mortality_data_by_geo(dataset=decoder.close())
+
+
+def get_regional_mortality_data(
+    ages: Iterable[str],
+    geo_level: str = "nuts3",
+    base_url: str = BASE_URL,
+) -> SparseDeaths:
+    """Gets weekly mortality data of all regions of a NUTS level from EUROSTAT.
+
+    The response is decoded straight into sparse coordinates, keeping the NUTS
+    codes of the regions so that parent totals can be aggregated from them, see
+    SparseDeaths.with_parent_totals.
+
+    Args:
+        ages: Ages for which to get data for.
+        geo_level: One of 'country', 'nuts1', 'nuts2' or 'nuts3'.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+
+    Returns:
+        Sparse deaths per region, age group and weekly period.
+    """
+    if geo_level not in GEO_LEVELS:
+        raise ValueError(f"geo_level must be one of {GEO_LEVELS}.")
+    response = requests.get(
+        _build_query(
+            geos=(),
+            ages=ages,
+            table=_MORTALITY_TABLE,
+            base_url=base_url,
+            geo_level=geo_level,
+        ),
+        timeout=_DOWNLOAD_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+    return SparseDeaths.from_jsonstat(response.json())
+
+
+def get_cached_regional_mortality_data(
+    cache: DataFrameFileCache,
+    filename: str,
+    geo_level: str = "nuts3",
+    base_url: str = BASE_URL,
+) -> pd.DataFrame:
+    """Reads mortality data of all regions of a NUTS level from cache if possible.
+
+    Like get_cached_mortality_data, but the geos are NUTS codes and the totals of
+    every parent level up to the EU are added, see SparseDeaths.with_parent_totals.
+
+    Args:
+        cache: Cache in which the mortality data is kept.
+        filename: Name of the cached file.
+        geo_level: One of 'country', 'nuts1', 'nuts2' or 'nuts3'.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+
+    Returns:
+        A table containing deaths per age group, geo and weekly period.
+    """
+    return _get_cached_table(
+        cache=cache,
+        filename=filename,
+        read_function=read_csv_with_weekly_period,
+        table=_MORTALITY_TABLE,
+        download=lambda: [
+            get_regional_mortality_data(
+                ages=get_all_age_groups_for_query(),
+                geo_level=geo_level,
+                base_url=base_url,
+            )
+            .with_parent_totals()
+            .to_frame()
+        ],
+        base_url=base_url,
+    )
+
+
+def get_cached_mortality_data(
+    cache: DataFrameFileCache, filename: str, base_url: str = BASE_URL
+) -> pd.DataFrame:
+    """Reads mortality data for all countries and ages from cache if possible.
+
+    If the data has not been cached yet it is downloaded from Eurostat and cached.
+    Once it has timed out, Eurostat is asked whether the table has been updated
+    since; only if so the data is downloaded again, otherwise the lifetime of the
+    cached data is extended.
+
+    Args:
+        cache: Cache in which the mortality data is kept.
+        filename: Name of the cached file.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+
+    Returns:
+        A table containing deaths per age group, geo and weekly period.
+    """
+    return _get_cached_table(
+        cache=cache,
+        filename=filename,
+        read_function=read_csv_with_weekly_period,
+        table=_MORTALITY_TABLE,
+        download=lambda: stream_mortality_data(
+            geos=COUNTRIES, ages=get_all_age_groups_for_query(), base_url=base_url
+        ),
+        base_url=base_url,
+    )
+
+
+def get_table_version(
+    table: str,
+    geos: tuple[str, ...],
+    ages: Iterable[str],
+    known_version: TableVersion = TableVersion(),
+    base_url: str = BASE_URL,
+) -> TableVersion:
+    """Gets the update metadata of a Eurostat table without downloading it.
+
+    Only the last time period is requested, conditionally on the HTTP validators of
+    the known version. If the server answers with 304 Not Modified, the known
+    version is returned as is.
+
+    Args:
+        table: Name of the Eurostat table, e.g. 'demo_r_mweek3'.
+        geos: Geos of the query the version is checked for.
+        ages: Ages of the query the version is checked for.
+        known_version: Version returned by a previous check.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+
+    Returns:
+        The current version of the table.
+    """
+    response = requests.get(
+        _build_query(
+            geos=geos, ages=ages, table=table, base_url=base_url, last_time_period=1
+        ),
+        headers=known_version.to_headers(),
+        timeout=_PROBE_TIMEOUT_SECONDS,
+    )
+    if response.status_code == _NOT_MODIFIED:
+        return known_version
+    response.raise_for_status()
+    return TableVersion(
+        updated=response.json().get("updated"),
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+    )
+
+
+def _get_cached_table(
+    cache: DataFrameFileCache,
+    filename: str,
+    read_function: Callable,
+    table: str,
+    download: Callable[[], Iterable[pd.DataFrame]],
+    base_url: str,
+) -> pd.DataFrame:
+    known_version = TableVersion(**cache.get_metadata(filename=filename))
+    latest_versions: list[TableVersion] = []
+
+    def get_latest_version() -> TableVersion:
+        if not latest_versions:
+            latest_versions.append(
+                get_table_version(
+                    table=table,
+                    geos=COUNTRIES,
+                    ages=get_all_age_groups_for_query(),
+                    known_version=known_version,
+                    base_url=base_url,
+                )
+            )
+        return latest_versions[0]
+
+    try:
+        return cache.get_data(
+            filename,
+            read_function=read_function,
+            revalidate=lambda: get_latest_version().is_same_as(known_version),
+        )
+    except OSError:
+        # The version is checked before downloading so that an update published
+        # during the download is not mistaken for the downloaded data.
+        latest_version = get_latest_version()
+        downloaded: list[pd.DataFrame] = []
+
+        def keep_downloaded(chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+            for chunk in chunks:
+                downloaded.append(chunk)
+                yield chunk
+
+        cache.put_data_chunks(
+            chunks=keep_downloaded(download()),
+            filename=filename,
+            metadata=asdict(latest_version),
+        )
+        return pd.concat(downloaded)
+
+
+def _iter_in_background(items: Iterable[_T], max_queued: int) -> Iterator[_T]:
+    """Iterates over items in a background thread, which runs ahead by max_queued."""
+    handover: queue.Queue = queue.Queue(maxsize=max_queued)
+    stopped = threading.Event()
+    done = object()
+
+    def hand_over(item: Any) -> None:
+        while not stopped.is_set():
+            try:
+                handover.put(item, timeout=_QUEUE_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if stopped.is_set():
+                    return
+                hand_over((item, None))
+        except Exception as error:
+            hand_over((None, error))
+        hand_over((done, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = handover.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _split_mortality_data_by_geo(dataset: SparseDataset) -> Iterator[pd.DataFrame]:
+    """Turns decoded mortality data into one preprocessed table per geo.
+
+    Raises:
+        ValueError if a dimension other than age, geo and time has more than one
+        category, e.g. if the data was not filtered to a single sex.
+    """
+    dimension_ids, sizes = dataset.dimension_ids, dataset.sizes
+    for dimension_id, size in zip(dimension_ids, sizes):
+        if dimension_id not in (_AGE_DIMENSION, _GEO_DIMENSION, _TIME_DIMENSION):
+            if size != 1:
+                raise ValueError(
+                    f"Dimension {dimension_id} has {size} categories - please "
+                    "filter it to a single one."
+                )
+    time_labels = get_category_labels(
+        dataset=dataset.fields, dimension_id=_TIME_DIMENSION
+    )
+    weeks = pd.Series(time_labels).str.split("W", expand=True)[1].to_numpy()
+    is_known_week = weeks != _UNKNOWN_WEEK
+    known_periods = _create_weekly_period(
+        pd.DataFrame({_TIME_COLUMN: np.array(time_labels)[is_known_week]})
+    ).index
+    time_to_period = np.cumsum(is_known_week) - 1
+
+    coordinates = np.unravel_index(dataset.indices, sizes)
+    age_indices = coordinates[dimension_ids.index(_AGE_DIMENSION)]
+    geo_indices = coordinates[dimension_ids.index(_GEO_DIMENSION)]
+    time_indices = coordinates[dimension_ids.index(_TIME_DIMENSION)]
+    # Rows of a geo are ordered by age and time like the rows of pyjstat.
+    keep = is_known_week[time_indices] & ~np.isnan(dataset.values)
+    order = np.flatnonzero(keep)[
+        np.lexsort((time_indices[keep], age_indices[keep], geo_indices[keep]))
+    ]
+    boundaries = np.flatnonzero(np.diff(geo_indices[order])) + 1
+    age_labels = np.array(
+        get_category_labels(dataset=dataset.fields, dimension_id=_AGE_DIMENSION),
+        dtype=object,
+    )
+    geo_labels = get_category_labels(
+        dataset=dataset.fields, dimension_id=_GEO_DIMENSION
+    )
+    for rows in np.split(order, boundaries) if len(order) else []:
+        yield pd.DataFrame(
+            {
+                PERIOD_COLUMN: known_periods[time_to_period[time_indices[rows]]],
+                GEO_COLUMN: geo_labels[geo_indices[rows[0]]],
+                AGE_COLUMN: age_labels[age_indices[rows]],
+                DEATHS_COLUMN: dataset.values[rows],
+                _WEEK_COLUMN: weeks[time_indices[rows]],
+            }
+        ).set_index([PERIOD_COLUMN, GEO_COLUMN, AGE_COLUMN])
+
+
 def _preprocess_mortality_data(data: pd.DataFrame) -> pd.DataFrame:
     return (
         data.pipe(_drop_week_99_rows)
@@ -82,6 +484,7 @@ def _drop_week_99_rows(data: pd.DataFrame) -> pd.DataFrame:
 def get_population_data(
     geos: tuple[str, ...],
     ages: Iterable[str],
+    base_url: str = BASE_URL,
 ) -> pd.DataFrame:
     """Gets population data from EUROSTAT.
 
@@ -95,6 +498,7 @@ def get_population_data(
     Args:
         ages: Ages for which to get data for.
         geo: At which region granularity to get data for.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
 
     Returns:
         A table containing population in millions on January 1st per age group, geo
@@ -102,13 +506,120 @@ def get_population_data(
     """
     return (
         pyjstat.Dataset.read(
-            _build_query(geos=geos, ages=ages, table=_POPULATION_TABLE)
+            _build_query(
+                geos=geos, ages=ages, table=_POPULATION_TABLE, base_url=base_url
+            )
         )
         .write("dataframe")
         .pipe(_preprocess_population_data)
     )
 
 
+def get_cached_population_data(
+    cache: DataFrameFileCache, filename: str, base_url: str = BASE_URL
+) -> pd.DataFrame:
+    """Reads population data for all countries and ages from cache if possible.
+
+    Timed out data is only downloaded again if Eurostat has updated the table, see
+    get_cached_mortality_data.
+
+    Args:
+        cache: Cache in which the population data is kept.
+        filename: Name of the cached file.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+
+    Returns:
+        A table containing population in millions on January 1st per age group, geo
+        and yearly period.
+    """
+    return _get_cached_table(
+        cache=cache,
+        filename=filename,
+        read_function=read_csv_with_yearly_period,
+        table=_POPULATION_TABLE,
+        download=lambda: [
+            get_population_data(
+                geos=COUNTRIES, ages=get_all_age_groups_for_query(), base_url=base_url
+            )
+        ],
+        base_url=base_url,
+    )
+
+
+def get_regional_population_data(
+    ages: Iterable[str],
+    geo_level: str = "nuts3",
+    base_url: str = BASE_URL,
+) -> pd.DataFrame:
+    """Gets population data of all regions of a NUTS level from EUROSTAT.
+
+    Like get_population_data, but the geos are NUTS codes so that they match
+    get_regional_mortality_data.
+
+    Args:
+        ages: Ages for which to get data for.
+        geo_level: One of 'country', 'nuts1', 'nuts2' or 'nuts3'.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+
+    Returns:
+        A table containing population in millions on January 1st per age group, geo
+        and yearly period.
+    """
+    if geo_level not in GEO_LEVELS:
+        raise ValueError(f"geo_level must be one of {GEO_LEVELS}.")
+    dataset = pyjstat.Dataset.read(
+        _build_query(
+            geos=(),
+            ages=ages,
+            table=_POPULATION_TABLE,
+            base_url=base_url,
+            geo_level=geo_level,
+        )
+    )
+    data = dataset.write("dataframe")
+    data[GEO_COLUMN] = dataset.write("dataframe", naming="id")[_GEO_DIMENSION].values
+    return data.pipe(_preprocess_population_data)
+
+
+def get_cached_regional_population_data(
+    cache: DataFrameFileCache,
+    filename: str,
+    geo_level: str = "nuts3",
+    base_url: str = BASE_URL,
+) -> pd.DataFrame:
+    """Reads population data of all regions of a NUTS level from cache if possible.
+
+    The population of every parent level up to the EU is added, so that the geos
+    match get_cached_regional_mortality_data.
+
+    Args:
+        cache: Cache in which the population data is kept.
+        filename: Name of the cached file.
+        geo_level: One of 'country', 'nuts1', 'nuts2' or 'nuts3'.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+
+    Returns:
+        A table containing population in millions on January 1st per age group, geo
+        and yearly period.
+    """
+    return _get_cached_table(
+        cache=cache,
+        filename=filename,
+        read_function=read_csv_with_yearly_period,
+        table=_POPULATION_TABLE,
+        download=lambda: [
+            with_parent_population_totals(
+                get_regional_population_data(
+                    ages=get_all_age_groups_for_query(),
+                    geo_level=geo_level,
+                    base_url=base_url,
+                )
+            )
+        ],
+        base_url=base_url,
+    )
+
+
 def _preprocess_population_data(data: pd.DataFrame) -> pd.DataFrame:
     return (
         data.drop(columns=[_UNIT_COLUMN, _SEX_COLUMN])
@@ -127,11 +638,23 @@ def _build_query(
     table: str,
     sex: str = _SEX,
     since_time_period: str = SINCE_TIME_PERIOD,
+    base_url: str = BASE_URL,
+    last_time_period: Optional[int] = None,
+    geo_level: Optional[str] = None,
 ) -> str:
     age_string = "age=" + "age=".join([f"{age}&" for age in ages])
-    geo_string = "geo=" + "geo=".join([f"{geo}&" for geo in geos])
+    geo_string = (
+        f"geoLevel={geo_level}&"
+        if geo_level is not None
+        else "geo=" + "geo=".join([f"{geo}&" for geo in geos])
+    )
+    time_string = (
+        f"sinceTimePeriod={since_time_period}"
+        if last_time_period is None
+        else f"lastTimePeriod={last_time_period}"
+    )
     return (
-        f"{_BASE_URL.format(table=table)}&sinceTimePeriod={since_time_period}"
+        f"{base_url.format(table=table)}&{time_string}"
         f"&{geo_string}{age_string}sex={sex}&unit={_UNIT}"
     )
 
@@ -156,7 +679,7 @@ def _propagate_values_to_current_year(data: pd.DataFrame) -> pd.DataFrame:
         )
         .set_index([PERIOD_COLUMN, AGE_COLUMN, GEO_COLUMN])
         .join(data)
-        .groupby([AGE_COLUMN, GEO_COLUMN])
+        .groupby([AGE_COLUMN, GEO_COLUMN], group_keys=False)
         .apply(pd.DataFrame.interpolate)
     )
 
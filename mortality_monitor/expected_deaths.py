@@ -1,15 +1,10 @@
 from __future__ import annotations
 
-from statistics import mean, stdev
-from typing import Iterable
-
 import numpy as np
 import pandas as pd
 
 from mortality_monitor.constants import COUNTRIES, GEO_COLUMN
-
-_1_YEAR = 52
-_STANDARD_DEVIATION_PRECISION = 1
+from mortality_monitor.models import PastAveragePlusGrowth
 
 
 def get_expected_deaths(deaths: pd.Series, lookback_years: int = 5) -> pd.Series:
@@ -29,6 +24,9 @@ def get_expected_deaths(deaths: pd.Series, lookback_years: int = 5) -> pd.Series
             predict growth for the year of the prediction.
         - The base and the growth are combined via base x growth to predict the value.
 
+    The prediction is made by models.PastAveragePlusGrowth, the model the servers
+    use by default, for this single series.
+
     Args:
         deaths: Data containing actual deaths. Must contain enough data for the number
             of lookback years.
@@ -39,80 +37,17 @@ def get_expected_deaths(deaths: pd.Series, lookback_years: int = 5) -> pd.Series
         Data containing expected deaths for each period in original data. The data used
         to bootstrap the first observation is left as is.
     """
-
-    def _predict_datapoint(entry: pd.Series) -> float:
-        period, _ = entry
-        prior_periods = _get_lookback_periods(
-            period=period, lookback_years=lookback_years
-        )
-        yearly_values = _get_prior_yearly_values(
-            data=deaths, prior_periods=prior_periods
-        )
-        years = _get_prior_years(data=deaths, prior_periods=prior_periods)
-        polyfit = np.polyfit(
-            x=years,
-            y=yearly_values,
-            deg=1,
-        )
-        return (
-            np.mean(_get_prior_weekly_values(data=deaths, prior_periods=prior_periods))
-            * (np.polyval(p=polyfit, x=period.year))
-            / yearly_values[0]
-        )
-
-    def _predict(data: pd.Series) -> pd.Series:
-        data = data.copy()
-        data.iloc[lookback_years * _1_YEAR :] = (
-            data.iloc[lookback_years * _1_YEAR :]
-            .reset_index()
-            .apply(_predict_datapoint, axis=1)
-        )
-        return data
-
-    return deaths.pipe(_predict)
-
-
-def _get_lookback_periods(
-    period: pd.Period,
-    lookback_years: int,
-    offset: int = _1_YEAR,
-) -> tuple[pd.Period, ...]:
-    return tuple(period - offset * (i + 1) for i in range(lookback_years))
-
-
-def _get_prior_weekly_values(
-    data: pd.Series, prior_periods: tuple[pd.Periods, ...]
-) -> tuple[float, ...]:
-    return _get_rid_of_outliers(values=(data.loc[(data.index.isin(prior_periods))]))
-
-
-def _get_prior_yearly_values(
-    data: pd.Series, prior_periods: tuple[pd.Period, ...]
-) -> tuple[np.float64, ...]:
-    return tuple(
-        data.loc[(data.index >= start - _1_YEAR) & (data.index < (start))].sum()
-        for start in prior_periods
-        if ((start - _1_YEAR).year >= data.index.min().year)
+    periods = pd.period_range(
+        start=deaths.index.min(), end=deaths.index.max(), freq="W"
     )
-
-
-def _get_prior_years(
-    data: pd.Series, prior_periods: tuple[pd.Period, ...]
-) -> tuple[int, ...]:
-    return tuple(
-        (start - _1_YEAR).year
-        for start in prior_periods
-        if ((start - _1_YEAR).year >= data.index.min().year)
+    positions = periods.get_indexer(deaths.index)
+    matrix = np.full((1, len(periods)), np.nan)
+    matrix[0, positions] = deaths.values
+    prediction = PastAveragePlusGrowth(lookback_years=lookback_years).predict(
+        deaths=matrix, periods=periods
     )
-
-
-def _get_rid_of_outliers(values: Iterable[float]) -> tuple[float, ...]:
-    upper_range = mean(values) + 1.0 * stdev(values) + _STANDARD_DEVIATION_PRECISION
-    lower_range = mean(values) - 1.0 * stdev(values) - _STANDARD_DEVIATION_PRECISION
-    return tuple(
-        weekly_value
-        for weekly_value in values
-        if (weekly_value < upper_range) & (weekly_value > lower_range)
+    return pd.Series(
+        prediction.expected[0, positions], index=deaths.index, name=deaths.name
     )
 
 
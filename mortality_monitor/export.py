@@ -0,0 +1,160 @@
+"""Streams the full contents of a snapshot as CSV, one geo at a time."""
+
+from __future__ import annotations
+
+import csv
+import io
+from typing import Iterable, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from mortality_monitor.constants import (
+    AGE_COLUMN,
+    DEATHS_COLUMN,
+    DEATHS_PER_MILLION_COLUMN,
+    GEO_COLUMN,
+    PERIOD_COLUMN,
+)
+from mortality_monitor.models import ExpectedDeathsModel, get_model
+from mortality_monitor.snapshot import Snapshot
+from mortality_monitor.util import get_data_age
+
+EXPECTED_DEATHS_COLUMN = "expected_deaths"
+EXPORT_COLUMNS = (
+    GEO_COLUMN,
+    AGE_COLUMN,
+    PERIOD_COLUMN,
+    DEATHS_COLUMN,
+    EXPECTED_DEATHS_COLUMN,
+    DEATHS_PER_MILLION_COLUMN,
+)
+
+_DECIMALS = 3
+
+
+def parse_week(week: str) -> pd.Period:
+    """Converts a week as used by Eurostat into a weekly period.
+
+    E.g.: "2021-W05" -> Period('2021-02-01/2021-02-07', 'W-SUN')
+
+    Raises:
+        ValueError if the week is not of the form YYYY-Www.
+    """
+    return pd.Period(
+        pd.to_datetime(f"{week.replace('-W', '-')}-0", format="%G-%V-%w"), freq="W"
+    )
+
+
+def format_week(period: pd.Period) -> str:
+    """Converts a weekly period into a week as used by Eurostat, see parse_week."""
+    return "{}-W{:02d}".format(*period.end_time.isocalendar()[:2])
+
+
+def iter_export_csv(
+    snapshot: Snapshot,
+    geos: Optional[Iterable[str]] = None,
+    ages: Optional[Iterable[str]] = None,
+    start: Optional[pd.Period] = None,
+    end: Optional[pd.Period] = None,
+    model: Optional[ExpectedDeathsModel] = None,
+) -> Iterator[str]:
+    """Yields deaths, expected deaths and deaths per million per geo, age and week.
+
+    The header is yielded first, followed by one chunk of rows per geo, so only a
+    single geo is held in memory at a time. Expected deaths are predicted for all
+    age classes of a geo in one batch and per million values use the population of
+    the year of the period. Only periods with deaths are exported.
+
+    Args:
+        snapshot: Snapshot to export.
+        geos: Geos to export, e.g. 'Finland'. Defaults to all geos.
+        ages: Ages to export, e.g. 'Y35-39'. Defaults to all ages.
+        start: First period to export. Defaults to the first period of the snapshot.
+        end: Last period to export. Defaults to the last period of the snapshot.
+        model: Model predicting the expected deaths. Defaults to the default model.
+
+    Raises:
+        KeyError if any of the geos or ages is unknown. Raised before the first
+        chunk is yielded.
+    """
+    geos = None if geos is None else set(geos)
+    if geos is not None:
+        unknown_geos = sorted(geos - set(snapshot.geos))
+        if unknown_geos:
+            raise KeyError(f"Unknown geos {', '.join(unknown_geos)}.")
+    data_ages = None if ages is None else {get_data_age(query_age=age) for age in ages}
+    return _iter_export_csv(
+        snapshot=snapshot,
+        geo_indices=[
+            i for i, geo in enumerate(snapshot.geos) if geos is None or geo in geos
+        ],
+        age_indices=[
+            i
+            for i, age in enumerate(snapshot.ages)
+            if data_ages is None or age in data_ages
+        ],
+        period_mask=(
+            (snapshot.periods >= (start or snapshot.periods[0]))
+            & (snapshot.periods <= (end or snapshot.periods[-1]))
+        ),
+        model=model or get_model(),
+    )
+
+
+def _iter_export_csv(
+    snapshot: Snapshot,
+    geo_indices: list[int],
+    age_indices: list[int],
+    period_mask: np.ndarray,
+    model: ExpectedDeathsModel,
+) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(EXPORT_COLUMNS)
+    yield _flush(buffer)
+
+    ages = [snapshot.ages[i] for i in age_indices]
+    period_labels = np.array([format_week(period) for period in snapshot.periods])[
+        period_mask
+    ]
+    year_indices = snapshot.periods.year.values - snapshot.years[0]
+    is_known_year = (year_indices >= 0) & (year_indices < len(snapshot.years))
+    for geo_index in geo_indices:
+        deaths = np.asarray(snapshot.deaths[geo_index, age_indices], dtype=float)
+        expected_deaths = model.predict(
+            deaths=deaths, periods=snapshot.periods
+        ).expected
+        population = np.full(deaths.shape, np.nan)
+        population[:, is_known_year] = snapshot.population[geo_index, age_indices][
+            :, year_indices[is_known_year]
+        ]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            deaths_per_million = deaths / population
+        for i, age in enumerate(ages):
+            has_data = ~np.isnan(deaths[i, period_mask])
+            writer.writerows(
+                zip(
+                    (snapshot.geos[geo_index],) * int(has_data.sum()),
+                    (age,) * int(has_data.sum()),
+                    period_labels[has_data],
+                    _format(deaths[i, period_mask][has_data], decimals=0),
+                    _format(expected_deaths[i, period_mask][has_data]),
+                    _format(deaths_per_million[i, period_mask][has_data]),
+                )
+            )
+        yield _flush(buffer)
+
+
+def _format(values: np.ndarray, decimals: int = _DECIMALS) -> list[str]:
+    """Rounds values, leaving NaN values empty."""
+    return [
+        "" if np.isnan(value) else f"{value:.{decimals}f}" for value in values.tolist()
+    ]
+
+
+def _flush(buffer: io.StringIO) -> str:
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return text
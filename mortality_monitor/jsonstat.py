@@ -0,0 +1,353 @@
+"""Decoding of JSON-stat 2.0 datasets as returned by the Eurostat API.
+
+Besides helpers for decoded datasets, this module contains a decoder which is fed a
+response chunk by chunk while it is being downloaded. The values of a dataset make
+up almost all of a response, so they are collected into compact arrays as they
+arrive instead of being kept as text or as a dictionary until the response is
+complete. Fields which can be as large as the values but are not needed, such as
+the status of each value, are skipped as they arrive. The decoder can also hand out
+the values block by block, one category of a dimension at a time, as soon as all
+values of a block have arrived.
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Optional
+
+import numpy as np
+
+_VALUE_FIELD = "value"
+_KEY_PATTERN = re.compile(r'\s*,?\s*"((?:[^"\\]|\\.)*)"\s*:\s*')
+_END_PATTERN = re.compile(r"\s*,?\s*}")
+_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*(")?|[{}\[\],]')
+_NESTED_TOKEN_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*(")?|[{}\[\]]')
+_DECODER = json.JSONDecoder()
+
+_LAYOUT_FIELDS = ("id", "size", "dimension")
+_SKIPPED_FIELDS = ("status", "extension")
+
+_START, _KEY, _FIELD, _VALUES, _SKIP, _END = range(6)
+
+
+@dataclass(frozen=True)
+class SparseDataset:
+    """A JSON-stat dataset with its values as arrays.
+
+    Args:
+        fields: All fields of the dataset except for its values and the skipped
+            fields, e.g. 'id', 'size', 'dimension' and 'updated'.
+        indices: Positions of the values in the row-major layout of the dimensions.
+        values: Values of the dataset, NaN where the value is null.
+    """
+
+    fields: dict[str, Any]
+    indices: np.ndarray
+    values: np.ndarray
+
+    @property
+    def dimension_ids(self) -> list[str]:
+        return list(self.fields["id"])
+
+    @property
+    def sizes(self) -> list[int]:
+        return list(self.fields["size"])
+
+
+class StreamDecoder:
+    """Decodes a JSON-stat dataset from the chunks of its UTF-8 encoded response.
+
+    Sparse values, i.e. an object mapping positions to values, are decoded in
+    batches as soon as they arrive. Skipped fields are read past as they arrive
+    without being kept. All other fields are decoded once they are complete, so
+    memory is bounded by the largest of these fields plus the decoded values.
+
+    Given a block dimension, the values of each of its categories are handed out by
+    feed as a block once they are complete and no longer kept by the decoder. A
+    block is complete once a value at a later position has arrived, which requires
+    the fields 'id', 'size' and 'dimension' to precede the values and the values to
+    arrive in the order of their positions. Otherwise the values are handed out by
+    close.
+
+    Args:
+        block_dimension: Id of the dimension to split the values by, e.g. 'geo'.
+        skipped_fields: Fields to leave out of the dataset, by default the status
+            and the extension, which are not needed to read the values.
+    """
+
+    def __init__(
+        self,
+        block_dimension: Optional[str] = None,
+        skipped_fields: Iterable[str] = _SKIPPED_FIELDS,
+    ) -> None:
+        self._block_dimension = block_dimension
+        self._skipped_fields = frozenset(skipped_fields)
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._position = 0
+        self._state = _START
+        self._key = ""
+        self._retry_length = 0
+        self._skip_depth = 0
+        self._fields: dict[str, Any] = {}
+        self._indices: list[np.ndarray] = []
+        self._values: list[np.ndarray] = []
+        self._last_index = -1
+        self._is_in_order = True
+        self._num_complete_blocks = 0
+
+    def feed(self, chunk: bytes) -> list[SparseDataset]:
+        """Decodes as much of the dataset as the chunks received so far allow.
+
+        Returns:
+            Blocks completed by the chunk, in the order of their categories. Empty
+            if no block dimension is given.
+        """
+        self._append(self._text_decoder.decode(chunk))
+        self._decode(final=False)
+        return self._pop_complete_blocks()
+
+    def close(self) -> SparseDataset:
+        """Finishes decoding once the whole response has been fed.
+
+        Returns:
+            The dataset with all values not handed out as blocks by feed.
+
+        Raises:
+            ValueError if the response is not a complete JSON-stat dataset.
+        """
+        self._append(self._text_decoder.decode(b"", final=True))
+        self._decode(final=True)
+        if self._state != _END:
+            raise ValueError("The JSON-stat response ended prematurely.")
+        if self._buffer[self._position :].strip():
+            raise ValueError("The JSON-stat response continues after the dataset.")
+        return SparseDataset(
+            fields=self._fields,
+            indices=np.concatenate(self._indices or [np.empty(0, dtype=np.int64)]),
+            values=np.concatenate(self._values or [np.empty(0)]),
+        )
+
+    def _append(self, text: str) -> None:
+        self._buffer = self._buffer[self._position :] + text
+        self._position = 0
+
+    def _decode(self, final: bool) -> None:
+        while True:
+            if self._state == _START:
+                position = _skip_whitespace(self._buffer, self._position)
+                if position == len(self._buffer):
+                    return
+                if self._buffer[position] != "{":
+                    raise ValueError("A JSON-stat dataset must be an object.")
+                self._position = position + 1
+                self._state = _KEY
+            elif self._state == _KEY:
+                end = _END_PATTERN.match(self._buffer, self._position)
+                if end is not None:
+                    self._position = end.end()
+                    self._state = _END
+                    return
+                key = _KEY_PATTERN.match(self._buffer, self._position)
+                if key is None:
+                    return
+                self._key = json.loads(f'"{key.group(1)}"')
+                self._position = key.end()
+                self._state = _FIELD
+            elif self._state == _FIELD:
+                self._position = _skip_whitespace(self._buffer, self._position)
+                if self._position == len(self._buffer):
+                    return
+                if self._key in self._skipped_fields:
+                    self._state = _SKIP
+                elif self._key == _VALUE_FIELD and self._buffer[self._position] == "{":
+                    self._position += 1
+                    self._state = _VALUES
+                elif not self._decode_field(final=final):
+                    return
+            elif self._state == _VALUES:
+                if not self._decode_values():
+                    return
+            elif self._state == _SKIP:
+                if not self._skip_field(final=final):
+                    return
+            else:
+                return
+
+    def _decode_field(self, final: bool) -> bool:
+        # Incomplete fields are only decoded again once the buffer has doubled, so
+        # a large field arriving in many chunks is decoded a few times at most.
+        if not final and len(self._buffer) < self._retry_length:
+            return False
+        try:
+            field, end = _DECODER.raw_decode(self._buffer, self._position)
+        except json.JSONDecodeError:
+            if final:
+                raise ValueError(f"The JSON-stat field {self._key} is malformed.")
+            self._retry_length = 2 * len(self._buffer)
+            return False
+        if end == len(self._buffer) and not final:
+            # A number at the end of the buffer may continue in the next chunk.
+            return False
+        if self._key == _VALUE_FIELD:
+            self._add_values(*read_values(values=field))
+        else:
+            self._fields[self._key] = field
+        self._position = end
+        self._retry_length = 0
+        self._state = _KEY
+        return True
+
+    def _skip_field(self, final: bool) -> bool:
+        # Only strings and the nesting are read, the field ends at the first comma
+        # or closing bracket outside of them. An incomplete string is read again
+        # once the next chunk has arrived.
+        position = self._position
+        while True:
+            pattern = _NESTED_TOKEN_PATTERN if self._skip_depth else _TOKEN_PATTERN
+            match = pattern.search(self._buffer, position)
+            if match is None:
+                position = len(self._buffer)
+                break
+            token = match.group()
+            if token[0] == '"':
+                if match.group(1) is None:
+                    position = match.start()
+                    break
+                if self._skip_depth == 0:
+                    return self._end_skipped_field(end=match.end())
+            elif token in "{[":
+                self._skip_depth += 1
+            elif self._skip_depth == 0:
+                return self._end_skipped_field(end=match.start())
+            else:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    return self._end_skipped_field(end=match.end())
+            position = match.end()
+        self._position = position
+        if final:
+            raise ValueError(f"The JSON-stat field {self._key} is malformed.")
+        return False
+
+    def _end_skipped_field(self, end: int) -> bool:
+        self._position = end
+        self._state = _KEY
+        return True
+
+    def _decode_values(self) -> bool:
+        # Positions are digits and values are numbers or null, so neither commas
+        # nor braces occur within an entry.
+        end = self._buffer.find("}", self._position)
+        stop = end if end != -1 else self._buffer.rfind(",", self._position)
+        if stop == -1:
+            return False
+        entries = self._buffer[self._position : stop]
+        if entries.strip():
+            self._add_values(*read_values(values=json.loads(f"{{{entries}}}")))
+        self._position = stop + 1
+        if end != -1:
+            self._state = _KEY
+        return end != -1
+
+    def _add_values(self, indices: np.ndarray, values: np.ndarray) -> None:
+        if len(indices) == 0:
+            return
+        if indices[0] <= self._last_index or np.any(np.diff(indices) <= 0):
+            self._is_in_order = False
+        self._last_index = max(self._last_index, int(indices.max()))
+        self._indices.append(indices)
+        self._values.append(values)
+
+    def _pop_complete_blocks(self) -> list[SparseDataset]:
+        if (
+            self._block_dimension is None
+            or not self._is_in_order
+            or any(field not in self._fields for field in _LAYOUT_FIELDS)
+            or self._block_dimension not in self._fields["id"]
+        ):
+            return []
+        sizes = list(self._fields["size"])
+        axis = list(self._fields["id"]).index(self._block_dimension)
+        num_categories = sizes[axis]
+        num_outer, num_inner = int(np.prod(sizes[:axis])), int(
+            np.prod(sizes[axis + 1 :])
+        )
+        # The last position of a category is in the last block of the outer axes.
+        num_complete = self._num_complete_blocks
+        while (num_complete < num_categories) and (
+            ((num_outer - 1) * num_categories + num_complete + 1) * num_inner - 1
+            <= self._last_index
+        ):
+            num_complete += 1
+        if num_complete == self._num_complete_blocks:
+            return []
+        indices = np.concatenate(self._indices or [np.empty(0, dtype=np.int64)])
+        values = np.concatenate(self._values or [np.empty(0)])
+        categories = (indices // num_inner) % num_categories
+        blocks = [
+            SparseDataset(
+                fields=self._fields,
+                indices=indices[categories == category],
+                values=values[categories == category],
+            )
+            for category in range(self._num_complete_blocks, num_complete)
+            if np.any(categories == category)
+        ]
+        is_pending = categories >= num_complete
+        self._indices, self._values = [indices[is_pending]], [values[is_pending]]
+        self._num_complete_blocks = num_complete
+        return blocks
+
+
+def decode_stream(chunks: Iterable[bytes]) -> SparseDataset:
+    """Decodes a JSON-stat dataset from the chunks of its response.
+
+    The status and the extension of the dataset are left out of its fields.
+    """
+    decoder = StreamDecoder()
+    for chunk in chunks:
+        decoder.feed(chunk)
+    return decoder.close()
+
+
+def get_category_codes(dataset: Mapping[str, Any], dimension_id: str) -> list[str]:
+    """Gets the category codes of a dimension in the order of its index."""
+    index = dataset["dimension"][dimension_id]["category"]["index"]
+    if isinstance(index, Mapping):
+        return [code for code, _ in sorted(index.items(), key=lambda item: item[1])]
+    return list(index)
+
+
+def get_category_labels(dataset: Mapping[str, Any], dimension_id: str) -> list[str]:
+    """Gets the category labels of a dimension, falling back to the codes."""
+    labels = dataset["dimension"][dimension_id]["category"].get("label", {})
+    return [
+        labels.get(code, code)
+        for code in get_category_codes(dataset=dataset, dimension_id=dimension_id)
+    ]
+
+
+def read_values(values: Any) -> tuple[np.ndarray, np.ndarray]:
+    """Reads JSON-stat values, which are either a sparse mapping or a dense list."""
+    if isinstance(values, Mapping):
+        return (
+            np.fromiter(
+                (int(key) for key in values.keys()), dtype=np.int64, count=len(values)
+            ),
+            np.array(
+                [np.nan if value is None else value for value in values.values()],
+                dtype=float,
+            ),
+        )
+    dense = np.array([np.nan if value is None else value for value in values])
+    return np.arange(len(dense)), dense.astype(float)
+
+
+def _skip_whitespace(text: str, position: int) -> int:
+    while position < len(text) and text[position].isspace():
+        position += 1
+    return position
@@ -0,0 +1,173 @@
+"""Ranks geos, or geos and age classes, by their excess deaths over a period range.
+
+The expected deaths of all series are predicted in one batch. Their running totals
+are cached per snapshot version and model, so any period range is answered by
+subtracting two columns of the running totals. Once a newer version is seen, the
+running totals of older versions are dropped along with the snapshots they keep
+alive.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from mortality_monitor.constants import AGE_COLUMN, DEATHS_COLUMN, GEO_COLUMN
+from mortality_monitor.export import EXPECTED_DEATHS_COLUMN, format_week
+from mortality_monitor.models import ExpectedDeathsModel, get_model
+from mortality_monitor.snapshot import Snapshot
+
+EXCESS_DEATHS_COLUMN = "excess_deaths"
+RELATIVE_EXCESS_DEATHS_COLUMN = "relative_excess_deaths"
+WEEKS_COLUMN = "weeks"
+
+_CACHED_TOTALS = 16
+_RELATIVE_DECIMALS = 4
+
+# Newest snapshot version running totals were requested for.
+_newest_version: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class _VersionedSnapshot:
+    """Snapshot which is hashed and compared by its version only."""
+
+    version: str
+    snapshot: Snapshot = field(compare=False)
+
+
+@dataclass(frozen=True)
+class _RunningTotals:
+    """Running totals over periods of shape (series, periods + 1), starting at 0.
+
+    Only periods with deaths which the model predicted are counted, so the periods
+    the model bootstraps from, whose expected deaths are the actual deaths, do not
+    dilute the excess deaths.
+    """
+
+    deaths: np.ndarray
+    expected_deaths: np.ndarray
+    weeks: np.ndarray
+
+
+def get_leaderboard_payload(
+    snapshot: Snapshot,
+    start: Optional[pd.Period] = None,
+    end: Optional[pd.Period] = None,
+    by_age: bool = False,
+    model: Optional[ExpectedDeathsModel] = None,
+) -> dict[str, Any]:
+    """Computes cumulative and relative excess deaths of every geo over a range.
+
+    Args:
+        snapshot: Snapshot containing deaths per geo, age and weekly period.
+        start: First period to include. Defaults to the first period of the snapshot.
+            Periods the model bootstraps from are never included.
+        end: Last period to include. Defaults to the last period of the snapshot.
+        by_age: Whether to rank every age class of every geo instead of every geo.
+        model: Model predicting the expected deaths. Defaults to the default model.
+
+    Returns:
+        Dictionary with the snapshot version, the period range and one row per geo
+        (and age class), sorted by relative excess deaths in descending order.
+        Relative excess deaths are None if no deaths were expected. The weeks of
+        every row are the periods counted, i.e. with deaths and a prediction.
+
+    Raises:
+        ValueError if the range starts after it ends.
+    """
+    start = snapshot.periods[0] if start is None else start
+    end = snapshot.periods[-1] if end is None else end
+    if start > end:
+        raise ValueError(f"Start {start} is after end {end}.")
+    _forget_older_versions(version=snapshot.version)
+    totals = _get_running_totals(
+        versioned_snapshot=_VersionedSnapshot(
+            version=snapshot.version, snapshot=snapshot
+        ),
+        by_age=by_age,
+        model=model or get_model(),
+    )
+    first = int(snapshot.periods.searchsorted(start, side="left"))
+    last = int(snapshot.periods.searchsorted(end, side="right"))
+    deaths = totals.deaths[:, last] - totals.deaths[:, first]
+    expected_deaths = totals.expected_deaths[:, last] - totals.expected_deaths[:, first]
+    weeks = totals.weeks[:, last] - totals.weeks[:, first]
+    excess_deaths = deaths - expected_deaths
+    with np.errstate(invalid="ignore", divide="ignore"):
+        relative_excess_deaths = np.where(
+            expected_deaths > 0, excess_deaths / expected_deaths, np.nan
+        )
+
+    if by_age:
+        labels = [
+            {GEO_COLUMN: geo, AGE_COLUMN: age}
+            for geo in snapshot.geos
+            for age in snapshot.ages
+        ]
+    else:
+        labels = [{GEO_COLUMN: geo} for geo in snapshot.geos]
+    order = np.argsort(
+        -np.nan_to_num(relative_excess_deaths, nan=-np.inf), kind="stable"
+    )
+    return {
+        "version": snapshot.version,
+        "start": format_week(start),
+        "end": format_week(end),
+        "rows": [
+            {
+                **labels[i],
+                DEATHS_COLUMN: round(float(deaths[i])),
+                EXPECTED_DEATHS_COLUMN: round(float(expected_deaths[i])),
+                EXCESS_DEATHS_COLUMN: round(float(excess_deaths[i])),
+                RELATIVE_EXCESS_DEATHS_COLUMN: (
+                    None
+                    if np.isnan(relative_excess_deaths[i])
+                    else round(float(relative_excess_deaths[i]), _RELATIVE_DECIMALS)
+                ),
+                WEEKS_COLUMN: int(weeks[i]),
+            }
+            for i in order
+        ],
+    }
+
+
+def _forget_older_versions(version: str) -> None:
+    global _newest_version
+    if _newest_version is None or version > _newest_version:
+        _get_running_totals.cache_clear()
+        _newest_version = version
+
+
+@lru_cache(maxsize=_CACHED_TOTALS)
+def _get_running_totals(
+    versioned_snapshot: _VersionedSnapshot, by_age: bool, model: ExpectedDeathsModel
+) -> _RunningTotals:
+    snapshot = versioned_snapshot.snapshot
+    if by_age:
+        deaths = np.asarray(snapshot.deaths, dtype=float).reshape(
+            -1, len(snapshot.periods)
+        )
+    else:
+        deaths = snapshot.get_summed_deaths()
+    prediction = model.predict(deaths=deaths, periods=snapshot.periods)
+    is_counted = (
+        prediction.is_predicted & ~np.isnan(deaths) & ~np.isnan(prediction.expected)
+    )
+    return _RunningTotals(
+        deaths=_get_running_total(np.where(is_counted, deaths, 0.0)),
+        expected_deaths=_get_running_total(
+            np.where(is_counted, prediction.expected, 0.0)
+        ),
+        weeks=_get_running_total(is_counted.astype(int)),
+    )
+
+
+def _get_running_total(values: np.ndarray) -> np.ndarray:
+    running_total = np.zeros((values.shape[0], values.shape[1] + 1), values.dtype)
+    np.cumsum(values, axis=1, out=running_total[:, 1:])
+    return running_total
@@ -0,0 +1,278 @@
+"""Expected deaths models evaluating many series at once.
+
+Every model takes a matrix of weekly deaths of shape (series, periods), e.g. one row
+per geo or age group, and returns the expected deaths together with a prediction
+band in a single call. Models are looked up by name in a registry so callers such as
+the server can choose one per request.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Callable, Protocol
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MODEL = "past_average_plus_growth"
+
+_1_YEAR = 52
+# Memory and time of a prediction grow linearly with the lookback years, which can
+# be chosen per request.
+_MAX_LOOKBACK_YEARS = 20
+_STANDARD_DEVIATION_PRECISION = 1
+_BAND_WIDTH = 1.96
+
+
+@dataclass(frozen=True)
+class Prediction:
+    """Expected deaths and their 95% prediction band, each of shape (series, periods).
+
+    Periods without deaths are NaN. Periods used to bootstrap the model are left as
+    the actual deaths with a band of zero width, is_predicted is False for them.
+    """
+
+    expected: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    is_predicted: np.ndarray
+
+
+class ExpectedDeathsModel(Protocol):
+    def __hash__(self) -> int:
+        """Models are hashable, e.g. frozen dataclasses, so results can be cached."""
+        ...
+
+    def predict(self, deaths: np.ndarray, periods: pd.PeriodIndex) -> Prediction:
+        """Predicts expected deaths for every series.
+
+        Args:
+            deaths: Deaths of shape (series, periods). Missing values are NaN.
+            periods: Consecutive weekly periods the columns of deaths belong to.
+        """
+        ...
+
+
+@dataclass(frozen=True)
+class PastAveragePlusGrowth:
+    """Batched version of expected_deaths.get_expected_deaths.
+
+    The mean of the same week in prior years, without outliers, is scaled by the
+    growth a linear regression predicts from the prior yearly totals. The band is
+    derived from the spread of the weekly values the mean is based on.
+
+    Args:
+        lookback_years: Number of years prior to each datapoint to consider for its
+            prediction, at most 20.
+    """
+
+    lookback_years: int = 5
+
+    def __post_init__(self):
+        _check_lookback_years(lookback_years=self.lookback_years)
+
+    def predict(self, deaths: np.ndarray, periods: pd.PeriodIndex) -> Prediction:
+        deaths = np.asarray(deaths, dtype=float)
+        observed = ~np.isnan(deaths)
+        prior_weeks = _get_prior_weeks(
+            deaths=deaths, lookback_years=self.lookback_years
+        )
+        mean, std, count = _get_masked_statistics(
+            values=prior_weeks, mask=~np.isnan(prior_weeks)
+        )
+        with np.errstate(invalid="ignore"):
+            is_inlier = (prior_weeks < mean + std + _STANDARD_DEVIATION_PRECISION) & (
+                prior_weeks > mean - std - _STANDARD_DEVIATION_PRECISION
+            )
+        base, spread, _ = _get_masked_statistics(
+            values=prior_weeks, mask=is_inlier & (count >= 2)
+        )
+        growth = _get_growth(
+            deaths=deaths,
+            observed=observed,
+            periods=periods,
+            lookback_years=self.lookback_years,
+        )
+        return _to_prediction(
+            deaths=deaths,
+            observed=observed,
+            expected=base * growth,
+            spread=spread * growth,
+            lookback_years=self.lookback_years,
+        )
+
+
+@dataclass(frozen=True)
+class SeasonalMean:
+    """Mean of the same week in prior years without any trend.
+
+    Args:
+        lookback_years: Number of years prior to each datapoint to average over, at
+            most 20.
+    """
+
+    lookback_years: int = 5
+
+    def __post_init__(self):
+        _check_lookback_years(lookback_years=self.lookback_years)
+
+    def predict(self, deaths: np.ndarray, periods: pd.PeriodIndex) -> Prediction:
+        deaths = np.asarray(deaths, dtype=float)
+        prior_weeks = _get_prior_weeks(
+            deaths=deaths, lookback_years=self.lookback_years
+        )
+        mean, std, _ = _get_masked_statistics(
+            values=prior_weeks, mask=~np.isnan(prior_weeks)
+        )
+        return _to_prediction(
+            deaths=deaths,
+            observed=~np.isnan(deaths),
+            expected=mean,
+            spread=std,
+            lookback_years=self.lookback_years,
+        )
+
+
+_MODELS: dict[str, Callable[..., ExpectedDeathsModel]] = {
+    DEFAULT_MODEL: PastAveragePlusGrowth,
+    "seasonal_mean": SeasonalMean,
+}
+
+
+def register_model(name: str, factory: Callable[..., ExpectedDeathsModel]) -> None:
+    """Makes a model available under a name, replacing any model of that name."""
+    _MODELS[name] = factory
+
+
+def get_model_names() -> list[str]:
+    return sorted(_MODELS)
+
+
+def get_model(name: str = DEFAULT_MODEL, **parameters: Any) -> ExpectedDeathsModel:
+    """Creates a registered model.
+
+    Args:
+        name: Name the model was registered under.
+        parameters: Passed on to the model, e.g. lookback_years.
+
+    Raises:
+        KeyError if no model is registered under the name.
+        TypeError if the model does not accept the parameters.
+        ValueError if the parameters are invalid.
+    """
+    try:
+        factory = _MODELS[name]
+    except KeyError:
+        raise KeyError(
+            f"Unknown model {name}, available models are "
+            f"{', '.join(get_model_names())}."
+        )
+    return factory(**parameters)
+
+
+def _check_lookback_years(lookback_years: int) -> None:
+    if (
+        isinstance(lookback_years, bool)
+        or not isinstance(lookback_years, int)
+        or not 1 <= lookback_years <= _MAX_LOOKBACK_YEARS
+    ):
+        raise ValueError(
+            f"Lookback years must be an integer from 1 to {_MAX_LOOKBACK_YEARS}, "
+            f"got {lookback_years}."
+        )
+
+
+def _get_prior_weeks(deaths: np.ndarray, lookback_years: int) -> np.ndarray:
+    """Deaths 1, 2, ... lookback_years years prior of shape (years, series, periods)."""
+    prior_weeks = np.full((lookback_years,) + deaths.shape, np.nan)
+    for i in range(lookback_years):
+        offset = (i + 1) * _1_YEAR
+        prior_weeks[i, :, offset:] = deaths[:, : max(deaths.shape[1] - offset, 0)]
+    return prior_weeks
+
+
+def _get_masked_statistics(
+    values: np.ndarray, mask: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Mean, sample standard deviation and count of the masked values along axis 0.
+
+    Statistics of fewer than one (mean) or two (standard deviation) values are NaN.
+    """
+    count = mask.sum(axis=0)
+    masked_values = np.where(mask, values, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, masked_values.sum(axis=0) / count, np.nan)
+        squared_deviations = np.where(mask, (values - mean) ** 2, 0.0).sum(axis=0)
+        std = np.where(
+            count > 1, np.sqrt(squared_deviations / np.maximum(count - 1, 1)), np.nan
+        )
+    return mean, std, count
+
+
+def _get_growth(
+    deaths: np.ndarray,
+    observed: np.ndarray,
+    periods: pd.PeriodIndex,
+    lookback_years: int,
+) -> np.ndarray:
+    """Growth of the yearly totals prior to each period, relative to the last one.
+
+    Yearly totals are only used if they do not start before the year of the first
+    observation of a series. A linear regression on them is evaluated at the year of
+    the period and divided by the total of the year right before it.
+    """
+    num_series, num_periods = deaths.shape
+    cumulative_deaths = np.zeros((num_series, num_periods + 1))
+    cumulative_deaths[:, 1:] = np.cumsum(np.where(observed, deaths, 0.0), axis=1)
+    padding = (lookback_years + 1) * _1_YEAR
+    years = pd.period_range(
+        start=periods[0] - padding, periods=num_periods + padding, freq="W"
+    ).year.values
+    first_year = years[padding + np.argmax(observed, axis=1)][:, np.newaxis]
+    period_indices = np.arange(num_periods)
+
+    weights = np.zeros((lookback_years,) + deaths.shape)
+    relative_years = np.zeros((lookback_years,) + deaths.shape)
+    totals = np.zeros((lookback_years,) + deaths.shape)
+    for i in range(lookback_years):
+        end = period_indices - (i + 1) * _1_YEAR
+        start = end - _1_YEAR
+        weights[i] = years[padding + start] >= first_year
+        relative_years[i] = years[padding + start] - years[padding + period_indices]
+        totals[i] = (
+            cumulative_deaths[:, np.clip(end, 0, num_periods)]
+            - cumulative_deaths[:, np.clip(start, 0, num_periods)]
+        )
+
+    # Closed form least squares fit, evaluated at the year of the period itself.
+    count = weights.sum(axis=0)
+    sum_x = (weights * relative_years).sum(axis=0)
+    sum_y = (weights * totals).sum(axis=0)
+    sum_xx = (weights * relative_years**2).sum(axis=0)
+    sum_xy = (weights * relative_years * totals).sum(axis=0)
+    denominator = count * sum_xx - sum_x**2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = np.where(
+            denominator != 0, (count * sum_xy - sum_x * sum_y) / denominator, 0.0
+        )
+        trend = (sum_y - slope * sum_x) / count
+        return np.where(weights[0] > 0, trend / totals[0], np.nan)
+
+
+def _to_prediction(
+    deaths: np.ndarray,
+    observed: np.ndarray,
+    expected: np.ndarray,
+    spread: np.ndarray,
+    lookback_years: int,
+) -> Prediction:
+    """Keeps the first lookback_years x 52 observations of every series as is."""
+    is_predicted = observed & (np.cumsum(observed, axis=1) > lookback_years * _1_YEAR)
+    expected = np.where(is_predicted, expected, deaths)
+    spread = np.where(is_predicted, _BAND_WIDTH * spread, 0.0)
+    return Prediction(
+        expected=expected,
+        lower=np.where(observed, np.maximum(expected - spread, 0.0), np.nan),
+        upper=np.where(observed, expected + spread, np.nan),
+        is_predicted=is_predicted,
+    )
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+from typing import Any, Optional, TypeVar
+
+import numpy as np
+import pandas as pd
+
+from mortality_monitor.constants import (
+    DEATHS_COLUMN,
+    MODEL,
+    MODEL_PARAMETERS,
+    PERIOD_COLUMN,
+    YEAR,
+)
+from mortality_monitor.models import DEFAULT_MODEL, ExpectedDeathsModel, get_model
+from mortality_monitor.result_store import ResultStore
+from mortality_monitor.snapshot import Snapshot
+
+_Data = TypeVar("_Data", pd.Series, pd.DataFrame)
+
+
+def get_available_geos(snapshot: Snapshot) -> list[str]:
+    return list(snapshot.geos)
+
+
+def get_available_years(snapshot: Snapshot) -> list[int]:
+    return sorted(set(snapshot.periods.year.tolist()), reverse=True)
+
+
+def get_requested_model(user_input: dict[str, Any]) -> ExpectedDeathsModel:
+    """Creates the model a request asks for, defaulting to the default model.
+
+    Raises:
+        KeyError, TypeError or ValueError if the model or its parameters are unknown
+        or invalid.
+    """
+    return get_model(
+        user_input.get(MODEL, DEFAULT_MODEL), **user_input.get(MODEL_PARAMETERS, {})
+    )
+
+
+def get_excess_deaths_payload(
+    snapshot: Snapshot,
+    geo: str,
+    ages: tuple[str, ...],
+    year: int,
+    model: Optional[ExpectedDeathsModel] = None,
+    result_store: Optional[ResultStore] = None,
+) -> dict[str, Any]:
+    """Computes actual, expected, above- and below expectation deaths since a year.
+
+    Args:
+        snapshot: Snapshot containing deaths per geo, age and weekly period.
+        geo: Region for which to compute excess deaths.
+        ages: Ages for which to compute excess deaths.
+        year: First year to include in the response.
+        model: Model predicting the expected deaths. Defaults to the default model.
+        result_store: Store to read the prediction from or to add it to, unless
+            the prediction has been precomputed in the snapshot.
+
+    Returns:
+        Dictionary with one list per series, the period labels and the prediction
+        band of the expected deaths.
+    """
+    deaths = snapshot.get_deaths(geo=geo, ages=ages)
+    if result_store is None or snapshot.is_precomputed(ages=ages, model=model):
+        prediction = snapshot.get_prediction(geo=geo, ages=ages, model=model)
+    else:
+        prediction = result_store.get_prediction(
+            snapshot=snapshot, geo=geo, ages=ages, model=model
+        )
+    prediction = prediction.rolling(window=4).mean().pipe(_filter_on_year, year=year)
+    expected_deaths = prediction["expected"].rename(DEATHS_COLUMN)
+    deaths = deaths.pipe(_filter_on_year, year=year)
+    periods = deaths.index
+
+    above_expectation_deaths = np.where(
+        deaths > expected_deaths, deaths - expected_deaths, 0
+    )
+    below_expectation_deaths = np.where(
+        deaths <= expected_deaths, expected_deaths - deaths, 0
+    )
+    deaths = np.where(deaths < expected_deaths, deaths, expected_deaths)
+
+    return {
+        "deaths": deaths.round().tolist(),
+        "label": [_get_period_representation(period) for period in periods],
+        "expected_deaths": expected_deaths.round().tolist(),
+        "above_expectation_deaths": above_expectation_deaths.round().tolist(),
+        "below_expectation_deaths": below_expectation_deaths.round().tolist(),
+        "expected_deaths_lower": prediction["lower"].round().tolist(),
+        "expected_deaths_upper": prediction["upper"].round().tolist(),
+    }
+
+
+def get_yearly_deaths_payload(
+    snapshot: Snapshot, geo: str, ages: tuple[str, ...], max_week: int
+) -> dict[str, Any]:
+    """Computes deaths per year up until and including a week of the year.
+
+    Args:
+        snapshot: Snapshot containing deaths per geo, age and weekly period.
+        geo: Region for which to compute yearly deaths.
+        ages: Ages for which to compute yearly deaths.
+        max_week: Last week of each year to include in the sums.
+
+    Returns:
+        Dictionary with the years and their summed deaths.
+    """
+    deaths_per_year = (
+        snapshot.get_deaths(geo=geo, ages=ages)
+        .reset_index()
+        .assign(
+            year=lambda df: df[PERIOD_COLUMN].map(lambda period: period.year),
+            week=lambda df: df[PERIOD_COLUMN].map(lambda period: period.week),
+        )
+        .query("week <= @max_week")
+        .groupby(by=[YEAR], as_index=False)[DEATHS_COLUMN]
+        .sum()
+    )
+    return {
+        "yearly_deaths": {
+            "years": deaths_per_year[YEAR].values.tolist(),
+            "actual_deaths": deaths_per_year[DEATHS_COLUMN].values.tolist(),
+            "max_week": max_week,
+        }
+    }
+
+
+def _filter_on_year(data: _Data, year: int) -> _Data:
+    return data.loc[data.index.year >= year]
+
+
+def _get_period_representation(p: pd.Period) -> str:
+    if p.start_time.year == p.end_time.year:
+        return f"{p.start_time.year}/{p.week}"
+    elif p.week == 1:
+        return f"{p.end_time.year}/{p.week}"
+    elif p.week >= 52:
+        return f"{p.start_time.year}/{p.week}"
+    raise ValueError(
+        f"Period {p} has unequal start/end time years and is not in week 1, 52 or 53."
+    )
@@ -0,0 +1,141 @@
+"""Downloads the Eurostat data and publishes a new snapshot for the servers.
+
+Usage:
+    python -m mortality_monitor.refresh --snapshot-folder snapshots --keep 7
+    python -m mortality_monitor.refresh --snapshot-folder snapshots_nuts3 \
+        --geo-level nuts3
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+from mortality_monitor.cache import DataFrameFileCache
+from mortality_monitor.changes import compute_changes, prune_changes, save_changes
+from mortality_monitor.constants import DEFAULT_SNAPSHOT_FOLDER
+from mortality_monitor.eurostat import (
+    BASE_URL,
+    GEO_LEVELS,
+    get_cached_mortality_data,
+    get_cached_population_data,
+    get_cached_regional_mortality_data,
+    get_cached_regional_population_data,
+)
+from mortality_monitor.snapshot import (
+    Snapshot,
+    build_snapshot,
+    list_versions,
+    load_latest_snapshot,
+    prune_snapshots,
+    publish_snapshot,
+    validate_snapshot,
+)
+
+DATA_FOLDER = "data"
+ARCHIVE_FOLDER = "archive"
+MORTALITY_DATA_FILENAME = "mortality_data"
+POPULATION_DATA_FILENAME = "population_data"
+CACHE = DataFrameFileCache(data_folder=DATA_FOLDER, archive_folder=ARCHIVE_FOLDER)
+
+_DEFAULT_SNAPSHOTS_TO_KEEP = 7
+_COUNTRY_LEVEL = "country"
+
+
+def refresh(
+    cache: DataFrameFileCache = CACHE,
+    snapshot_folder: str = DEFAULT_SNAPSHOT_FOLDER,
+    keep: int = _DEFAULT_SNAPSHOTS_TO_KEEP,
+    base_url: str = BASE_URL,
+    geo_level: str = _COUNTRY_LEVEL,
+) -> Snapshot:
+    """Builds, validates and publishes a snapshot from the latest Eurostat data.
+
+    Mortality and population data are read from the cache and only downloaded if
+    they have timed out and Eurostat has updated them since. The changes of the
+    deaths since the previous snapshot are recorded for the /changes endpoint.
+    Older snapshots beyond the number to keep are deleted along with the changes
+    recorded from them.
+
+    By default the snapshot contains the countries labelled by name. For a NUTS
+    level it contains all regions of that level and their parents up to the EU,
+    labelled by NUTS code, and should be published to a folder of its own.
+
+    Args:
+        cache: Cache holding the downloaded mortality and population data.
+        snapshot_folder: Folder the snapshot is published to.
+        keep: Number of snapshots to keep.
+        base_url: URL of the Eurostat API with a placeholder for the table name.
+        geo_level: One of 'country', 'nuts1', 'nuts2' or 'nuts3'.
+
+    Returns:
+        The published snapshot.
+    """
+    try:
+        previous = load_latest_snapshot(folder=snapshot_folder)
+    except FileNotFoundError:
+        previous = None
+    if geo_level == _COUNTRY_LEVEL:
+        mortality_data = get_cached_mortality_data(
+            cache=cache, filename=MORTALITY_DATA_FILENAME, base_url=base_url
+        )
+        population_data = get_cached_population_data(
+            cache=cache, filename=POPULATION_DATA_FILENAME, base_url=base_url
+        )
+    else:
+        mortality_data = get_cached_regional_mortality_data(
+            cache=cache,
+            filename=f"{MORTALITY_DATA_FILENAME}_{geo_level}",
+            geo_level=geo_level,
+            base_url=base_url,
+        )
+        population_data = get_cached_regional_population_data(
+            cache=cache,
+            filename=f"{POPULATION_DATA_FILENAME}_{geo_level}",
+            geo_level=geo_level,
+            base_url=base_url,
+        )
+    snapshot = build_snapshot(
+        mortality_data=mortality_data, population_data=population_data
+    )
+    validate_snapshot(snapshot)
+    if previous is not None and previous.version != snapshot.version:
+        save_changes(
+            changes=compute_changes(previous=previous, current=snapshot),
+            folder=snapshot_folder,
+        )
+    publish_snapshot(snapshot=snapshot, folder=snapshot_folder)
+    prune_snapshots(folder=snapshot_folder, keep=keep)
+    prune_changes(
+        folder=snapshot_folder, versions=list_versions(folder=snapshot_folder)
+    )
+    return snapshot
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snapshot-folder", default=DEFAULT_SNAPSHOT_FOLDER)
+    parser.add_argument("--keep", type=int, default=_DEFAULT_SNAPSHOTS_TO_KEEP)
+    parser.add_argument(
+        "--base-url",
+        default=BASE_URL,
+        help="Eurostat API URL with a '{table}' placeholder, e.g. of a local stub.",
+    )
+    parser.add_argument(
+        "--geo-level",
+        choices=GEO_LEVELS,
+        default=_COUNTRY_LEVEL,
+        help="Publish countries or the regions of a NUTS level with their parents.",
+    )
+    arguments = parser.parse_args()
+    start = time.perf_counter()
+    snapshot = refresh(
+        snapshot_folder=arguments.snapshot_folder,
+        keep=arguments.keep,
+        base_url=arguments.base_url,
+        geo_level=arguments.geo_level,
+    )
+    print(
+        f"Published snapshot {snapshot.version} with {len(snapshot.geos)} geos and "
+        f"{len(snapshot.periods)} periods in {time.perf_counter() - start:.1f}s."
+    )
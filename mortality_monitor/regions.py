@@ -0,0 +1,453 @@
+"""Sparse storage and hierarchical aggregation of deaths per NUTS region.
+
+At NUTS 3 granularity most (region, age, week) combinations Eurostat could report
+are either missing or not published yet, and there are roughly 30 times as many
+geos as countries. SparseDeaths therefore only keeps the observed values in
+coordinate format, sorted by geo, age and period, and aggregates regions to their
+parents (NUTS 3 -> NUTS 2 -> NUTS 1 -> country -> EU) with array operations instead
+of refetching the parent levels from Eurostat.
+"""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Any, Iterable, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from mortality_monitor.constants import (
+    AGE_COLUMN,
+    COUNTRIES,
+    DEATHS_COLUMN,
+    EU_AGGREGATE,
+    EU_COUNTRIES,
+    GEO_COLUMN,
+    PERIOD_COLUMN,
+    POPULATION_COLUMN,
+)
+from mortality_monitor.jsonstat import get_category_codes, read_values
+from mortality_monitor.util import get_data_age
+
+_COUNTRY_CODE_LENGTH = 2
+# A country code followed by one character per NUTS level, e.g. 'SE110'.
+_NUTS_CODE = re.compile(r"[A-Z]{2}[0-9A-Z]{0,3}")
+_UNKNOWN_WEEK = "99"
+_AGE_DIMENSION = "age"
+_GEO_DIMENSION = "geo"
+_TIME_DIMENSION = "time"
+
+
+def is_nuts_code(geo: str) -> bool:
+    """Whether a geo code is a country or region, unlike aggregates like 'EU27_2020'."""
+    return (
+        _NUTS_CODE.fullmatch(geo) is not None
+        and geo[:_COUNTRY_CODE_LENGTH] in COUNTRIES
+    )
+
+
+def get_nuts_level(geo: str) -> int:
+    """Gets the NUTS level of a geo code, e.g. 0 for 'SE' and 3 for 'SE110'.
+
+    Raises:
+        ValueError if the geo is not a NUTS code, e.g. an aggregate like 'EU27_2020'.
+    """
+    if not is_nuts_code(geo=geo):
+        raise ValueError(f"Geo {geo} is not a NUTS code.")
+    return len(geo) - _COUNTRY_CODE_LENGTH
+
+
+def get_parent_geo(geo: str) -> Optional[str]:
+    """Gets the geo one NUTS level up, the EU for member states and None otherwise."""
+    if not is_nuts_code(geo=geo):
+        return None
+    if get_nuts_level(geo=geo) > 0:
+        return geo[:-1]
+    return EU_AGGREGATE if geo in EU_COUNTRIES else None
+
+
+@dataclass(frozen=True)
+class SparseDeaths:
+    """Observed deaths in coordinate format.
+
+    Entry i states that geos[geo_indices[i]] had values[i] deaths in age class
+    ages[age_indices[i]] during periods[period_indices[i]]. Missing observations
+    have no entry. Entries are sorted by geo, age and period.
+
+    Args:
+        geos: Geo codes, e.g. 'SE110'.
+        ages: Ages as seen in the data, e.g. 'From 35 to 39 years'.
+        periods: Consecutive weekly periods.
+        geo_indices: Index into geos per entry.
+        age_indices: Index into ages per entry.
+        period_indices: Index into periods per entry.
+        values: Deaths per entry.
+    """
+
+    geos: tuple[str, ...]
+    ages: tuple[str, ...]
+    periods: pd.PeriodIndex
+    geo_indices: np.ndarray
+    age_indices: np.ndarray
+    period_indices: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def from_frame(cls, data: pd.DataFrame) -> SparseDeaths:
+        """Creates sparse deaths from a table as returned by get_mortality_data."""
+        data = data.reset_index()
+        geos = tuple(sorted(pd.unique(data[GEO_COLUMN])))
+        ages = tuple(pd.unique(data[AGE_COLUMN]))
+        periods = pd.period_range(
+            start=data[PERIOD_COLUMN].min(), end=data[PERIOD_COLUMN].max(), freq="W"
+        )
+        return cls._create(
+            geos=geos,
+            ages=ages,
+            periods=periods,
+            geo_indices=pd.Index(geos).get_indexer(data[GEO_COLUMN]),
+            age_indices=pd.Index(ages).get_indexer(data[AGE_COLUMN]),
+            period_indices=periods.get_indexer(data[PERIOD_COLUMN]),
+            values=data[DEATHS_COLUMN].to_numpy(dtype=float),
+        )
+
+    @classmethod
+    def from_jsonstat(cls, dataset: Mapping[str, Any]) -> SparseDeaths:
+        """Decodes a demo_r_mweek3 JSON-stat 2.0 response without densifying it.
+
+        Geos keep their NUTS codes, ages get their labels and the unknown week 99
+        is dropped. All dimensions other than age, geo and time must have size 1.
+
+        Raises:
+            ValueError if a further dimension has more than one category.
+        """
+        dimension_ids = list(dataset["id"])
+        sizes = list(dataset["size"])
+        for dimension_id, size in zip(dimension_ids, sizes):
+            if dimension_id not in (_AGE_DIMENSION, _GEO_DIMENSION, _TIME_DIMENSION):
+                if size != 1:
+                    raise ValueError(
+                        f"Dimension {dimension_id} has {size} categories - please "
+                        "filter it to a single one."
+                    )
+        flat_indices, values = read_values(values=dataset["value"])
+        coordinates = np.unravel_index(flat_indices, sizes)
+        age_codes = get_category_codes(dataset=dataset, dimension_id=_AGE_DIMENSION)
+        age_labels = dataset["dimension"][_AGE_DIMENSION]["category"].get("label", {})
+        geos = get_category_codes(dataset=dataset, dimension_id=_GEO_DIMENSION)
+        time_codes = get_category_codes(dataset=dataset, dimension_id=_TIME_DIMENSION)
+
+        is_known_week = np.array(
+            [code.split("W")[-1] != _UNKNOWN_WEEK for code in time_codes]
+        )
+        week_periods = pd.PeriodIndex(
+            pd.to_datetime(
+                pd.Series(np.array(time_codes)[is_known_week]).str.replace("-W", "-")
+                + "-0",
+                format="%G-%V-%w",
+            ).dt.to_period(freq="W")
+        )
+        periods = pd.period_range(
+            start=week_periods.min(), end=week_periods.max(), freq="W"
+        )
+        time_to_period = np.full(len(time_codes), -1)
+        time_to_period[is_known_week] = periods.get_indexer(week_periods)
+
+        period_indices = time_to_period[
+            coordinates[dimension_ids.index(_TIME_DIMENSION)]
+        ]
+        keep = (period_indices >= 0) & ~np.isnan(values)
+        # Sorting the geos alphabetically puts regions right behind their parents.
+        sorted_geos = tuple(sorted(geos))
+        geo_rank = pd.Index(sorted_geos).get_indexer(geos)
+        return cls._create(
+            geos=sorted_geos,
+            ages=tuple(age_labels.get(code, code) for code in age_codes),
+            periods=periods,
+            geo_indices=geo_rank[coordinates[dimension_ids.index(_GEO_DIMENSION)]][
+                keep
+            ],
+            age_indices=coordinates[dimension_ids.index(_AGE_DIMENSION)][keep],
+            period_indices=period_indices[keep],
+            values=values[keep],
+        )
+
+    @classmethod
+    def _create(
+        cls,
+        geos: tuple[str, ...],
+        ages: tuple[str, ...],
+        periods: pd.PeriodIndex,
+        geo_indices: np.ndarray,
+        age_indices: np.ndarray,
+        period_indices: np.ndarray,
+        values: np.ndarray,
+    ) -> SparseDeaths:
+        order = np.lexsort((period_indices, age_indices, geo_indices))
+        return cls(
+            geos=geos,
+            ages=ages,
+            periods=periods,
+            geo_indices=np.asarray(geo_indices, dtype=np.int32)[order],
+            age_indices=np.asarray(age_indices, dtype=np.int16)[order],
+            period_indices=np.asarray(period_indices, dtype=np.int32)[order],
+            values=np.asarray(values, dtype=float)[order],
+        )
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def density(self) -> float:
+        """Share of all (geo, age, period) combinations which have been observed."""
+        return len(self) / max(len(self.geos) * len(self.ages) * len(self.periods), 1)
+
+    def get_deaths(self, geo: str, ages: Iterable[str]) -> pd.Series:
+        """Gets weekly deaths aggregated over all ages for a specific geo.
+
+        Only periods for which at least one of the ages has been observed are kept,
+        like in deaths.get_deaths.
+
+        Args:
+            geo: NUTS code of the region.
+            ages: Ages of the form 'Y35-39', 'Y-40-44', etc.
+
+        Returns:
+            Deaths per period for the chosen geo and age groups.
+        """
+        start, end = self._get_geo_slice(geo=geo)
+        data_ages = {get_data_age(query_age=age) for age in ages}
+        age_indices = [i for i, age in enumerate(self.ages) if age in data_ages]
+        selected = np.isin(self.age_indices[start:end], age_indices)
+        period_indices = self.period_indices[start:end][selected]
+        sums = np.bincount(
+            period_indices,
+            weights=self.values[start:end][selected],
+            minlength=len(self.periods),
+        )
+        observed = np.bincount(period_indices, minlength=len(self.periods)) > 0
+        return pd.Series(
+            sums[observed],
+            index=pd.PeriodIndex(self.periods[observed], name=PERIOD_COLUMN),
+            name=DEATHS_COLUMN,
+        )
+
+    def filter_level(self, level: int) -> SparseDeaths:
+        """Keeps the geos of one NUTS level, e.g. 0 for countries."""
+        return self._filter_geos(
+            keep=np.array(
+                [
+                    is_nuts_code(geo=geo) and get_nuts_level(geo=geo) == level
+                    for geo in self.geos
+                ],
+                dtype=bool,
+            )
+        )
+
+    def aggregate_to_parents(self, require_complete: bool = True) -> SparseDeaths:
+        """Sums the deaths of all geos into their parents.
+
+        A parent is complete for an age and period if every child that appears
+        anywhere in the data reported a value for it.
+
+        Args:
+            require_complete: Whether to drop parent values for which at least one
+                child is missing, instead of reporting a partial sum.
+
+        Returns:
+            Sparse deaths of the parents. Geos without a parent are dropped.
+        """
+        parents = tuple(
+            sorted(
+                {
+                    parent
+                    for parent in (get_parent_geo(geo=geo) for geo in self.geos)
+                    if parent is not None
+                }
+            )
+        )
+        parent_of_geo = pd.Index(parents).get_indexer(
+            [get_parent_geo(geo=geo) for geo in self.geos]
+        )
+        children_per_parent = np.bincount(
+            parent_of_geo[parent_of_geo >= 0], minlength=len(parents)
+        )
+
+        entry_parents = parent_of_geo[self.geo_indices]
+        has_parent = entry_parents >= 0
+        keys = (
+            entry_parents[has_parent].astype(np.int64) * len(self.ages)
+            + self.age_indices[has_parent]
+        ) * len(self.periods) + self.period_indices[has_parent]
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=self.values[has_parent])
+        reporting_children = np.bincount(inverse)
+
+        parent_indices, rest = np.divmod(
+            unique_keys, len(self.ages) * len(self.periods)
+        )
+        age_indices, period_indices = np.divmod(rest, len(self.periods))
+        keep = (
+            reporting_children == children_per_parent[parent_indices]
+            if require_complete
+            else np.ones(len(unique_keys), dtype=bool)
+        )
+        return SparseDeaths._create(
+            geos=parents,
+            ages=self.ages,
+            periods=self.periods,
+            geo_indices=parent_indices[keep],
+            age_indices=age_indices[keep],
+            period_indices=period_indices[keep],
+            values=sums[keep],
+        )
+
+    def with_parent_totals(self, require_complete: bool = True) -> SparseDeaths:
+        """Adds the totals of every level above the finest one, up to the EU.
+
+        Each level is aggregated from the one below it, so countries are computed
+        from their regions and the EU from its member states. Only the geos of the
+        finest NUTS level are kept as they are, aggregates like 'EU27_2020' in the
+        data are replaced by the computed totals.
+        """
+        levels = [self.filter_level(level=_get_finest_level(geos=self.geos))]
+        while len(levels[-1].geos) > 0:
+            levels.append(levels[-1].aggregate_to_parents(require_complete))
+        return SparseDeaths.concat(levels)
+
+    @staticmethod
+    def concat(parts: Iterable[SparseDeaths]) -> SparseDeaths:
+        """Combines sparse deaths of disjoint geos, ages and periods must match."""
+        parts = [part for part in parts if len(part.geos) > 0]
+        geos = tuple(sorted(geo for part in parts for geo in part.geos))
+        geo_index = pd.Index(geos)
+        return SparseDeaths._create(
+            geos=geos,
+            ages=parts[0].ages,
+            periods=parts[0].periods,
+            geo_indices=np.concatenate(
+                [
+                    geo_index.get_indexer(list(part.geos))[part.geo_indices]
+                    for part in parts
+                ]
+            ),
+            age_indices=np.concatenate([part.age_indices for part in parts]),
+            period_indices=np.concatenate([part.period_indices for part in parts]),
+            values=np.concatenate([part.values for part in parts]),
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Turns the entries into a table as returned by get_mortality_data."""
+        return pd.DataFrame(
+            {
+                PERIOD_COLUMN: self.periods[self.period_indices],
+                GEO_COLUMN: np.array(self.geos, dtype=object)[self.geo_indices],
+                AGE_COLUMN: np.array(self.ages, dtype=object)[self.age_indices],
+                DEATHS_COLUMN: self.values,
+            }
+        ).set_index([PERIOD_COLUMN, GEO_COLUMN, AGE_COLUMN])
+
+    def to_dense(self) -> np.ndarray:
+        """Turns the entries into an array of shape (geos, ages, periods)."""
+        dense = np.full((len(self.geos), len(self.ages), len(self.periods)), np.nan)
+        dense[self.geo_indices, self.age_indices, self.period_indices] = self.values
+        return dense
+
+    def save(self, path: str) -> None:
+        """Saves the entries as a compressed .npz file."""
+        np.savez_compressed(
+            path,
+            geos=np.array(self.geos),
+            ages=np.array(self.ages),
+            first_period=np.array(self.periods[0].start_time.strftime("%Y-%m-%d")),
+            num_periods=np.array(len(self.periods)),
+            geo_indices=self.geo_indices,
+            age_indices=self.age_indices,
+            period_indices=self.period_indices,
+            values=self.values,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> SparseDeaths:
+        """Loads entries saved via save."""
+        with np.load(path) as data:
+            return cls(
+                geos=tuple(data["geos"].tolist()),
+                ages=tuple(data["ages"].tolist()),
+                periods=pd.period_range(
+                    start=pd.Period(str(data["first_period"]), freq="W"),
+                    periods=int(data["num_periods"]),
+                    freq="W",
+                ),
+                geo_indices=data["geo_indices"],
+                age_indices=data["age_indices"],
+                period_indices=data["period_indices"],
+                values=data["values"],
+            )
+
+    def _get_geo_slice(self, geo: str) -> tuple[int, int]:
+        try:
+            geo_index = self.geos.index(geo)
+        except ValueError:
+            raise KeyError(f"Geo {geo} is not part of the data.")
+        return (
+            int(np.searchsorted(self.geo_indices, geo_index, side="left")),
+            int(np.searchsorted(self.geo_indices, geo_index, side="right")),
+        )
+
+    def _filter_geos(self, keep: np.ndarray) -> SparseDeaths:
+        new_index = np.cumsum(keep) - 1
+        entries = keep[self.geo_indices]
+        return SparseDeaths(
+            geos=tuple(np.array(self.geos, dtype=object)[keep]),
+            ages=self.ages,
+            periods=self.periods,
+            geo_indices=new_index[self.geo_indices[entries]].astype(np.int32),
+            age_indices=self.age_indices[entries],
+            period_indices=self.period_indices[entries],
+            values=self.values[entries],
+        )
+
+
+def with_parent_population_totals(population_data: pd.DataFrame) -> pd.DataFrame:
+    """Adds the population of every level above the finest one, up to the EU.
+
+    Like SparseDeaths.with_parent_totals, but for the long-format population data
+    of a NUTS level as returned by get_population_data. A parent's population is
+    the sum over its children.
+
+    Args:
+        population_data: Population in millions per geo, age and yearly period,
+            with NUTS codes as geos.
+
+    Returns:
+        Population of the geos of the finest NUTS level and all their parents.
+    """
+    data = population_data.reset_index()
+    finest_level = _get_finest_level(geos=data[GEO_COLUMN].unique())
+    level = data.loc[
+        data[GEO_COLUMN].map(
+            lambda geo: is_nuts_code(geo=geo)
+            and get_nuts_level(geo=geo) == finest_level
+        )
+    ]
+    levels = []
+    while len(level) > 0:
+        levels.append(level)
+        level = (
+            level.assign(**{GEO_COLUMN: level[GEO_COLUMN].map(get_parent_geo)})
+            .dropna(subset=[GEO_COLUMN])
+            .groupby([PERIOD_COLUMN, GEO_COLUMN, AGE_COLUMN], as_index=False)[
+                POPULATION_COLUMN
+            ]
+            .sum()
+        )
+    return pd.concat(levels).set_index([PERIOD_COLUMN, GEO_COLUMN, AGE_COLUMN])
+
+
+def _get_finest_level(geos: Iterable[str]) -> int:
+    """Gets the finest NUTS level among the geos, skipping aggregates."""
+    return max(
+        (get_nuts_level(geo=geo) for geo in geos if is_nuts_code(geo=geo)), default=0
+    )
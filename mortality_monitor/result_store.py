@@ -0,0 +1,216 @@
+"""Predictions of expected deaths persisted in a SQLite database.
+
+Predictions are keyed by the snapshot version, the geo, the ages and the model with
+its parameters, so they stay valid until a new snapshot is published and survive
+restarts of the servers. The database runs in write-ahead logging mode, which lets
+any number of processes read while one of them writes, e.g. the worker processes
+of async_server.py.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from mortality_monitor.constants import PERIOD_COLUMN
+from mortality_monitor.models import ExpectedDeathsModel, get_model
+from mortality_monitor.snapshot import Snapshot
+from mortality_monitor.util import QUERY_AGES, get_data_age
+
+_PREDICTION_COLUMNS = ("expected", "lower", "upper")
+_DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_DEFAULT_TIMEOUT_SECONDS = 5.0
+# Hits only mark an entry as used again once this long has passed, so that reads
+# of popular entries do not all turn into writes.
+_TOUCH_INTERVAL_SECONDS = 60.0
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS predictions (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    positions BLOB NOT NULL,
+    predicted BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+_CREATE_INDEX = (
+    "CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)"
+)
+
+
+class ResultStore:
+    """Stores predictions of expected deaths on disk, evicting the least recently used.
+
+    Errors of the database, e.g. a lock held for longer than the timeout, never fail
+    a prediction: it is then computed without being read from or written to the
+    store.
+
+    Args:
+        path: Path of the SQLite database, which is created if it does not exist.
+        max_bytes: Size of all stored predictions above which the least recently
+            used ones are evicted.
+        timeout_seconds: Time to wait for a lock held by another connection.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int = _DEFAULT_MAX_BYTES,
+        timeout_seconds: float = _DEFAULT_TIMEOUT_SECONDS,
+    ) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout_seconds = timeout_seconds
+        self._local = threading.local()
+
+    def get_prediction(
+        self,
+        snapshot: Snapshot,
+        geo: str,
+        ages: Iterable[str],
+        model: Optional[ExpectedDeathsModel] = None,
+    ) -> pd.DataFrame:
+        """Gets expected deaths with their prediction band, see Snapshot.get_prediction.
+
+        The prediction is read from the store if it has been computed before and
+        computed and stored otherwise.
+        """
+        model = model or get_model()
+        key = get_result_key(version=snapshot.version, geo=geo, ages=ages, model=model)
+        try:
+            stored = self._get(key=key)
+        except sqlite3.Error:
+            stored = None
+        if stored is not None:
+            positions, predicted = stored
+            return pd.DataFrame(
+                dict(zip(_PREDICTION_COLUMNS, predicted)),
+                index=pd.PeriodIndex(snapshot.periods[positions], name=PERIOD_COLUMN),
+            )
+        prediction = snapshot.get_prediction(geo=geo, ages=ages, model=model)
+        try:
+            self._put(
+                key=key,
+                version=snapshot.version,
+                positions=snapshot.periods.get_indexer(prediction.index).astype(
+                    np.int32
+                ),
+                predicted=prediction.loc[:, list(_PREDICTION_COLUMNS)]
+                .to_numpy(dtype=np.float64)
+                .T,
+            )
+        except sqlite3.Error:
+            pass
+        return prediction
+
+    def get_size(self) -> tuple[int, int]:
+        """Gets the number of stored predictions and their size in bytes."""
+        count, size = (
+            self._connect()
+            .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM predictions")
+            .fetchone()
+        )
+        return int(count), int(size)
+
+    def _get(self, key: str) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        connection = self._connect()
+        row = connection.execute(
+            "SELECT positions, predicted, last_used FROM predictions WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        positions, predicted, last_used = row
+        now = time.time()
+        if now - last_used > _TOUCH_INTERVAL_SECONDS:
+            connection.execute(
+                "UPDATE predictions SET last_used = ? WHERE key = ?", (now, key)
+            )
+        return (
+            np.frombuffer(positions, dtype=np.int32),
+            np.frombuffer(predicted, dtype=np.float64).reshape(
+                len(_PREDICTION_COLUMNS), -1
+            ),
+        )
+
+    def _put(
+        self, key: str, version: str, positions: np.ndarray, predicted: np.ndarray
+    ) -> None:
+        connection = self._connect()
+        size = positions.nbytes + predicted.nbytes
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    version,
+                    positions.tobytes(),
+                    np.ascontiguousarray(predicted).tobytes(),
+                    size,
+                    time.time(),
+                ),
+            )
+            self._evict(connection=connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        (total,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM predictions"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in connection.execute(
+            "SELECT key, size FROM predictions ORDER BY last_used"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        connection.executemany("DELETE FROM predictions WHERE key = ?", evicted)
+
+    def _connect(self) -> sqlite3.Connection:
+        # Connections must neither be shared between threads nor survive a fork.
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout_seconds, isolation_level=None
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(_CREATE_TABLE)
+            connection.execute(_CREATE_INDEX)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+
+def get_result_key(
+    version: str, geo: str, ages: Iterable[str], model: ExpectedDeathsModel
+) -> str:
+    """Builds the key of a prediction, which does not depend on the order of ages.
+
+    Raises:
+        KeyError if any of the ages is unknown.
+    """
+    data_ages = {get_data_age(query_age=age) for age in ages}
+    return json.dumps(
+        [
+            version,
+            geo,
+            [age for age in QUERY_AGES if get_data_age(query_age=age) in data_ages],
+            repr(model),
+        ]
+    )
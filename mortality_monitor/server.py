@@ -1,51 +1,130 @@
-import numpy as np
-import pandas as pd
-from flask import Flask, jsonify, request
+"""Flask server answering the frontend from the latest published snapshot.
+
+Importing this module is cheap: pandas, numpy and the snapshot are loaded in a
+background thread which starts with the first request, e.g. a /health probe, or
+when start_loading is called. /health, /ready and /available_ages are answered right
+away, while the routes needing the snapshot return 503 until it has been loaded.
+Loading is retried with backoff if it fails, e.g. because no snapshot has been
+published yet.
+"""
+
+from __future__ import annotations
+
+from dataclasses import asdict
+from typing import TYPE_CHECKING, Callable, Optional
+
+from flask import Flask, Response, abort, jsonify, request, stream_with_context
 from flask_cors import CORS  # type: ignore
 
-from mortality_monitor.cache import DataFrameFileCache
 from mortality_monitor.constants import (
     AGE_COLUMN,
-    COUNTRIES,
-    DEATHS_COLUMN,
+    DEFAULT_RESULT_STORE_PATH,
+    DEFAULT_SNAPSHOT_FOLDER,
     GEO_COLUMN,
-    PERIOD_COLUMN,
-)
-from mortality_monitor.deaths import get_deaths
-from mortality_monitor.eurostat import get_mortality_data
-from mortality_monitor.expected_deaths import get_expected_deaths
-from mortality_monitor.util import (
-    QUERY_AGE_TO_DATA_AGE,
-    get_all_age_groups_for_query,
-    read_csv_with_weekly_period,
+    MODEL,
+    YEAR,
 )
+from mortality_monitor.startup import READY, BackgroundLoader, NotReadyError
+from mortality_monitor.util import QUERY_AGE_TO_DATA_AGE
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from mortality_monitor.models import ExpectedDeathsModel
+    from mortality_monitor.result_store import ResultStore
+    from mortality_monitor.snapshot import Snapshot
 
 app = Flask(__name__)
 app.config["JSON_SORT_KEYS"] = False
 CORS(app)
 
-YEAR = "year"
-DATA_FOLDER = "data"
-ARCHIVE_FOLDER = "archive"
-MORTALITY_DATA_FILENAME = "mortality_data"
-CACHE = DataFrameFileCache(data_folder=DATA_FOLDER, archive_folder=ARCHIVE_FOLDER)
+SNAPSHOT_FOLDER = DEFAULT_SNAPSHOT_FOLDER
+RESULT_STORE_PATH = DEFAULT_RESULT_STORE_PATH
 
+_RETRY_AFTER_SECONDS = 1
+# Loading is retried until a snapshot has been published, at least once a minute.
+_RETRY_LOAD_SECONDS = 1.0
+_SERVICE_UNAVAILABLE = 503
 
-try:
-    mortality_data = CACHE.get_data(
-        MORTALITY_DATA_FILENAME, read_function=read_csv_with_weekly_period
-    )
-except OSError:
-    mortality_data = get_mortality_data(
-        geos=COUNTRIES, ages=get_all_age_groups_for_query()
+
+def _load_snapshot(report_stage: Callable[[str], None]) -> Snapshot:
+    report_stage("importing modules")
+    from mortality_monitor import export, leaderboard  # noqa: F401
+    from mortality_monitor.payloads import get_excess_deaths_payload
+    from mortality_monitor.result_store import ResultStore
+    from mortality_monitor.snapshot import load_latest_snapshot
+
+    global _result_store
+    report_stage("loading snapshot")
+    snapshot = load_latest_snapshot(folder=SNAPSHOT_FOLDER)
+    _result_store = ResultStore(path=RESULT_STORE_PATH)
+    report_stage("warming up")
+    get_excess_deaths_payload(
+        snapshot=snapshot,
+        geo=snapshot.geos[0],
+        ages=tuple(QUERY_AGE_TO_DATA_AGE),
+        year=int(snapshot.periods[-1].year),
+        result_store=_result_store,
     )
-    CACHE.put_data(data=mortality_data, filename=MORTALITY_DATA_FILENAME)
+    return snapshot
+
+
+_loader = BackgroundLoader(load=_load_snapshot, retry_seconds=_RETRY_LOAD_SECONDS)
+# Set by _load_snapshot before the snapshot is ready.
+_result_store: Optional[ResultStore] = None
+
+
+def start_loading() -> None:
+    """Starts loading the snapshot in the background unless already started."""
+    _loader.start()
+
+
+def wait_until_ready(timeout_seconds: Optional[float] = None) -> bool:
+    """Starts loading the snapshot and waits for it.
+
+    Returns:
+        Whether the snapshot was loaded within the timeout.
+    """
+    start_loading()
+    _loader.wait(timeout_seconds=timeout_seconds)
+    return _loader.get_status().state == READY
+
+
+@app.before_request
+def _start_loading_on_first_request():
+    start_loading()
+
+
+@app.errorhandler(NotReadyError)
+def _not_ready(error: NotReadyError):
+    response = jsonify(asdict(error.status))
+    response.status_code = _SERVICE_UNAVAILABLE
+    response.headers["Retry-After"] = str(_RETRY_AFTER_SECONDS)
+    return response
+
+
+@app.route("/health", methods=["GET"])
+def health():
+    if request.method == "GET":
+        return jsonify({"status": "ok"})
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    if request.method == "GET":
+        status = _loader.get_status()
+        response = jsonify(asdict(status))
+        if status.state != READY:
+            response.status_code = _SERVICE_UNAVAILABLE
+        return response
 
 
 @app.route("/available_geos", methods=["GET"])
 def available_geos():
     if request.method == "GET":
-        return jsonify(list(mortality_data.reset_index()[GEO_COLUMN].unique()))
+        from mortality_monitor.payloads import get_available_geos
+
+        return jsonify(get_available_geos(snapshot=_loader.get()))
 
 
 @app.route("/available_ages", methods=["GET"])
@@ -57,106 +136,163 @@ def available_ages():
 @app.route("/available_years", methods=["GET"])
 def available_years():
     if request.method == "GET":
-        available_years = (
-            mortality_data.reset_index()[PERIOD_COLUMN]
-            .map(lambda period: int(period.year))
-            .drop_duplicates()
-            .values.tolist()
-        )
-        available_years.sort(reverse=True)
-        return jsonify(available_years)
+        from mortality_monitor.payloads import get_available_years
+
+        return jsonify(get_available_years(snapshot=_loader.get()))
+
+
+@app.route("/available_models", methods=["GET"])
+def available_models():
+    if request.method == "GET":
+        from mortality_monitor.models import get_model_names
+
+        return jsonify(get_model_names())
 
 
 @app.route("/excess_deaths", methods=["POST"])
 def excess_deaths():
     if request.method == "POST":
-        user_input = request.json
-        deaths = get_deaths(
-            mortality_data=mortality_data,
-            geo=user_input[GEO_COLUMN],
-            ages=user_input[AGE_COLUMN],
-        )
-        expected_deaths = (
-            get_expected_deaths(deaths=deaths)
-            .rolling(window=4)
-            .mean()
-            .pipe(_filter_on_year, year=user_input[YEAR])
-        )
-        deaths = deaths.pipe(_filter_on_year, year=user_input[YEAR])
-        periods = deaths.index
-
-        above_expectation_deaths = np.where(
-            deaths > expected_deaths, deaths - expected_deaths, 0
-        )
-        below_expectation_deaths = np.where(
-            deaths <= expected_deaths, expected_deaths - deaths, 0
-        )
-        deaths = np.where(deaths < expected_deaths, deaths, expected_deaths)
+        from mortality_monitor.payloads import get_excess_deaths_payload
 
+        user_input = request.json
+        snapshot = _loader.get()
         return jsonify(
-            {
-                "deaths": deaths.round().tolist(),
-                "label": [_get_period_representation(period) for period in periods],
-                "expected_deaths": expected_deaths.round().tolist(),
-                "above_expectation_deaths": above_expectation_deaths.round().tolist(),
-                "below_expectation_deaths": below_expectation_deaths.round().tolist(),
-            }
+            get_excess_deaths_payload(
+                snapshot=snapshot,
+                geo=user_input[GEO_COLUMN],
+                ages=user_input[AGE_COLUMN],
+                year=user_input[YEAR],
+                model=_get_model(user_input),
+                result_store=_result_store,
+            )
         )
 
 
 @app.route("/yearly_deaths", methods=["POST"])
 def yearly_deaths():
     if request.method == "POST":
+        from mortality_monitor.payloads import get_yearly_deaths_payload
+
         user_input = request.json
-        max_week = user_input["max_week"]
-        deaths_per_year = (
-            get_deaths(
-                mortality_data=mortality_data,
+        return jsonify(
+            get_yearly_deaths_payload(
+                snapshot=_loader.get(),
                 geo=user_input[GEO_COLUMN],
                 ages=user_input[AGE_COLUMN],
+                max_week=user_input["max_week"],
             )
-            .reset_index()
-            .assign(
-                year=lambda df: df[PERIOD_COLUMN].map(lambda period: period.year),
-                week=lambda df: df[PERIOD_COLUMN].map(lambda period: period.week),
-            )
-            .query("week <= @max_week")
-            .groupby(by=[YEAR], as_index=False)[DEATHS_COLUMN]
-            .sum()
         )
-        return jsonify(
-            {
-                "yearly_deaths": {
-                    "years": deaths_per_year[YEAR].values.tolist(),
-                    "actual_deaths": deaths_per_year[DEATHS_COLUMN].values.tolist(),
-                    "max_week": max_week,
-                }
-            }
+
+
+@app.route("/export", methods=["GET"])
+def export():
+    """Streams all deaths as CSV, optionally filtered via the query parameters.
+
+    Query parameters:
+        geo: Geo to include, may be repeated. Defaults to all geos.
+        age: Age to include, e.g. 'Y35-39', may be repeated. Defaults to all ages.
+        start: First week to include, e.g. '2020-W01'.
+        end: Last week to include, e.g. '2021-W52'.
+        model: Model predicting the expected deaths.
+    """
+    if request.method == "GET":
+        from mortality_monitor.export import iter_export_csv
+
+        snapshot = _loader.get()
+        try:
+            chunks = iter_export_csv(
+                snapshot=snapshot,
+                geos=request.args.getlist("geo") or None,
+                ages=request.args.getlist("age") or None,
+                start=_parse_optional_week(request.args.get("start")),
+                end=_parse_optional_week(request.args.get("end")),
+                model=_get_model(
+                    {MODEL: request.args[MODEL]} if MODEL in request.args else {}
+                ),
+            )
+        except (KeyError, ValueError) as error:
+            abort(400, description=str(error))
+        return Response(
+            stream_with_context(chunks),
+            mimetype="text/csv",
+            headers={
+                "Content-Disposition": (
+                    f"attachment; filename=mortality_{snapshot.version}.csv"
+                )
+            },
         )
 
 
-def _filter_on_year(data: pd.Series, year: int) -> pd.Series:
-    column_name = data.name
-    return (
-        data.reset_index()  # type: ignore
-        .assign(year=lambda df: df[PERIOD_COLUMN].map(lambda period: period.year))
-        .query("year >= @year")
-        .drop(columns=[YEAR])
-        .set_index(PERIOD_COLUMN)[column_name]
-    )
+@app.route("/leaderboard", methods=["GET"])
+def leaderboard():
+    """Ranks all geos by their excess deaths over a range of weeks.
 
+    Query parameters:
+        start: First week to include, e.g. '2020-W01'.
+        end: Last week to include, e.g. '2021-W52'.
+        by_age: Whether to rank every age class of every geo, 'true' or 'false'.
+        model: Model predicting the expected deaths.
+    """
+    if request.method == "GET":
+        from mortality_monitor.leaderboard import get_leaderboard_payload
 
-def _get_period_representation(p: pd.Period) -> str:
-    if p.start_time.year == p.end_time.year:
-        return f"{p.start_time.year}/{p.week}"
-    elif p.week == 1:
-        return f"{p.end_time.year}/{p.week}"
-    elif p.week >= 52:
-        return f"{p.start_time.year}/{p.week}"
-    raise ValueError(
-        f"Period {p} has unequal start/end time years and is not in week 1, 52 or 53."
-    )
+        snapshot = _loader.get()
+        try:
+            payload = get_leaderboard_payload(
+                snapshot=snapshot,
+                start=_parse_optional_week(request.args.get("start")),
+                end=_parse_optional_week(request.args.get("end")),
+                by_age=request.args.get("by_age", "false").lower() == "true",
+                model=_get_model(
+                    {MODEL: request.args[MODEL]} if MODEL in request.args else {}
+                ),
+            )
+        except ValueError as error:
+            abort(400, description=str(error))
+        return jsonify(payload)
+
+
+@app.route("/changes", methods=["GET"])
+def changes():
+    """Lists the deaths added or revised since a snapshot version.
+
+    Query parameters:
+        since: Version of the snapshot the client holds, e.g. as returned by an
+            earlier call. Responds with 410 if the changes since this version are
+            no longer recorded, in which case all data must be downloaded again.
+    """
+    if request.method == "GET":
+        from mortality_monitor.changes import UnknownVersionError, get_changes_since
+
+        if "since" not in request.args:
+            abort(400, description="The query parameter 'since' is required.")
+        snapshot = _loader.get()
+        try:
+            payload = get_changes_since(
+                folder=SNAPSHOT_FOLDER,
+                version=request.args["since"],
+                latest_version=snapshot.version,
+            )
+        except UnknownVersionError as error:
+            abort(410, description=str(error))
+        return jsonify(payload)
+
+
+def _parse_optional_week(week: Optional[str]) -> Optional[pd.Period]:
+    from mortality_monitor.export import parse_week
+
+    return None if week is None else parse_week(week)
+
+
+def _get_model(user_input: dict) -> ExpectedDeathsModel:
+    from mortality_monitor.payloads import get_requested_model
+
+    try:
+        return get_requested_model(user_input)
+    except (KeyError, TypeError, ValueError) as error:
+        abort(400, description=str(error))
 
 
 if __name__ == "__main__":
+    start_loading()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,534 @@
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from mortality_monitor.constants import (
+    AGE_COLUMN,
+    DEATHS_COLUMN,
+    GEO_COLUMN,
+    PERIOD_COLUMN,
+    POPULATION_COLUMN,
+)
+from mortality_monitor.models import (
+    ExpectedDeathsModel,
+    Prediction,
+    get_model,
+)
+from mortality_monitor.util import DATA_AGES, get_data_age
+
+_LATEST_FILENAME = "LATEST"
+_MANIFEST_FILENAME = "manifest.json"
+_DEATHS_FILENAME = "deaths.npy"
+_POPULATION_FILENAME = "population.npy"
+_EXPECTED_DEATHS_FILENAME = "expected_deaths.npy"
+_EXPECTED_DEATHS_LOWER_FILENAME = "expected_deaths_lower.npy"
+_EXPECTED_DEATHS_UPPER_FILENAME = "expected_deaths_upper.npy"
+_TEMPORARY_PREFIX = ".tmp-"
+
+
+class InvalidSnapshotError(ValueError):
+    """Raised when a snapshot fails validation and must not be published."""
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """All data the servers need, laid out as dense arrays.
+
+    Args:
+        version: Identifier of the snapshot, sortable by creation time.
+        geos: Geos as seen in the data, e.g. 'Finland'.
+        ages: Ages as seen in the data, e.g. 'From 35 to 39 years'.
+        periods: Consecutive weekly periods covered by the snapshot.
+        deaths: Deaths of shape (geos, ages, periods). Missing values are NaN.
+        years: Years covered by the population data.
+        population: Population in millions of shape (geos, ages, years).
+        expected_deaths: Expected deaths across all ages of shape (geos, periods).
+        expected_deaths_lower: Lower end of the prediction band of the expected
+            deaths across all ages of shape (geos, periods).
+        expected_deaths_upper: Upper end of the prediction band of the expected
+            deaths across all ages of shape (geos, periods).
+    """
+
+    version: str
+    geos: tuple[str, ...]
+    ages: tuple[str, ...]
+    periods: pd.PeriodIndex
+    deaths: np.ndarray
+    years: tuple[int, ...]
+    population: np.ndarray
+    expected_deaths: np.ndarray
+    expected_deaths_lower: np.ndarray
+    expected_deaths_upper: np.ndarray
+
+    def get_deaths(self, geo: str, ages: Iterable[str]) -> pd.Series:
+        """Gets weekly deaths aggregated over all ages for a specific geo.
+
+        Equivalent to deaths.get_deaths on the mortality data the snapshot was built
+        from: only periods for which at least one of the ages has data are kept.
+
+        Args:
+            geo: Region for which to get aggregated deaths.
+            ages: Ages for which to get aggregated deaths. Of the form
+                'Y35-39', 'Y-40-44', etc. with the exception of 'Y_LT5' and 'Y_GT90'.
+
+        Returns:
+            Deaths per period for the chosen geo and age groups.
+        """
+        return self._get_deaths(
+            geo_index=self._geo_index(geo=geo), age_indices=self._age_indices(ages=ages)
+        )
+
+    def get_expected_deaths(
+        self,
+        geo: str,
+        ages: Iterable[str],
+        model: Optional[ExpectedDeathsModel] = None,
+    ) -> pd.Series:
+        """Gets expected deaths, see get_prediction.
+
+        Args:
+            geo: Region for which to get expected deaths.
+            ages: Ages for which to get expected deaths.
+            model: Model predicting the expected deaths. Defaults to the model the
+                precomputed values were created with.
+
+        Returns:
+            Expected deaths per period for the chosen geo and age groups.
+        """
+        return self.get_prediction(geo=geo, ages=ages, model=model)["expected"].rename(
+            DEATHS_COLUMN
+        )
+
+    def get_prediction(
+        self,
+        geo: str,
+        ages: Iterable[str],
+        model: Optional[ExpectedDeathsModel] = None,
+    ) -> pd.DataFrame:
+        """Gets expected deaths together with their prediction band.
+
+        The precomputed values are used if all ages are asked with the default model.
+
+        Args:
+            geo: Region for which to get expected deaths.
+            ages: Ages for which to get expected deaths.
+            model: Model predicting the expected deaths. Defaults to the default
+                model of the registry.
+
+        Returns:
+            Table with the columns expected, lower and upper for every period in
+            which at least one of the ages has data.
+        """
+        geo_index = self._geo_index(geo=geo)
+        deaths = self._get_summed_deaths(
+            geo_indices=[geo_index], age_indices=self._age_indices(ages=ages)
+        )
+        has_data = ~np.isnan(deaths[0])
+        if self.is_precomputed(ages=ages, model=model):
+            expected = self.expected_deaths[geo_index]
+            lower = self.expected_deaths_lower[geo_index]
+            upper = self.expected_deaths_upper[geo_index]
+        else:
+            prediction = (model or get_model()).predict(
+                deaths=deaths, periods=self.periods
+            )
+            expected, lower, upper = (
+                prediction.expected[0],
+                prediction.lower[0],
+                prediction.upper[0],
+            )
+        return pd.DataFrame(
+            {
+                "expected": expected[has_data],
+                "lower": lower[has_data],
+                "upper": upper[has_data],
+            },
+            index=pd.PeriodIndex(self.periods[has_data], name=PERIOD_COLUMN),
+        )
+
+    def is_precomputed(
+        self, ages: Iterable[str], model: Optional[ExpectedDeathsModel] = None
+    ) -> bool:
+        """Whether the prediction for the ages and model has been precomputed.
+
+        Args:
+            ages: Ages for which to get expected deaths.
+            model: Model predicting the expected deaths.
+
+        Returns:
+            True if all ages are asked with the default model.
+        """
+        return len(self._age_indices(ages=ages)) == len(self.ages) and model in (
+            None,
+            get_model(),
+        )
+
+    def predict(
+        self, model: ExpectedDeathsModel, ages: Optional[Iterable[str]] = None
+    ) -> Prediction:
+        """Predicts expected deaths for all geos in one batch.
+
+        Args:
+            model: Model predicting the expected deaths.
+            ages: Ages to sum deaths over. Defaults to all ages.
+
+        Returns:
+            Prediction with one row per geo of the snapshot.
+        """
+        return model.predict(
+            deaths=self.get_summed_deaths(ages=ages), periods=self.periods
+        )
+
+    def get_summed_deaths(self, ages: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Gets deaths of all geos summed over ages.
+
+        Args:
+            ages: Ages to sum deaths over. Defaults to all ages.
+
+        Returns:
+            Deaths of shape (geos, periods), NaN where none of the ages has data.
+        """
+        return self._get_summed_deaths(
+            geo_indices=list(range(len(self.geos))),
+            age_indices=(
+                list(range(len(self.ages)))
+                if ages is None
+                else self._age_indices(ages=ages)
+            ),
+        )
+
+    def _get_deaths(self, geo_index: int, age_indices: list[int]) -> pd.Series:
+        deaths = self._get_summed_deaths(
+            geo_indices=[geo_index], age_indices=age_indices
+        )[0]
+        has_data = ~np.isnan(deaths)
+        return pd.Series(
+            deaths[has_data],
+            index=pd.PeriodIndex(self.periods[has_data], name=PERIOD_COLUMN),
+            name=DEATHS_COLUMN,
+        )
+
+    def _get_summed_deaths(
+        self, geo_indices: list[int], age_indices: list[int]
+    ) -> np.ndarray:
+        """Deaths summed over ages of shape (geos, periods), NaN if no age has data."""
+        deaths = self.deaths[np.ix_(geo_indices, age_indices)]
+        return np.where(np.isnan(deaths).all(axis=1), np.nan, np.nansum(deaths, axis=1))
+
+    def _geo_index(self, geo: str) -> int:
+        try:
+            return self.geos.index(geo)
+        except ValueError:
+            raise KeyError(f"Geo {geo} is not part of snapshot {self.version}.")
+
+    def _age_indices(self, ages: Iterable[str]) -> list[int]:
+        data_ages = {get_data_age(query_age=age) for age in ages}
+        return [i for i, age in enumerate(self.ages) if age in data_ages]
+
+
+def build_snapshot(
+    mortality_data: pd.DataFrame,
+    population_data: pd.DataFrame,
+    version: Optional[str] = None,
+) -> Snapshot:
+    """Turns long-format mortality and population data into a snapshot.
+
+    Args:
+        mortality_data: Table containing deaths per geo, age and weekly period.
+        population_data: Table containing population in millions per geo, age and
+            yearly period.
+        version: Version of the snapshot. Defaults to the current UTC time followed
+            by a hash of the deaths.
+
+    Returns:
+        Snapshot with expected deaths and their prediction band across all ages
+        precomputed for every geo with the default model.
+    """
+    mortality = mortality_data.reset_index()
+    population = population_data.reset_index()
+    geos = tuple(pd.unique(mortality[GEO_COLUMN]))
+    ages = _sort_ages(pd.unique(mortality[AGE_COLUMN]))
+    periods = pd.period_range(
+        start=mortality[PERIOD_COLUMN].min(),
+        end=mortality[PERIOD_COLUMN].max(),
+        freq="W",
+    )
+    years = tuple(
+        range(
+            int(population[PERIOD_COLUMN].min().year),
+            int(population[PERIOD_COLUMN].max().year) + 1,
+        )
+    )
+    deaths = _to_cube(
+        data=mortality,
+        geos=geos,
+        ages=ages,
+        time_indices=periods.get_indexer(mortality[PERIOD_COLUMN]),
+        num_times=len(periods),
+        value_column=DEATHS_COLUMN,
+    )
+    population_cube = _to_cube(
+        data=population.loc[population[GEO_COLUMN].isin(geos)],
+        geos=geos,
+        ages=ages,
+        time_indices=(
+            population.loc[population[GEO_COLUMN].isin(geos), PERIOD_COLUMN]
+            .map(lambda period: int(period.year) - years[0])
+            .values
+        ),
+        num_times=len(years),
+        value_column=POPULATION_COLUMN,
+    )
+    snapshot = Snapshot(
+        version=version or _create_version(deaths=deaths),
+        geos=geos,
+        ages=ages,
+        periods=periods,
+        deaths=deaths,
+        years=years,
+        population=population_cube,
+        expected_deaths=np.full((len(geos), len(periods)), np.nan),
+        expected_deaths_lower=np.full((len(geos), len(periods)), np.nan),
+        expected_deaths_upper=np.full((len(geos), len(periods)), np.nan),
+    )
+    prediction = snapshot.predict(model=get_model())
+    snapshot.expected_deaths[:] = prediction.expected
+    snapshot.expected_deaths_lower[:] = prediction.lower
+    snapshot.expected_deaths_upper[:] = prediction.upper
+    return snapshot
+
+
+def validate_snapshot(snapshot: Snapshot) -> None:
+    """Checks that a snapshot is complete and consistent.
+
+    Raises:
+        InvalidSnapshotError if any of the checks fails.
+    """
+    shape = (len(snapshot.geos), len(snapshot.ages), len(snapshot.periods))
+    checks = (
+        (len(snapshot.geos) > 0, "Snapshot contains no geos."),
+        (len(snapshot.ages) > 0, "Snapshot contains no ages."),
+        (len(snapshot.periods) > 0, "Snapshot contains no periods."),
+        (len(set(snapshot.geos)) == len(snapshot.geos), "Geos are not unique."),
+        (snapshot.deaths.shape == shape, f"Deaths are not of shape {shape}."),
+        (
+            snapshot.population.shape == shape[:2] + (len(snapshot.years),),
+            "Population does not match geos, ages and years.",
+        ),
+        (
+            all(
+                expected_deaths.shape == (shape[0], shape[2])
+                for expected_deaths in (
+                    snapshot.expected_deaths,
+                    snapshot.expected_deaths_lower,
+                    snapshot.expected_deaths_upper,
+                )
+            ),
+            "Expected deaths do not match geos and periods.",
+        ),
+        (
+            bool(np.all(np.isnan(snapshot.deaths) | (snapshot.deaths >= 0))),
+            "Deaths contain negative values.",
+        ),
+        (
+            bool(np.all(~np.isnan(snapshot.deaths).all(axis=(1, 2)))),
+            "Some geos do not contain any deaths.",
+        ),
+    )
+    for passed, message in checks:
+        if not passed:
+            raise InvalidSnapshotError(f"Snapshot {snapshot.version}: {message}")
+
+
+def publish_snapshot(snapshot: Snapshot, folder: str) -> str:
+    """Writes a snapshot and atomically marks it as the latest one.
+
+    The snapshot is written to a temporary folder which is renamed once complete.
+    Afterwards the LATEST file is replaced, so readers either see the previous or
+    the new snapshot but never a partially written one. Published versions are
+    immutable: if the version already exists, e.g. because the same data was
+    refreshed twice within a second, only the LATEST file is updated.
+
+    Returns:
+        Path of the folder the snapshot was written to.
+    """
+    path = os.path.join(folder, snapshot.version)
+    if os.path.isfile(os.path.join(path, _MANIFEST_FILENAME)):
+        _write_atomically(
+            path=os.path.join(folder, _LATEST_FILENAME), text=snapshot.version
+        )
+        return path
+    temporary_path = os.path.join(
+        folder, f"{_TEMPORARY_PREFIX}{snapshot.version}-{os.getpid()}"
+    )
+    os.makedirs(temporary_path)
+    try:
+        for filename, array in (
+            (_DEATHS_FILENAME, snapshot.deaths),
+            (_POPULATION_FILENAME, snapshot.population),
+            (_EXPECTED_DEATHS_FILENAME, snapshot.expected_deaths),
+            (_EXPECTED_DEATHS_LOWER_FILENAME, snapshot.expected_deaths_lower),
+            (_EXPECTED_DEATHS_UPPER_FILENAME, snapshot.expected_deaths_upper),
+        ):
+            np.save(os.path.join(temporary_path, filename), array)
+        _write_json(
+            path=os.path.join(temporary_path, _MANIFEST_FILENAME),
+            data={
+                "version": snapshot.version,
+                "created_at": dt.datetime.utcnow().isoformat(),
+                "geos": list(snapshot.geos),
+                "ages": list(snapshot.ages),
+                "first_period": snapshot.periods[0].start_time.strftime("%Y-%m-%d"),
+                "num_periods": len(snapshot.periods),
+                "years": list(snapshot.years),
+            },
+        )
+        os.rename(temporary_path, path)
+    except BaseException:
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        raise
+    _write_atomically(
+        path=os.path.join(folder, _LATEST_FILENAME), text=snapshot.version
+    )
+    return path
+
+
+def load_snapshot(folder: str, version: str) -> Snapshot:
+    """Loads a published snapshot, memory-mapping its arrays."""
+    path = os.path.join(folder, version)
+    with open(os.path.join(path, _MANIFEST_FILENAME)) as file:
+        manifest = json.load(file)
+    return Snapshot(
+        version=manifest["version"],
+        geos=tuple(manifest["geos"]),
+        ages=tuple(manifest["ages"]),
+        periods=pd.period_range(
+            start=pd.Period(manifest["first_period"], freq="W"),
+            periods=manifest["num_periods"],
+            freq="W",
+        ),
+        deaths=np.load(os.path.join(path, _DEATHS_FILENAME), mmap_mode="r"),
+        years=tuple(manifest["years"]),
+        population=np.load(os.path.join(path, _POPULATION_FILENAME), mmap_mode="r"),
+        expected_deaths=np.load(
+            os.path.join(path, _EXPECTED_DEATHS_FILENAME), mmap_mode="r"
+        ),
+        expected_deaths_lower=np.load(
+            os.path.join(path, _EXPECTED_DEATHS_LOWER_FILENAME), mmap_mode="r"
+        ),
+        expected_deaths_upper=np.load(
+            os.path.join(path, _EXPECTED_DEATHS_UPPER_FILENAME), mmap_mode="r"
+        ),
+    )
+
+
+def load_latest_snapshot(folder: str) -> Snapshot:
+    """Loads the snapshot the LATEST file points to.
+
+    Raises:
+        FileNotFoundError if no snapshot has been published yet.
+    """
+    return load_snapshot(folder=folder, version=get_latest_version(folder=folder))
+
+
+def get_latest_version(folder: str) -> str:
+    try:
+        with open(os.path.join(folder, _LATEST_FILENAME)) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"No snapshot has been published to {folder} - please run "
+            "'python -m mortality_monitor.refresh' first."
+        )
+
+
+def list_versions(folder: str) -> tuple[str, ...]:
+    """Lists the versions of all published snapshots, oldest first.
+
+    Temporary folders left behind by an interrupted publish are skipped.
+    """
+    if not os.path.isdir(folder):
+        return ()
+    return tuple(
+        sorted(
+            name
+            for name in os.listdir(folder)
+            if not name.startswith(_TEMPORARY_PREFIX)
+            and os.path.isfile(os.path.join(folder, name, _MANIFEST_FILENAME))
+        )
+    )
+
+
+def prune_snapshots(folder: str, keep: int) -> tuple[str, ...]:
+    """Deletes all but the newest snapshots, never deleting the latest one.
+
+    Returns:
+        Versions of the deleted snapshots.
+    """
+    latest = get_latest_version(folder=folder)
+    versions = list_versions(folder=folder)
+    deleted = tuple(
+        version
+        for version in versions[: max(len(versions) - keep, 0)]
+        if version != latest
+    )
+    for version in deleted:
+        shutil.rmtree(os.path.join(folder, version))
+    return deleted
+
+
+def _sort_ages(ages: Iterable[str]) -> tuple[str, ...]:
+    """Sorts ages from young to old, keeping unknown ages at the end."""
+    return tuple(
+        sorted(
+            ages,
+            key=lambda age: (
+                DATA_AGES.index(age) if age in DATA_AGES else len(DATA_AGES)
+            ),
+        )
+    )
+
+
+def _to_cube(
+    data: pd.DataFrame,
+    geos: tuple[str, ...],
+    ages: tuple[str, ...],
+    time_indices: np.ndarray,
+    num_times: int,
+    value_column: str,
+) -> np.ndarray:
+    cube = np.full((len(geos), len(ages), num_times), np.nan)
+    cube[
+        pd.Index(geos).get_indexer(data[GEO_COLUMN]),
+        pd.Index(ages).get_indexer(data[AGE_COLUMN]),
+        time_indices,
+    ] = data[value_column].values
+    return cube
+
+
+def _create_version(deaths: np.ndarray) -> str:
+    content_hash = hashlib.sha256(np.ascontiguousarray(deaths).tobytes()).hexdigest()
+    return f"{dt.datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{content_hash[:8]}"
+
+
+def _write_json(path: str, data: dict) -> None:
+    with open(path, "w") as file:
+        json.dump(data, file)
+
+
+def _write_atomically(path: str, text: str) -> None:
+    temporary_path = f"{path}{_TEMPORARY_PREFIX}{os.getpid()}"
+    with open(temporary_path, "w") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Generic, Optional, TypeVar
+
+NOT_STARTED = "not started"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+_DEFAULT_MAX_RETRY_SECONDS = 60.0
+
+_T = TypeVar("_T")
+
+
+class NotReadyError(Exception):
+    """Raised when the result of a load is requested before it has finished."""
+
+    def __init__(self, status: LoadStatus):
+        super().__init__(f"Still {status.state}: {status.stage or status.error}.")
+        self.status = status
+
+
+@dataclass(frozen=True)
+class LoadStatus:
+    """Progress of a background load.
+
+    Args:
+        state: One of 'not started', 'loading', 'ready' and 'failed'.
+        stage: Step the load is at or finished with, as reported by the load.
+        elapsed_seconds: Time since the load started, or the time it took.
+        error: Description of the error the last attempt failed with.
+        attempts: Number of attempts started so far.
+    """
+
+    state: str
+    stage: Optional[str]
+    elapsed_seconds: float
+    error: Optional[str]
+    attempts: int = 0
+
+
+class BackgroundLoader(Generic[_T]):
+    """Runs a slow load in a background thread and reports its progress.
+
+    A failed load is retried with exponential backoff until it succeeds, e.g. once
+    the data it loads has been published. Until then the state is 'failed' between
+    attempts and 'loading' during them.
+
+    Args:
+        load: Callable producing the result. It receives a callable to report the
+            stage it is at, e.g. 'importing modules'.
+        retry_seconds: Time to wait before retrying a failed load, doubled after
+            every failure. None to not retry.
+        max_retry_seconds: Longest time to wait before retrying.
+    """
+
+    def __init__(
+        self,
+        load: Callable[[Callable[[str], None]], _T],
+        retry_seconds: Optional[float] = None,
+        max_retry_seconds: float = _DEFAULT_MAX_RETRY_SECONDS,
+    ) -> None:
+        self._load = load
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._attempts = 0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._state = NOT_STARTED
+        self._stage: Optional[str] = None
+        self._error: Optional[str] = None
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self._result: Optional[_T] = None
+
+    def start(self) -> None:
+        """Starts the load unless it has been started before."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._started_at = time.perf_counter()
+            self._state = LOADING
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout_seconds: Optional[float] = None) -> bool:
+        """Waits for the first attempt of the load to finish.
+
+        Returns:
+            Whether the attempt finished, successfully or not, within the timeout.
+        """
+        return self._done.wait(timeout=timeout_seconds)
+
+    def get(self) -> _T:
+        """Gets the result of the load without waiting for it.
+
+        Raises:
+            NotReadyError if the load has not finished successfully.
+        """
+        if self._state != READY:
+            raise NotReadyError(status=self.get_status())
+        return self._result  # type: ignore
+
+    def get_status(self) -> LoadStatus:
+        if self._started_at is None:
+            elapsed_seconds = 0.0
+        else:
+            elapsed_seconds = (self._finished_at or time.perf_counter()) - (
+                self._started_at
+            )
+        return LoadStatus(
+            state=self._state,
+            stage=self._stage,
+            elapsed_seconds=elapsed_seconds,
+            error=self._error,
+            attempts=self._attempts,
+        )
+
+    def _report_stage(self, stage: str) -> None:
+        self._stage = stage
+
+    def _run(self) -> None:
+        retry_seconds = self.retry_seconds
+        while True:
+            self._attempts += 1
+            self._state = LOADING
+            try:
+                self._result = self._load(self._report_stage)
+                self._error = None
+                self._state = READY
+            except Exception as error:
+                self._error = f"{type(error).__name__}: {error}"
+                self._state = FAILED
+            finally:
+                self._finished_at = time.perf_counter()
+                self._done.set()
+            if self._state == READY or retry_seconds is None:
+                return
+            time.sleep(retry_seconds)
+            retry_seconds = min(2 * retry_seconds, self.max_retry_seconds)
+            self._started_at, self._finished_at = time.perf_counter(), None
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 from collections import OrderedDict
+from typing import TYPE_CHECKING
 
-import pandas as pd
+# pandas is only imported by the readers, so importing the ages stays cheap.
+if TYPE_CHECKING:
+    import pandas as pd
 
 FROM, TO = (tuple(i for i in range(5, 90, 5)), tuple(i + 4 for i in range(5, 90, 5)))
 
@@ -30,8 +33,20 @@ def get_data_age(query_age: str) -> str:
 
 
 def read_csv_with_weekly_period(path: str) -> pd.DataFrame:
+    import pandas as pd
+
     return pd.read_csv(path).assign(
         period=lambda df: pd.to_datetime(
             df["period"].str.split("/", expand=True)[1]
         ).dt.to_period(freq="W")
     )
+
+
+def read_csv_with_yearly_period(path: str) -> pd.DataFrame:
+    import pandas as pd
+
+    return pd.read_csv(path).assign(
+        period=lambda df: pd.to_datetime(
+            df["period"].astype(str), format="%Y"
+        ).dt.to_period(freq="Y")
+    )
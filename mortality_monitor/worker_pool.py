@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import threading
+from concurrent import futures
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class PoolSaturatedError(Exception):
+    """Raised when all worker and queue slots of a pool are taken."""
+
+
+class BoundedProcessPool:
+    """Process pool which rejects work instead of queueing it without limit.
+
+    At most max_workers + max_queued tasks are admitted at any time. A slot is only
+    freed once its task has finished, so tasks which outlive their caller's timeout
+    keep counting towards the limit until they are done.
+
+    Args:
+        max_workers: Number of worker processes.
+        max_queued: Number of admitted tasks which may wait for a free worker.
+        timeout_seconds: Time a caller waits for the result of a task.
+        admission_timeout_seconds: Time a caller waits for a free slot before the
+            task is rejected.
+        initializer: Callable run once in every worker process.
+        initargs: Arguments passed to the initializer.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_queued: int = 0,
+        timeout_seconds: float = 30.0,
+        admission_timeout_seconds: float = 0.0,
+        initializer: Optional[Callable[..., Any]] = None,
+        initargs: tuple = (),
+    ) -> None:
+        self.timeout_seconds = timeout_seconds
+        self.admission_timeout_seconds = admission_timeout_seconds
+        self._slots = threading.BoundedSemaphore(max_workers + max_queued)
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers, initializer=initializer, initargs=initargs
+        )
+
+    def submit(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+        """Schedules a task if a slot is free.
+
+        Raises:
+            PoolSaturatedError if no slot frees up within the admission timeout.
+        """
+        if not self._acquire_slot():
+            raise PoolSaturatedError("All workers are busy - please retry later.")
+        try:
+            future = self._executor.submit(function, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, function: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Runs a task in a worker process and waits for its result.
+
+        Raises:
+            PoolSaturatedError if the task could not be admitted.
+            concurrent.futures.TimeoutError if the task did not finish in time.
+        """
+        future = self.submit(function, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout_seconds)
+        except futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _acquire_slot(self) -> bool:
+        if self.admission_timeout_seconds > 0:
+            return self._slots.acquire(timeout=self.admission_timeout_seconds)
+        return self._slots.acquire(blocking=False)
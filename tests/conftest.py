@@ -0,0 +1,43 @@
+import pytest
+
+from benchmarks.synthetic_data import (
+    DatasetSize,
+    generate_mortality_data,
+    generate_population_data,
+)
+from mortality_monitor.snapshot import build_snapshot
+
+
+@pytest.fixture(scope="session")
+def size():
+    return DatasetSize(num_geos=3, num_ages=3, num_years=7)
+
+
+@pytest.fixture(scope="session")
+def mortality_data(size):
+    return generate_mortality_data(size=size, missing_fraction=0.05)
+
+
+@pytest.fixture(scope="session")
+def population_data(size):
+    return generate_population_data(size=size)
+
+
+@pytest.fixture(scope="session")
+def snapshot(mortality_data, population_data):
+    return build_snapshot(
+        mortality_data=mortality_data, population_data=population_data, version="v1"
+    )
+
+
+@pytest.fixture
+def forbid_call(monkeypatch):
+    """Replaces a function by one failing the test if it is called."""
+
+    def _forbid_call(target, name):
+        def _fail(*args, **kwargs):
+            raise AssertionError(f"{name} should not have been called.")
+
+        monkeypatch.setattr(target, name, _fail)
+
+    return _forbid_call
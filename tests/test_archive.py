@@ -0,0 +1,122 @@
+import datetime
+import os
+
+import pytest
+
+from mortality_monitor.archive import (
+    ArchiveStore,
+    split_into_chunks,
+    split_stream_into_chunks,
+)
+
+NOW = datetime.datetime(2022, 6, 15, 12)
+
+
+def _csv(num_rows, revised_row=None):
+    return "period,geo,deaths\n".encode() + b"".join(
+        f"2020/{i},Sweden,{i % 97 + (1000 if i == revised_row else 0)}\n".encode()
+        for i in range(num_rows)
+    )
+
+
+def _count_objects(folder):
+    return sum(len(files) for _, _, files in os.walk(os.path.join(folder, "objects")))
+
+
+def test_split_into_chunks_keeps_boundaries_after_an_insertion():
+    # given
+    content = _csv(num_rows=20000)
+    header, rows = content.split(b"\n", 1)
+    inserted = header + b"\n2019/1,Sweden,1\n" + rows
+
+    # when
+    result = list(split_into_chunks(inserted))
+
+    # then
+    original = list(split_into_chunks(content))
+    assert b"".join(result) == inserted
+    assert len(original) > 5
+    assert len(set(original) - set(result)) == 1
+
+
+@pytest.mark.parametrize("part_bytes", [1, 1000, 100000])
+def test_split_stream_into_chunks_matches_splitting_the_whole_content(part_bytes):
+    # given
+    content = _csv(num_rows=20000)
+    parts = (content[i : i + part_bytes] for i in range(0, len(content), part_bytes))
+
+    # when
+    result = list(split_stream_into_chunks(parts))
+
+    # then
+    assert result == list(split_into_chunks(content))
+
+
+def test_put_stores_unchanged_chunks_only_once(tmp_path):
+    # given
+    store = ArchiveStore(folder=str(tmp_path))
+    store.put(content=_csv(num_rows=20000), filename="data", archived_at=NOW)
+    num_objects = _count_objects(str(tmp_path))
+
+    # when
+    store.put(
+        content=_csv(num_rows=20000, revised_row=10000),
+        filename="data",
+        archived_at=NOW + datetime.timedelta(days=1),
+    )
+
+    # then
+    assert _count_objects(str(tmp_path)) == num_objects + 1
+    assert len(store.list_archive_times(filename="data")) == 2
+
+
+def test_get_version_as_of_returns_the_last_version_before(tmp_path):
+    # given
+    store = ArchiveStore(folder=str(tmp_path))
+    for day, revised_row in enumerate((None, 5, 7)):
+        store.put(
+            content=_csv(num_rows=100, revised_row=revised_row),
+            filename="data",
+            archived_at=NOW + datetime.timedelta(days=day),
+            metadata={"day": day},
+        )
+
+    # when
+    result = store.get_version_as_of(
+        filename="data", as_of=NOW + datetime.timedelta(days=1, hours=12)
+    )
+
+    # then
+    assert result.metadata == {"day": 1}
+    assert store.get(result) == _csv(num_rows=100, revised_row=5)
+    with pytest.raises(FileNotFoundError):
+        store.get_version_as_of(filename="data", as_of=NOW - datetime.timedelta(1))
+
+
+def test_prune_keeps_recent_and_monthly_versions(tmp_path):
+    # given
+    store = ArchiveStore(folder=str(tmp_path))
+    archive_times = [
+        datetime.datetime(2021, 1, 10),
+        datetime.datetime(2022, 3, 10),
+        datetime.datetime(2022, 3, 20),
+        datetime.datetime(2022, 6, 1),
+        datetime.datetime(2022, 6, 10),
+    ]
+    for i, archived_at in enumerate(archive_times):
+        store.put(
+            content=_csv(num_rows=100, revised_row=i),
+            filename="data",
+            archived_at=archived_at,
+        )
+
+    # when
+    result = store.prune(keep_days=7, keep_months=12, now=NOW)
+
+    # then
+    assert result == 3
+    assert store.list_archive_times(filename="data") == (
+        datetime.datetime(2022, 3, 20),
+        datetime.datetime(2022, 6, 10),
+    )
+    assert _count_objects(str(tmp_path)) == 2
@@ -0,0 +1,114 @@
+from time import sleep
+
+import pytest
+
+from mortality_monitor import async_server
+from mortality_monitor.constants import AGE_COLUMN, GEO_COLUMN, MODEL_PARAMETERS, YEAR
+from mortality_monitor.snapshot import publish_snapshot
+from mortality_monitor.startup import FAILED, READY
+
+
+@pytest.fixture
+def excess_deaths_request(size):
+    return {
+        GEO_COLUMN: size.geo_labels[0],
+        AGE_COLUMN: list(size.age_codes[:1]),
+        YEAR: 2020,
+    }
+
+
+@pytest.fixture
+def snapshot_folder(tmp_path, monkeypatch):
+    folder = str(tmp_path / "snapshots")
+    monkeypatch.setattr(async_server, "SNAPSHOT_FOLDER", folder)
+    monkeypatch.setattr(
+        async_server, "RESULT_STORE_PATH", str(tmp_path / "results.sqlite")
+    )
+    monkeypatch.setattr(async_server, "_pool", None)
+    yield folder
+    if async_server._pool is not None:
+        async_server._pool.shutdown()
+
+
+@pytest.fixture
+def published_snapshot_folder(snapshot_folder, snapshot):
+    publish_snapshot(snapshot=snapshot, folder=snapshot_folder)
+    return snapshot_folder
+
+
+def test_ready_returns_503_until_a_snapshot_is_published(snapshot_folder):
+    # given
+    client = async_server.app.test_client()
+
+    # when
+    result = client.get("/ready")
+
+    # then
+    assert client.get("/health").status_code == 200
+    assert result.status_code == 503
+    assert result.json["state"] == FAILED
+    assert result.json["error"].startswith("FileNotFoundError")
+
+
+def test_routes_answer_from_the_published_snapshot(
+    published_snapshot_folder, size, excess_deaths_request
+):
+    # given
+    async_server.start(max_workers=1)
+    client = async_server.app.test_client()
+
+    # when
+    ready = client.get("/ready")
+    geos = client.get("/available_geos")
+    excess_deaths = client.post("/excess_deaths", json=excess_deaths_request)
+    leaderboard = client.get("/leaderboard?start=2020-W01&end=2020-W52")
+    unchanged = client.get("/changes?since=v1")
+
+    # then
+    assert ready.json["state"] == READY
+    assert geos.json == list(size.geo_labels)
+    assert excess_deaths.status_code == 200
+    assert leaderboard.json["version"] == "v1"
+    assert len(leaderboard.json["rows"]) == size.num_geos
+    assert unchanged.json["changes"] == []
+    assert client.get("/changes?since=v0").status_code == 410
+    assert client.get("/leaderboard?start=2020-W52&end=2020-W01").status_code == 400
+    for lookback_years in (20001, True):
+        invalid_model = client.post(
+            "/excess_deaths",
+            json={
+                **excess_deaths_request,
+                MODEL_PARAMETERS: {"lookback_years": lookback_years},
+            },
+        )
+        assert invalid_model.status_code == 400
+
+
+def test_requests_are_rejected_with_503_if_the_pool_is_saturated(
+    published_snapshot_folder, excess_deaths_request
+):
+    # given
+    async_server.start(max_workers=1, max_queued=0)
+    client = async_server.app.test_client()
+    async_server._pool.submit(sleep, 1)
+
+    # when
+    result = client.post("/excess_deaths", json=excess_deaths_request)
+
+    # then
+    assert result.status_code == 503
+    assert result.headers["Retry-After"] == "1"
+    assert client.get("/available_ages").status_code == 200
+
+
+def test_requests_time_out_with_504(published_snapshot_folder, excess_deaths_request):
+    # given
+    async_server.start(max_workers=1, max_queued=1, timeout_seconds=0.2)
+    client = async_server.app.test_client()
+    async_server._pool.submit(sleep, 1)
+
+    # when
+    result = client.post("/excess_deaths", json=excess_deaths_request)
+
+    # then
+    assert result.status_code == 504
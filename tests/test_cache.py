@@ -5,6 +5,7 @@ from time import sleep
 import pandas as pd
 import pytest
 
+from benchmarks.synthetic_data import DatasetSize, generate_mortality_data
 from mortality_monitor.cache import DataFrameFileCache
 from mortality_monitor.util import read_csv_with_weekly_period
 
@@ -12,6 +13,14 @@ PATH_TO_DATA = "tests/data/mortality_data.csv"
 CACHE_TIMEOUT_TIME = 1 / (60 * 60 * 10)
 
 
+def _count_archived_objects(archive_folder):
+    return sum(len(files) for _, _, files in os.walk(f"{archive_folder}/objects"))
+
+
+def _in_archive_order(data):
+    return data.sort_values(by="period", kind="mergesort").reset_index(drop=True)
+
+
 def test_put_data(tmp_path):
     # given
     data_folder = str(tmp_path / "data")
@@ -52,16 +61,22 @@ def test_cache_timeout(read_function, tmp_path):
         archive_folder=archive_folder,
         timeout_hours=CACHE_TIMEOUT_TIME,
     )
-    data = read_csv_with_weekly_period(path=PATH_TO_DATA)
+    data = read_function(PATH_TO_DATA)
     cache.put_data(data=data, filename="cached_data_test")
-    today = datetime.datetime.now().strftime("%d_%m_%Y")
 
     # when and then
     sleep(0.1)
     with pytest.raises(FileNotFoundError):
         cache.get_data(filename="cached_data_test", read_function=read_function)
-    assert os.path.isfile(f"{archive_folder}/{today}_cached_data_test.csv")
     assert not os.path.isfile(f"{data_folder}/cached_data_test.csv")
+    pd.testing.assert_frame_equal(
+        cache.get_data_as_of(
+            filename="cached_data_test",
+            as_of=datetime.datetime.now(),
+            read_function=read_function,
+        ),
+        _in_archive_order(data),
+    )
 
 
 def test_raises_error_if_data_contains_index_column(tmp_path):
@@ -128,3 +143,190 @@ def test_raises_error_if_data_contains_exactly_one_index_named_index(tmp_path):
     # when and then
     with pytest.raises(ValueError):
         cache.put_data(data=data, filename="some-filename")
+
+
+def test_cache_timeout_is_extended_if_data_revalidates(tmp_path):
+    # given
+    data_folder = str(tmp_path / "data")
+    archive_folder = str(tmp_path / "archive")
+    cache = DataFrameFileCache(
+        data_folder=data_folder,
+        archive_folder=archive_folder,
+        timeout_hours=CACHE_TIMEOUT_TIME,
+    )
+    data = read_csv_with_weekly_period(path=PATH_TO_DATA)
+    cache.put_data(data=data, filename="cached_data_test")
+    sleep(0.1)
+
+    # when
+    result = cache.get_data(
+        filename="cached_data_test",
+        read_function=read_csv_with_weekly_period,
+        revalidate=lambda: True,
+    )
+
+    # then
+    pd.testing.assert_frame_equal(result, data)
+    assert os.path.isfile(f"{data_folder}/cached_data_test.csv")
+    assert len(cache.list_archived_versions(filename="cached_data_test")) == 1
+    assert not cache._is_timedout(filename="cached_data_test")
+
+
+def test_cache_timeout_archives_data_if_data_does_not_revalidate(tmp_path):
+    # given
+    data_folder = str(tmp_path / "data")
+    archive_folder = str(tmp_path / "archive")
+    cache = DataFrameFileCache(
+        data_folder=data_folder,
+        archive_folder=archive_folder,
+        timeout_hours=CACHE_TIMEOUT_TIME,
+    )
+    cache.put_data(
+        data=read_csv_with_weekly_period(path=PATH_TO_DATA),
+        filename="cached_data_test",
+    )
+    sleep(0.1)
+
+    # when and then
+    with pytest.raises(FileNotFoundError):
+        cache.get_data(
+            filename="cached_data_test",
+            read_function=read_csv_with_weekly_period,
+            revalidate=lambda: False,
+        )
+    assert not os.path.isfile(f"{data_folder}/cached_data_test.csv")
+
+
+def test_get_data_as_of_reads_data_cached_at_that_time(tmp_path):
+    # given
+    cache = DataFrameFileCache(
+        data_folder=str(tmp_path / "data"), archive_folder=str(tmp_path / "archive")
+    )
+    data = read_csv_with_weekly_period(path=PATH_TO_DATA)
+    cache.put_data(data=data, filename="cached_data_test", metadata={"etag": "1"})
+    as_of = datetime.datetime.now()
+    sleep(0.01)
+    cache.put_data(data=data.assign(deaths=0), filename="cached_data_test")
+
+    # when
+    result = cache.get_data_as_of(
+        filename="cached_data_test",
+        as_of=as_of,
+        read_function=read_csv_with_weekly_period,
+    )
+
+    # then
+    pd.testing.assert_frame_equal(result, _in_archive_order(data))
+    assert len(cache.list_archived_versions(filename="cached_data_test")) == 2
+    assert cache.get_metadata(filename="cached_data_test") == {"etag": "1"}
+    with pytest.raises(FileNotFoundError):
+        cache.get_data_as_of(
+            filename="cached_data_test",
+            as_of=as_of - datetime.timedelta(days=1),
+            read_function=read_csv_with_weekly_period,
+        )
+
+
+def test_get_metadata(tmp_path):
+    # given
+    cache = DataFrameFileCache(data_folder=str(tmp_path / "data"))
+    cache.put_metadata(metadata={"etag": '"abc"'}, filename="cached_data_test")
+
+    # when
+    result = cache.get_metadata(filename="cached_data_test")
+
+    # then
+    assert result == {"etag": '"abc"'}
+    assert cache.get_metadata(filename="other_data") == {}
+
+
+def test_put_data_chunks_writes_the_same_file_as_put_data(tmp_path):
+    # given
+    cache = DataFrameFileCache(
+        data_folder=str(tmp_path / "data"), archive_folder=str(tmp_path / "archive")
+    )
+    data = read_csv_with_weekly_period(path=PATH_TO_DATA)
+    cache.put_data(data=data, filename="whole")
+
+    # when
+    cache.put_data_chunks(
+        chunks=(data.iloc[i : i + 100] for i in range(0, len(data), 100)),
+        filename="chunked",
+    )
+
+    # then
+    with open(tmp_path / "data" / "whole.csv") as whole, open(
+        tmp_path / "data" / "chunked.csv"
+    ) as chunked:
+        assert chunked.read() == whole.read()
+    assert len(cache.list_archived_versions(filename="chunked")) == 1
+    pd.testing.assert_frame_equal(
+        cache.get_data_as_of(
+            filename="chunked",
+            as_of=datetime.datetime.now(),
+            read_function=read_csv_with_weekly_period,
+        ),
+        _in_archive_order(data),
+    )
+
+
+def test_put_data_chunks_keeps_cached_file_if_a_chunk_fails(tmp_path):
+    # given
+    cache = DataFrameFileCache(
+        data_folder=str(tmp_path / "data"), archive_folder=str(tmp_path / "archive")
+    )
+    data = read_csv_with_weekly_period(path=PATH_TO_DATA)
+    cache.put_data(data=data, filename="cached_data_test")
+
+    def chunks():
+        yield data.iloc[:10]
+        raise ConnectionError("Download interrupted.")
+
+    # when
+    with pytest.raises(ConnectionError):
+        cache.put_data_chunks(chunks=chunks(), filename="cached_data_test")
+
+    # then
+    result = cache.get_data(
+        filename="cached_data_test", read_function=read_csv_with_weekly_period
+    )
+    pd.testing.assert_frame_equal(result, data)
+    assert os.listdir(tmp_path / "data") == ["cached_data_test.csv"]
+    assert len(cache.list_archived_versions(filename="cached_data_test")) == 1
+
+
+def test_archiving_a_new_week_stores_few_new_objects(tmp_path):
+    # given
+    archive_folder = str(tmp_path / "archive")
+    cache = DataFrameFileCache(
+        data_folder=str(tmp_path / "data"), archive_folder=archive_folder
+    )
+    data = generate_mortality_data(
+        size=DatasetSize(num_geos=3, num_ages=4, num_years=8)
+    )
+    periods = data.index.get_level_values(0)
+    geos = data.index.get_level_values(1)
+
+    def chunks(last_period):
+        for geo in geos.unique():
+            yield data.loc[(geos == geo) & (periods <= last_period)]
+
+    cache.put_data_chunks(chunks=chunks(periods.max() - 1), filename="mortality")
+    num_objects = _count_archived_objects(archive_folder)
+
+    # when
+    cache.put_data_chunks(chunks=chunks(periods.max()), filename="mortality")
+
+    # then
+    assert num_objects > 4
+    assert _count_archived_objects(archive_folder) - num_objects <= 2
+    pd.testing.assert_frame_equal(
+        cache.get_data_as_of(
+            filename="mortality",
+            as_of=datetime.datetime.now(),
+            read_function=read_csv_with_weekly_period,
+        )
+        .set_index(data.index.names)
+        .sort_index()[["deaths"]],
+        data.sort_index()[["deaths"]],
+    )
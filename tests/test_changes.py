@@ -0,0 +1,175 @@
+import pytest
+
+from benchmarks.stub_eurostat import StubEurostat, get_synthetic_responses
+from mortality_monitor.cache import DataFrameFileCache
+from mortality_monitor.changes import (
+    PREVIOUS_DEATHS_COLUMN,
+    UnknownVersionError,
+    compute_changes,
+    get_changes_since,
+    prune_changes,
+    save_changes,
+)
+from mortality_monitor.constants import (
+    AGE_COLUMN,
+    DEATHS_COLUMN,
+    GEO_COLUMN,
+    PERIOD_COLUMN,
+)
+from mortality_monitor.export import format_week
+from mortality_monitor.refresh import refresh
+from mortality_monitor.snapshot import (
+    build_snapshot,
+    list_versions,
+    prune_snapshots,
+    publish_snapshot,
+)
+
+_REVISED_WEEKS_AGO = 10
+
+
+@pytest.fixture
+def last_period(snapshot):
+    return snapshot.periods.max()
+
+
+@pytest.fixture
+def build_version(mortality_data, population_data, last_period):
+    periods = mortality_data.index.get_level_values(0)
+
+    def _build_version(version, weeks_missing=0, revised_deaths=None):
+        data = mortality_data.loc[periods <= last_period - weeks_missing].copy()
+        if revised_deaths is not None:
+            data.iloc[
+                (
+                    data.index.get_level_values(0) == last_period - _REVISED_WEEKS_AGO
+                ).argmax(),
+                data.columns.get_loc(DEATHS_COLUMN),
+            ] = revised_deaths
+        return build_snapshot(
+            mortality_data=data, population_data=population_data, version=version
+        )
+
+    return _build_version
+
+
+def _get_revised_cell(snapshot):
+    revised_period = snapshot.periods.max() - _REVISED_WEEKS_AGO
+    return snapshot.deaths[0, 0, snapshot.periods.get_loc(revised_period)]
+
+
+def test_changes_contain_new_periods_and_revisions(size, last_period, build_version):
+    # given
+    previous = build_version(version="v1", weeks_missing=2, revised_deaths=1000.0)
+    current = build_version(version="v2")
+
+    # when
+    result = compute_changes(previous=previous, current=current)
+
+    # then
+    new_periods = [format_week(last_period - 1), format_week(last_period)]
+    assert (result["from_version"], result["to_version"]) == ("v1", "v2")
+    assert result["new_periods"] == new_periods
+    assert len(result["changes"]) == 1 + 2 * size.num_geos * size.num_ages
+    assert result["changes"][0] == {
+        GEO_COLUMN: size.geo_labels[0],
+        AGE_COLUMN: current.ages[0],
+        PERIOD_COLUMN: format_week(last_period - _REVISED_WEEKS_AGO),
+        PREVIOUS_DEATHS_COLUMN: 1000.0,
+        DEATHS_COLUMN: _get_revised_cell(current),
+    }
+    assert {
+        change[PERIOD_COLUMN]
+        for change in result["changes"]
+        if change[PREVIOUS_DEATHS_COLUMN] is None
+    } == set(new_periods)
+
+
+def test_changes_of_consecutive_refreshes_are_combined(tmp_path, size, build_version):
+    # given
+    snapshots = [
+        build_version(version="v1", weeks_missing=2),
+        build_version(version="v2", weeks_missing=1, revised_deaths=1000.0),
+        build_version(version="v3"),
+    ]
+    for previous, current in zip(snapshots, snapshots[1:]):
+        save_changes(
+            changes=compute_changes(previous=previous, current=current),
+            folder=str(tmp_path),
+        )
+
+    # when
+    result = get_changes_since(folder=str(tmp_path), version="v1", latest_version="v3")
+
+    # then
+    assert result == {
+        **compute_changes(previous=snapshots[0], current=snapshots[2]),
+        "changes": result["changes"],
+    }
+    assert len(result["changes"]) == 2 * size.num_geos * size.num_ages
+    assert all(change[PREVIOUS_DEATHS_COLUMN] is None for change in result["changes"])
+    assert get_changes_since(
+        folder=str(tmp_path), version="v2", latest_version="v3"
+    ) == compute_changes(previous=snapshots[1], current=snapshots[2])
+    assert (
+        get_changes_since(folder=str(tmp_path), version="v3", latest_version="v3")[
+            "changes"
+        ]
+        == []
+    )
+
+
+@pytest.mark.parametrize("version", ["v0", "v1", "../v1"])
+def test_changes_since_an_unknown_version_raise_error(tmp_path, version, build_version):
+    # given
+    save_changes(
+        changes=compute_changes(
+            previous=build_version(version="v1", weeks_missing=1),
+            current=build_version(version="v2"),
+        ),
+        folder=str(tmp_path),
+    )
+    prune_changes(folder=str(tmp_path), versions=["v2"] if version == "v1" else ["v1"])
+
+    # when / then
+    with pytest.raises(UnknownVersionError):
+        get_changes_since(folder=str(tmp_path), version=version, latest_version="v2")
+
+
+def test_refresh_records_changes_since_the_previous_snapshot(
+    tmp_path, size, build_version
+):
+    # given
+    folder = str(tmp_path / "snapshots")
+    previous_version = "20210101T000000-00000000"
+    publish_snapshot(snapshot=build_version(version=previous_version), folder=folder)
+    stub_eurostat = StubEurostat(responses=get_synthetic_responses(size=size))
+    stub_eurostat.start()
+
+    # when
+    try:
+        snapshot = refresh(
+            cache=DataFrameFileCache(
+                data_folder=str(tmp_path / "data"),
+                archive_folder=str(tmp_path / "archive"),
+            ),
+            snapshot_folder=folder,
+            base_url=stub_eurostat.base_url,
+        )
+    finally:
+        stub_eurostat.shutdown()
+        stub_eurostat.server_close()
+
+    # then
+    assert (
+        get_changes_since(
+            folder=folder, version=previous_version, latest_version=snapshot.version
+        )["to_version"]
+        == snapshot.version
+    )
+    prune_snapshots(folder=folder, keep=1)
+    prune_changes(folder=folder, versions=list_versions(folder=folder))
+    with pytest.raises(UnknownVersionError):
+        get_changes_since(
+            folder=folder, version=previous_version, latest_version=snapshot.version
+        )
@@ -0,0 +1,171 @@
+from time import sleep
+
+import pandas as pd
+import pytest
+
+from benchmarks.stub_eurostat import StubEurostat
+from benchmarks.synthetic_data import DatasetSize, generate_mortality_jsonstat
+from mortality_monitor.cache import DataFrameFileCache
+from mortality_monitor.eurostat import (
+    TableVersion,
+    _iter_in_background,
+    get_cached_mortality_data,
+    get_mortality_data,
+    get_table_version,
+    stream_mortality_data,
+)
+
+CACHE_TIMEOUT_TIME = 1 / (60 * 60 * 10)
+TABLE = "demo_r_mweek3"
+UPDATED = "2022-01-01T11:00:00+0100"
+
+
+def _get_response(updated):
+    response = generate_mortality_jsonstat(
+        size=DatasetSize(num_geos=2, num_ages=2, num_years=1)
+    )
+    response["updated"] = updated
+    return response
+
+
+@pytest.fixture
+def stub_eurostat():
+    server = StubEurostat(responses={TABLE: _get_response(updated=UPDATED)})
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_get_table_version_reads_update_metadata(stub_eurostat):
+    # when
+    result = get_table_version(
+        table=TABLE,
+        geos=("SE",),
+        ages=("Y_LT5",),
+        base_url=stub_eurostat.base_url,
+    )
+
+    # then
+    assert result == TableVersion(
+        updated=UPDATED, etag=stub_eurostat.get_etag(table=TABLE), last_modified=None
+    )
+    assert "lastTimePeriod=1" in stub_eurostat.requested_paths[0]
+
+
+def test_get_table_version_returns_known_version_if_not_modified(stub_eurostat):
+    # given
+    known_version = TableVersion(
+        updated="known", etag=stub_eurostat.get_etag(table=TABLE)
+    )
+
+    # when
+    result = get_table_version(
+        table=TABLE,
+        geos=("SE",),
+        ages=("Y_LT5",),
+        known_version=known_version,
+        base_url=stub_eurostat.base_url,
+    )
+
+    # then
+    assert result == known_version
+
+
+def test_cached_data_is_not_downloaded_again_if_table_is_unchanged(
+    stub_eurostat, tmp_path
+):
+    # given
+    cache = DataFrameFileCache(
+        data_folder=str(tmp_path / "data"),
+        archive_folder=str(tmp_path / "archive"),
+        timeout_hours=CACHE_TIMEOUT_TIME,
+    )
+    data = get_cached_mortality_data(
+        cache=cache, filename="mortality_data", base_url=stub_eurostat.base_url
+    )
+    stub_eurostat.requested_paths.clear()
+    sleep(0.1)
+
+    # when
+    result = get_cached_mortality_data(
+        cache=cache, filename="mortality_data", base_url=stub_eurostat.base_url
+    )
+
+    # then
+    assert len(stub_eurostat.requested_paths) == 1
+    assert "lastTimePeriod=1" in stub_eurostat.requested_paths[0]
+    assert len(cache.list_archived_versions(filename="mortality_data")) == 1
+    assert len(result) == len(data)
+
+
+def test_cached_data_is_downloaded_again_if_table_was_updated(stub_eurostat, tmp_path):
+    # given
+    cache = DataFrameFileCache(
+        data_folder=str(tmp_path / "data"),
+        archive_folder=str(tmp_path / "archive"),
+        timeout_hours=CACHE_TIMEOUT_TIME,
+    )
+    get_cached_mortality_data(
+        cache=cache, filename="mortality_data", base_url=stub_eurostat.base_url
+    )
+    updated = "2022-01-08T11:00:00+0100"
+    stub_eurostat.set_response(table=TABLE, response=_get_response(updated=updated))
+    stub_eurostat.requested_paths.clear()
+    sleep(0.1)
+
+    # when
+    result = get_cached_mortality_data(
+        cache=cache, filename="mortality_data", base_url=stub_eurostat.base_url
+    )
+
+    # then
+    assert len(stub_eurostat.requested_paths) == 2
+    assert cache.get_metadata(filename="mortality_data")["updated"] == updated
+    assert len(cache.list_archived_versions(filename="mortality_data")) == 2
+    assert isinstance(result, pd.DataFrame)
+
+
+def test_table_versions_with_different_etags_are_not_the_same():
+    # given
+    version = TableVersion(updated=UPDATED, etag='"a"')
+
+    # when and then
+    assert version.is_same_as(TableVersion(updated=UPDATED, etag='"a"'))
+    assert version.is_same_as(TableVersion(updated=UPDATED))
+    assert not version.is_same_as(TableVersion(updated=UPDATED, etag='"b"'))
+    assert not TableVersion(etag='"a"').is_same_as(TableVersion(etag='"a"'))
+
+
+def test_stream_mortality_data_matches_get_mortality_data(stub_eurostat):
+    # given
+    expected = get_mortality_data(
+        geos=("SE",), ages=("Y_LT5",), base_url=stub_eurostat.base_url
+    )
+
+    # when
+    result = list(
+        stream_mortality_data(
+            geos=("SE",), ages=("Y_LT5",), base_url=stub_eurostat.base_url
+        )
+    )
+
+    # then
+    assert len(result) == 2
+    assert all(chunk.index.get_level_values(1).nunique() == 1 for chunk in result)
+    pd.testing.assert_frame_equal(pd.concat(result).sort_index(), expected.sort_index())
+
+
+def test_iter_in_background_forwards_errors_of_the_producer():
+    # given
+    def items():
+        yield 1
+        raise ConnectionError("Download interrupted.")
+
+    # when
+    result = _iter_in_background(items=items(), max_queued=1)
+
+    # then
+    assert next(result) == 1
+    with pytest.raises(ConnectionError):
+        next(result)
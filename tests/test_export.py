@@ -0,0 +1,101 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mortality_monitor.constants import (
+    AGE_COLUMN,
+    DEATHS_COLUMN,
+    DEATHS_PER_MILLION_COLUMN,
+    GEO_COLUMN,
+    PERIOD_COLUMN,
+)
+from mortality_monitor.deaths import get_deaths_per_million
+from mortality_monitor.export import (
+    EXPECTED_DEATHS_COLUMN,
+    EXPORT_COLUMNS,
+    iter_export_csv,
+    parse_week,
+)
+from mortality_monitor.util import get_data_age
+
+
+def _read_export(chunks) -> pd.DataFrame:
+    return pd.read_csv(io.StringIO("".join(chunks)))
+
+
+def test_export_yields_header_and_one_chunk_per_geo(snapshot, size):
+    # when
+    result = list(iter_export_csv(snapshot=snapshot))
+
+    # then
+    assert result[0] == ",".join(EXPORT_COLUMNS) + "\n"
+    assert len(result) == 1 + size.num_geos
+    assert _read_export(result).groupby(GEO_COLUMN).ngroups == size.num_geos
+
+
+def test_export_contains_all_deaths_and_per_million_values(
+    snapshot, size, mortality_data, population_data
+):
+    # given
+    geo, age = size.geo_labels[1], size.age_codes[0]
+
+    # when
+    result = _read_export(iter_export_csv(snapshot=snapshot))
+
+    # then
+    assert len(result) == len(mortality_data)
+    assert result[DEATHS_COLUMN].sum() == pytest.approx(
+        mortality_data[DEATHS_COLUMN].sum()
+    )
+    rows = result.loc[
+        (result[GEO_COLUMN] == geo) & (result[AGE_COLUMN] == get_data_age(age))
+    ]
+    expected = get_deaths_per_million(
+        mortality_data=mortality_data,
+        population_data=population_data,
+        geo=geo,
+        ages=(age,),
+    )
+    np.testing.assert_allclose(
+        rows[DEATHS_PER_MILLION_COLUMN].values, expected.values, atol=1e-3
+    )
+    assert rows[EXPECTED_DEATHS_COLUMN].notna().all()
+
+
+def test_export_applies_filters(snapshot, size):
+    # given
+    geo, age = size.geo_labels[2], size.age_codes[1]
+
+    # when
+    result = _read_export(
+        iter_export_csv(
+            snapshot=snapshot,
+            geos=[geo],
+            ages=[age],
+            start=parse_week("2019-W10"),
+            end=parse_week("2019-W19"),
+        )
+    )
+
+    # then
+    assert set(result[GEO_COLUMN]) == {geo}
+    assert set(result[AGE_COLUMN]) == {get_data_age(age)}
+    assert set(result[PERIOD_COLUMN]) <= {f"2019-W{week}" for week in range(10, 20)}
+    assert len(result) > 0
+
+
+def test_export_raises_error_for_unknown_geo(snapshot):
+    # when and then
+    with pytest.raises(KeyError):
+        iter_export_csv(snapshot=snapshot, geos=["Atlantis"])
+
+
+def test_parse_week_reads_eurostat_weeks():
+    # when
+    result = parse_week("2021-W05")
+
+    # then
+    assert result == pd.Period("2021-02-01", freq="W")
+    assert result.week == 5
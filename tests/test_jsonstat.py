@@ -0,0 +1,176 @@
+import json
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic_data import DatasetSize, generate_mortality_jsonstat
+from mortality_monitor.jsonstat import (
+    StreamDecoder,
+    decode_stream,
+    get_category_labels,
+    read_values,
+)
+
+DATASET = generate_mortality_jsonstat(
+    size=DatasetSize(num_geos=2, num_ages=3, num_years=2)
+)
+
+
+def _split(content, chunk_bytes):
+    return [content[i : i + chunk_bytes] for i in range(0, len(content), chunk_bytes)]
+
+
+@pytest.mark.parametrize(("chunk_bytes"), [1, 7, 4096])
+def test_decode_stream_matches_json_decoding(chunk_bytes):
+    # given
+    content = json.dumps(DATASET, indent=1).encode()
+
+    # when
+    result = decode_stream(_split(content, chunk_bytes=chunk_bytes))
+
+    # then
+    indices, values = read_values(values=DATASET["value"])
+    assert result.fields == {
+        key: value for key, value in DATASET.items() if key not in ("value", "status")
+    }
+    np.testing.assert_array_equal(result.indices, indices)
+    np.testing.assert_array_equal(result.values, values)
+
+
+def test_decode_stream_reads_dense_values_and_multibyte_labels():
+    # given
+    dataset = {
+        "value": [1.5, None, 3],
+        "id": ["geo"],
+        "size": [3],
+        "dimension": {
+            "geo": {
+                "category": {"index": ["AT", "DE", "SE"], "label": {"AT": "Österreich"}}
+            }
+        },
+    }
+
+    # when
+    result = decode_stream(_split(json.dumps(dataset, ensure_ascii=False).encode(), 1))
+
+    # then
+    np.testing.assert_array_equal(result.indices, [0, 1, 2])
+    np.testing.assert_array_equal(result.values, [1.5, np.nan, 3.0])
+    assert get_category_labels(dataset=result.fields, dimension_id="geo") == [
+        "Österreich",
+        "DE",
+        "SE",
+    ]
+
+
+@pytest.mark.parametrize(("chunk_bytes"), [1, 7, 4096])
+def test_decode_stream_skips_status_and_extension(chunk_bytes):
+    # given
+    dataset = {
+        "value": {"0": 1.5, "2": 3},
+        "status": {"0": "p", "2": "e"},
+        "id": ["geo"],
+        "size": [3],
+        "dimension": {"geo": {"category": {"index": ["AT", "DE", "SE"]}}},
+        "extension": {"annotation": [{"title": 'Braces {[, quotes \\" in text'}]},
+        "label": "Deaths",
+    }
+
+    # when
+    result = decode_stream(_split(json.dumps(dataset).encode(), chunk_bytes))
+
+    # then
+    assert result.fields == {
+        "id": ["geo"],
+        "size": [3],
+        "dimension": {"geo": {"category": {"index": ["AT", "DE", "SE"]}}},
+        "label": "Deaths",
+    }
+    np.testing.assert_array_equal(result.indices, [0, 2])
+    np.testing.assert_array_equal(result.values, [1.5, 3.0])
+
+
+def test_decoder_does_not_keep_skipped_fields_while_they_arrive():
+    # given
+    status = json.dumps({str(i): "p" for i in range(10000)}).encode()
+    decoder = StreamDecoder()
+    decoder.feed(b'{"id": ["geo"], "status": ')
+
+    # when
+    for chunk in _split(status, 100):
+        decoder.feed(chunk)
+
+    # then
+    assert len(decoder._buffer) - decoder._position <= 100
+    decoder.feed(b', "size": [1]}')
+    assert decoder.close().fields == {"id": ["geo"], "size": [1]}
+
+
+@pytest.mark.parametrize("status", ['"p"', "3", "null", '["p", "e"]'])
+def test_decoder_skips_status_of_any_type(status):
+    # given
+    content = f'{{"status": {status}, "id": ["geo"], "status": {status}}}'
+
+    # when
+    result = decode_stream([content.encode()])
+
+    # then
+    assert result.fields == {"id": ["geo"]}
+
+
+def test_decoder_raises_error_if_response_ends_prematurely():
+    # given
+    decoder = StreamDecoder()
+    decoder.feed(json.dumps(DATASET).encode()[:-100])
+
+    # when and then
+    with pytest.raises(ValueError):
+        decoder.close()
+
+
+def test_decoder_hands_out_complete_blocks_while_values_arrive():
+    # given
+    layout = {key: value for key, value in DATASET.items() if key != "value"}
+    content = json.dumps({**layout, "value": DATASET["value"]}).encode()
+    values_end = content.index(b"}", content.index(b'"value"'))
+    decoder = StreamDecoder(block_dimension="age")
+
+    # when
+    blocks_during_values = [
+        block
+        for chunk in _split(content[:values_end], chunk_bytes=64)
+        for block in decoder.feed(chunk)
+    ]
+    blocks = blocks_during_values + decoder.feed(content[values_end:])
+    rest = decoder.close()
+
+    # then
+    indices, values = read_values(values=DATASET["value"])
+    num_inner = int(np.prod(DATASET["size"][DATASET["id"].index("age") + 1 :]))
+    assert len(blocks_during_values) == 2
+    assert [set(block.indices // num_inner) for block in blocks] == [{0}, {1}, {2}]
+    assert len(rest.indices) == 0
+    np.testing.assert_array_equal(
+        np.concatenate([block.indices for block in blocks]), indices
+    )
+    np.testing.assert_array_equal(
+        np.concatenate([block.values for block in blocks]), values
+    )
+
+
+def test_decoder_hands_out_blocks_once_the_dimensions_follow_the_values():
+    # given
+    content = json.dumps(DATASET).encode()
+    decoder = StreamDecoder(block_dimension="geo")
+    values_end = content.index(b"}", content.index(b'"value"'))
+
+    # when
+    blocks_during_values = decoder.feed(content[: values_end + 1])
+    blocks = decoder.feed(content[values_end + 1 :])
+    rest = decoder.close()
+
+    # then
+    assert blocks_during_values == []
+    assert len(blocks) == 2
+    assert sum(len(block.indices) for block in blocks) == len(DATASET["value"])
+    assert len(rest.indices) == 0
@@ -0,0 +1,138 @@
+import dataclasses
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mortality_monitor.constants import AGE_COLUMN, DEATHS_COLUMN, GEO_COLUMN
+from mortality_monitor.export import EXPECTED_DEATHS_COLUMN
+from mortality_monitor.leaderboard import (
+    EXCESS_DEATHS_COLUMN,
+    RELATIVE_EXCESS_DEATHS_COLUMN,
+    _get_running_totals,
+    get_leaderboard_payload,
+)
+from mortality_monitor.models import get_model
+
+START = pd.Period("2020-01-06", freq="W")
+END = pd.Period("2020-12-28", freq="W")
+
+
+def _in_range(series):
+    return series.loc[(series.index >= START) & (series.index <= END)]
+
+
+def test_leaderboard_matches_per_geo_excess_deaths(snapshot, size):
+    # given
+    geo = size.geo_labels[1]
+
+    # when
+    result = get_leaderboard_payload(snapshot=snapshot, start=START, end=END)
+
+    # then
+    row = next(row for row in result["rows"] if row[GEO_COLUMN] == geo)
+    deaths = _in_range(snapshot.get_deaths(geo=geo, ages=size.age_codes)).sum()
+    expected_deaths = _in_range(
+        snapshot.get_expected_deaths(geo=geo, ages=size.age_codes)
+    ).sum()
+    assert len(result["rows"]) == size.num_geos
+    assert row[DEATHS_COLUMN] == round(deaths)
+    assert row[EXPECTED_DEATHS_COLUMN] == round(expected_deaths)
+    assert row[EXCESS_DEATHS_COLUMN] == round(deaths - expected_deaths)
+    assert row[RELATIVE_EXCESS_DEATHS_COLUMN] == pytest.approx(
+        (deaths - expected_deaths) / expected_deaths, abs=1e-4
+    )
+
+
+def test_leaderboard_by_age_matches_model_per_series(snapshot, size):
+    # given
+    geo, age = size.geo_labels[2], size.age_codes[1]
+    model = get_model("seasonal_mean", lookback_years=3)
+
+    # when
+    result = get_leaderboard_payload(
+        snapshot=snapshot, start=START, end=END, by_age=True, model=model
+    )
+
+    # then
+    row = next(
+        row
+        for row in result["rows"]
+        if (row[GEO_COLUMN], row[AGE_COLUMN]) == (geo, snapshot.ages[1])
+    )
+    expected_deaths = _in_range(
+        snapshot.get_expected_deaths(geo=geo, ages=[age], model=model)
+    ).sum()
+    assert len(result["rows"]) == size.num_geos * size.num_ages
+    assert row[EXPECTED_DEATHS_COLUMN] == round(expected_deaths)
+
+
+def test_leaderboard_is_sorted_by_relative_excess_deaths(snapshot):
+    # when
+    result = get_leaderboard_payload(snapshot=snapshot, by_age=True)
+
+    # then
+    relative_excess_deaths = [
+        row[RELATIVE_EXCESS_DEATHS_COLUMN] for row in result["rows"]
+    ]
+    assert relative_excess_deaths == sorted(relative_excess_deaths, reverse=True)
+    assert result["start"] == "{}-W{:02d}".format(
+        *snapshot.periods[0].end_time.isocalendar()[:2]
+    )
+
+
+def test_leaderboard_reuses_running_totals_of_the_same_version(snapshot):
+    # given
+    get_leaderboard_payload(snapshot=snapshot)
+    hits = _get_running_totals.cache_info().hits
+
+    # when
+    get_leaderboard_payload(snapshot=snapshot, start=START)
+    get_leaderboard_payload(snapshot=snapshot, end=END)
+
+    # then
+    assert _get_running_totals.cache_info().hits == hits + 2
+
+
+def test_leaderboard_raises_error_if_range_is_empty(snapshot):
+    with pytest.raises(ValueError):
+        get_leaderboard_payload(snapshot=snapshot, start=END, end=START)
+
+
+def test_leaderboard_counts_only_weeks_with_deaths(snapshot):
+    # when
+    result = get_leaderboard_payload(snapshot=snapshot, start=START, end=END)
+
+    # then
+    assert all(0 < row["weeks"] <= 52 for row in result["rows"])
+    assert np.isfinite([row[EXCESS_DEATHS_COLUMN] for row in result["rows"]]).all()
+
+
+def test_leaderboard_drops_running_totals_of_older_versions(snapshot):
+    # given
+    newer_snapshot = dataclasses.replace(snapshot, version="v2")
+    get_leaderboard_payload(snapshot=snapshot)
+    get_leaderboard_payload(snapshot=snapshot, by_age=True)
+
+    # when
+    get_leaderboard_payload(snapshot=newer_snapshot)
+
+    # then
+    assert _get_running_totals.cache_info().currsize == 1
+
+
+def test_leaderboard_leaves_out_the_weeks_the_model_bootstraps_from(snapshot):
+    # given
+    prediction = snapshot.predict(model=get_model())
+    observed = ~np.isnan(snapshot.get_summed_deaths())
+
+    # when
+    result = get_leaderboard_payload(snapshot=snapshot)
+
+    # then
+    for row in result["rows"]:
+        i = snapshot.geos.index(row[GEO_COLUMN])
+        assert 0 < row["weeks"] == prediction.is_predicted[i].sum() < observed[i].sum()
+        assert row[EXPECTED_DEATHS_COLUMN] == round(
+            prediction.expected[i, prediction.is_predicted[i]].sum()
+        )
@@ -0,0 +1,108 @@
+import random
+import time
+
+import pytest
+import requests
+
+from benchmarks.load_test import (
+    ALL_ROUTES,
+    generate_session,
+    measure_refresh,
+    summarize,
+)
+from benchmarks.stub_eurostat import StubEurostat, get_synthetic_responses
+from benchmarks.synthetic_data import DatasetSize
+from mortality_monitor.constants import AGE_COLUMN
+from mortality_monitor.snapshot import load_latest_snapshot
+from mortality_monitor.util import QUERY_AGES
+
+SIZE = DatasetSize(num_geos=2, num_ages=3, num_years=6)
+TABLE = "demo_r_mweek3"
+
+
+@pytest.fixture
+def stub_eurostat():
+    server = StubEurostat(responses=get_synthetic_responses(size=SIZE))
+    server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_stub_answers_conditional_requests(stub_eurostat):
+    # given
+    url = stub_eurostat.base_url.format(table=TABLE) + "&lastTimePeriod=1"
+    response = requests.get(url)
+
+    # when
+    result = requests.get(url, headers={"If-None-Match": response.headers["ETag"]})
+
+    # then
+    assert response.json()["updated"].startswith("2022-01-01")
+    assert result.status_code == 304
+    assert requests.get(stub_eurostat.base_url.format(table="x")).status_code == 404
+
+
+def test_stub_delays_responses(stub_eurostat):
+    # given
+    stub_eurostat.latency_seconds = 0.2
+    start = time.perf_counter()
+
+    # when
+    requests.get(stub_eurostat.base_url.format(table=TABLE))
+
+    # then
+    assert time.perf_counter() - start >= 0.2
+
+
+def test_generate_session_reproduces_frontend_requests():
+    # when
+    result = generate_session(
+        rng=random.Random(0),
+        geos=["Sweden", "Finland"],
+        ages=list(QUERY_AGES),
+        years=[2021, 2020],
+        num_queries=20,
+    )
+
+    # then
+    assert [request.route for request in result[:3]] == [
+        "/available_geos",
+        "/available_ages",
+        "/available_years",
+    ]
+    assert [request.route for request in result[3:5]] == [
+        "/excess_deaths",
+        "/yearly_deaths",
+    ]
+    assert len(result) == 3 + 2 * 20
+    assert all(len(request.payload[AGE_COLUMN]) > 0 for request in result[3:])
+    assert len({tuple(request.payload[AGE_COLUMN]) for request in result[3:]}) > 1
+
+
+def test_summarize_computes_throughput_and_percentiles():
+    # given
+    latencies = {"/a": [i / 100 for i in range(1, 101)], "/b": [0.5, 0.5]}
+
+    # when
+    result = summarize(latencies=latencies, errors={"/b": 1}, elapsed_seconds=2.0)
+
+    # then
+    assert result["/a"].requests == 100
+    assert result["/a"].throughput == 50.0
+    assert result["/a"].p50_seconds == pytest.approx(0.505)
+    assert result["/a"].p99_seconds == pytest.approx(0.9901)
+    assert result["/b"].throughput == 0.5
+    assert result[ALL_ROUTES].requests == 102
+    assert result[ALL_ROUTES].errors == 1
+
+
+def test_measure_refresh_publishes_snapshot_from_stub(stub_eurostat, tmp_path):
+    # when
+    result = measure_refresh(base_url=stub_eurostat.base_url, folder=str(tmp_path))
+
+    # then
+    assert result["cold_refresh_seconds"] > 0
+    assert result["warm_refresh_seconds"] > 0
+    assert len(stub_eurostat.requested_paths) == 4
+    assert len(load_latest_snapshot(folder=str(tmp_path / "snapshots")).geos) == 2
@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from statistics import mean, stdev
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_data import DatasetSize, generate_mortality_data
+from mortality_monitor import models
+from mortality_monitor.deaths import get_deaths
+from mortality_monitor.models import (
+    DEFAULT_MODEL,
+    PastAveragePlusGrowth,
+    SeasonalMean,
+    get_model,
+    get_model_names,
+)
+
+SIZE = DatasetSize(num_geos=3, num_ages=2, num_years=7)
+MORTALITY_DATA = generate_mortality_data(size=SIZE, missing_fraction=0.05)
+AGES = SIZE.age_codes[:1]
+
+
+def _get_reference_expected_deaths(deaths: pd.Series, lookback_years: int) -> list:
+    """Predicts one period after another like the original, unbatched model did."""
+    expected = deaths.tolist()
+    for position in range(lookback_years * 52, len(deaths)):
+        period = deaths.index[position]
+        prior_periods = [period - 52 * (i + 1) for i in range(lookback_years)]
+        starts = [
+            start
+            for start in prior_periods
+            if (start - 52).year >= deaths.index.min().year
+        ]
+        yearly_values = [
+            deaths.loc[(deaths.index >= start - 52) & (deaths.index < start)].sum()
+            for start in starts
+        ]
+        weekly_values = deaths.loc[deaths.index.isin(prior_periods)].tolist()
+        bound = stdev(weekly_values) + 1
+        inliers = [
+            value
+            for value in weekly_values
+            if mean(weekly_values) - bound < value < mean(weekly_values) + bound
+        ]
+        polyfit = np.polyfit(
+            x=[(start - 52).year for start in starts], y=yearly_values, deg=1
+        )
+        expected[position] = (
+            np.mean(inliers) * np.polyval(p=polyfit, x=period.year) / yearly_values[0]
+        )
+    return expected
+
+
+def _to_matrix(deaths: tuple[pd.Series, ...]) -> tuple[np.ndarray, pd.PeriodIndex]:
+    periods = pd.period_range(
+        start=min(series.index.min() for series in deaths),
+        end=max(series.index.max() for series in deaths),
+        freq="W",
+    )
+    matrix = np.full((len(deaths), len(periods)), np.nan)
+    for i, series in enumerate(deaths):
+        matrix[i, periods.get_indexer(series.index)] = series.values
+    return matrix, periods
+
+
+@pytest.mark.parametrize(("lookback_years"), [4, 5])
+def test_past_average_plus_growth_matches_unbatched_predictions(lookback_years):
+    # given
+    deaths = tuple(
+        get_deaths(mortality_data=MORTALITY_DATA, geo=geo, ages=AGES)
+        for geo in SIZE.geo_labels
+    )
+    matrix, periods = _to_matrix(deaths)
+
+    # when
+    result = PastAveragePlusGrowth(lookback_years=lookback_years).predict(
+        deaths=matrix, periods=periods
+    )
+
+    # then
+    for i, series in enumerate(deaths):
+        np.testing.assert_allclose(
+            result.expected[i, periods.get_indexer(series.index)],
+            _get_reference_expected_deaths(
+                deaths=series, lookback_years=lookback_years
+            ),
+            rtol=1e-9,
+        )
+    assert np.isnan(result.expected[np.isnan(matrix)]).all()
+
+
+def test_seasonal_mean_averages_prior_years():
+    # given
+    periods = pd.period_range(start="2015-01-05", periods=3 * 52 + 1, freq="W")
+    matrix = np.arange(len(periods), dtype=float)[np.newaxis]
+
+    # when
+    result = SeasonalMean(lookback_years=2).predict(deaths=matrix, periods=periods)
+
+    # then
+    assert result.expected[0, -1] == (52 + 104) / 2
+    assert result.expected[0, 50] == 50
+    assert result.lower[0, -1] < result.expected[0, -1] < result.upper[0, -1]
+
+
+def test_prediction_band_contains_expected_deaths():
+    # given
+    matrix, periods = _to_matrix(
+        tuple(
+            get_deaths(mortality_data=MORTALITY_DATA, geo=geo, ages=SIZE.age_codes)
+            for geo in SIZE.geo_labels
+        )
+    )
+
+    # when
+    result = get_model().predict(deaths=matrix, periods=periods)
+
+    # then
+    has_data = ~np.isnan(matrix)
+    assert (result.lower[has_data] <= result.expected[has_data]).all()
+    assert (result.expected[has_data] <= result.upper[has_data]).all()
+    assert (result.upper[:, -52:] > result.lower[:, -52:])[has_data[:, -52:]].all()
+
+
+def test_get_model_creates_registered_model_with_parameters(monkeypatch):
+    # given
+    monkeypatch.setitem(models._MODELS, "last_three_years", SeasonalMean)
+
+    # when
+    result = get_model("last_three_years", lookback_years=3)
+
+    # then
+    assert result == SeasonalMean(lookback_years=3)
+    assert DEFAULT_MODEL in get_model_names()
+
+
+@pytest.mark.parametrize(
+    ("name", "parameters", "error"),
+    [
+        ("unknown", {}, KeyError),
+        (DEFAULT_MODEL, {"unknown": 1}, TypeError),
+        (DEFAULT_MODEL, {"lookback_years": 0}, ValueError),
+        (DEFAULT_MODEL, {"lookback_years": 20001}, ValueError),
+        (DEFAULT_MODEL, {"lookback_years": True}, ValueError),
+        (DEFAULT_MODEL, {"lookback_years": 3.0}, ValueError),
+    ],
+)
+def test_get_model_raises_error_for_invalid_models(name, parameters, error):
+    # when and then
+    with pytest.raises(error):
+        get_model(name, **parameters)
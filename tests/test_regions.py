@@ -0,0 +1,283 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.stub_eurostat import StubEurostat, get_synthetic_responses
+from benchmarks.synthetic_data import (
+    DatasetSize,
+    generate_mortality_data,
+    generate_mortality_jsonstat,
+)
+from mortality_monitor.cache import DataFrameFileCache
+from mortality_monitor.constants import (
+    AGE_COLUMN,
+    DEATHS_COLUMN,
+    EU_AGGREGATE,
+    GEO_COLUMN,
+    PERIOD_COLUMN,
+    POPULATION_COLUMN,
+)
+from mortality_monitor.deaths import get_deaths
+from mortality_monitor.refresh import refresh
+from mortality_monitor.regions import (
+    SparseDeaths,
+    get_nuts_level,
+    get_parent_geo,
+    is_nuts_code,
+    with_parent_population_totals,
+)
+
+PERIODS = pd.period_range(start="2021-01-04", periods=3, freq="W")
+AGES = {"Y_LT5": "Less than 5 years", "Y5-9": "From 5 to 9 years"}
+REGIONS = ("SE110", "SE121", "SE122")
+
+
+def _regional_data(missing=()):
+    return pd.DataFrame(
+        [
+            {
+                PERIOD_COLUMN: period,
+                GEO_COLUMN: geo,
+                AGE_COLUMN: age,
+                DEATHS_COLUMN: float(10 * i + j),
+            }
+            for i, geo in enumerate(("SE110", "SE121", "SE122", "FI1B1", "NO011"))
+            for j, period in enumerate(PERIODS)
+            for age in AGES.values()
+            if (geo, period) not in missing
+        ]
+    ).set_index([PERIOD_COLUMN, GEO_COLUMN, AGE_COLUMN])
+
+
+@pytest.mark.parametrize(
+    ("geo", "level", "parent"),
+    [
+        ("SE110", 3, "SE11"),
+        ("SE11", 2, "SE1"),
+        ("SE1", 1, "SE"),
+        ("SE", 0, EU_AGGREGATE),
+        ("NO", 0, None),
+    ],
+)
+def test_nuts_hierarchy(geo, level, parent):
+    # when and then
+    assert get_nuts_level(geo=geo) == level
+    assert get_parent_geo(geo=geo) == parent
+
+
+@pytest.mark.parametrize(("geo"), [EU_AGGREGATE, "EA20", "G0000", "se110"])
+def test_aggregates_and_unknown_codes_are_not_nuts_codes(geo):
+    # when and then
+    assert not is_nuts_code(geo=geo)
+    assert get_parent_geo(geo=geo) is None
+    with pytest.raises(ValueError):
+        get_nuts_level(geo=geo)
+
+
+def test_from_jsonstat_matches_long_format_data():
+    # given
+    size = DatasetSize(num_geos=3, num_ages=3, num_years=2)
+    data = generate_mortality_data(size=size, missing_fraction=0.2)
+
+    # when
+    result = SparseDeaths.from_jsonstat(
+        generate_mortality_jsonstat(size=size, missing_fraction=0.2)
+    )
+
+    # then
+    expected = SparseDeaths.from_frame(data)
+    assert result.geos == size.geo_codes
+    assert result.ages == expected.ages
+    pd.testing.assert_index_equal(result.periods, expected.periods)
+    np.testing.assert_array_equal(result.values, expected.values)
+    np.testing.assert_array_equal(result.period_indices, expected.period_indices)
+    assert result.density < 0.9
+
+
+def test_get_deaths_matches_long_format_data():
+    # given
+    data = _regional_data(missing=(("SE121", PERIODS[1]),))
+
+    # when
+    result = SparseDeaths.from_frame(data).get_deaths(geo="SE121", ages=AGES)
+
+    # then
+    expected = get_deaths(mortality_data=data, geo="SE121", ages=tuple(AGES))
+    pd.testing.assert_series_equal(result, expected, check_freq=False)
+
+
+def test_with_parent_totals_aggregates_up_to_the_eu():
+    # given
+    sparse_deaths = SparseDeaths.from_frame(_regional_data())
+
+    # when
+    result = sparse_deaths.with_parent_totals()
+
+    # then
+    se_deaths = result.get_deaths(geo="SE", ages=AGES)
+    eu_deaths = result.get_deaths(geo=EU_AGGREGATE, ages=AGES)
+    assert se_deaths.tolist() == [
+        2 * (0 + 10 + 20),
+        2 * (1 + 11 + 21),
+        2 * (2 + 12 + 22),
+    ]
+    assert (
+        eu_deaths.tolist()
+        == (se_deaths + result.get_deaths(geo="FI", ages=AGES)).tolist()
+    )
+    assert "NO" in result.geos
+    assert "SE12" in result.geos
+
+
+def test_with_parent_totals_replaces_aggregates_in_the_data():
+    # given
+    data = _regional_data()
+    aggregates = (
+        data.xs("SE110", level=GEO_COLUMN, drop_level=False)
+        .rename(index={"SE110": EU_AGGREGATE})
+        .assign(**{DEATHS_COLUMN: 1e6})
+    )
+    sparse_deaths = SparseDeaths.from_frame(pd.concat([data, aggregates]))
+
+    # when
+    result = sparse_deaths.with_parent_totals()
+
+    # then
+    assert set(REGIONS) < set(result.geos)
+    assert result.get_deaths(geo=EU_AGGREGATE, ages=AGES).max() < 1e6
+
+
+def test_with_parent_totals_drops_incomplete_parent_values():
+    # given
+    sparse_deaths = SparseDeaths.from_frame(
+        _regional_data(missing=(("SE122", PERIODS[1]),))
+    )
+
+    # when
+    result = sparse_deaths.with_parent_totals()
+
+    # then
+    assert result.get_deaths(geo="SE12", ages=AGES).index.tolist() == [
+        PERIODS[0],
+        PERIODS[2],
+    ]
+    assert len(result.get_deaths(geo="SE", ages=AGES)) == 2
+
+
+def test_with_parent_totals_can_report_partial_sums():
+    # given
+    sparse_deaths = SparseDeaths.from_frame(
+        _regional_data(missing=(("SE122", PERIODS[1]),))
+    )
+
+    # when
+    result = sparse_deaths.with_parent_totals(require_complete=False)
+
+    # then
+    assert result.get_deaths(geo="SE12", ages=AGES).tolist() == [
+        2 * (10 + 20),
+        2 * 11,
+        2 * (12 + 22),
+    ]
+
+
+def test_saved_sparse_deaths_can_be_loaded(tmp_path):
+    # given
+    sparse_deaths = SparseDeaths.from_frame(_regional_data()).with_parent_totals()
+    path = str(tmp_path / "regional_deaths.npz")
+    sparse_deaths.save(path)
+
+    # when
+    result = SparseDeaths.load(path)
+
+    # then
+    assert result.geos == sparse_deaths.geos
+    pd.testing.assert_index_equal(result.periods, sparse_deaths.periods)
+    np.testing.assert_array_equal(result.to_dense(), sparse_deaths.to_dense())
+
+
+def test_with_parent_population_totals_sums_up_to_the_eu():
+    # given
+    population_data = pd.DataFrame(
+        {
+            PERIOD_COLUMN: pd.Period("2021", freq="Y"),
+            GEO_COLUMN: REGIONS + ("FI1B1",),
+            AGE_COLUMN: AGES["Y_LT5"],
+            POPULATION_COLUMN: [0.1, 0.2, 0.3, 0.4],
+        }
+    ).set_index([PERIOD_COLUMN, GEO_COLUMN, AGE_COLUMN])
+
+    # when
+    result = with_parent_population_totals(population_data)[POPULATION_COLUMN]
+
+    # then
+    population = result.droplevel([PERIOD_COLUMN, AGE_COLUMN])
+    assert population["SE12"] == pytest.approx(0.5)
+    assert population["SE"] == pytest.approx(0.6)
+    assert population[EU_AGGREGATE] == pytest.approx(1.0)
+    assert set(population.index) == set(REGIONS) | {
+        "FI1B1",
+        "SE11",
+        "SE12",
+        "FI1B",
+        "SE1",
+        "FI1",
+        "SE",
+        "FI",
+        EU_AGGREGATE,
+    }
+
+
+def _with_nuts_codes(response):
+    category = response["dimension"]["geo"]["category"]
+    codes = dict(zip(category["index"], REGIONS))
+    category["index"] = {codes[code]: i for code, i in category["index"].items()}
+    category["label"] = {
+        codes[code]: label for code, label in category["label"].items()
+    }
+    return response
+
+
+def test_refresh_publishes_regions_with_their_parents(tmp_path):
+    # given
+    responses = get_synthetic_responses(
+        size=DatasetSize(num_geos=len(REGIONS), num_ages=2, num_years=6)
+    )
+    stub_eurostat = StubEurostat(
+        responses={
+            table: _with_nuts_codes(response) for table, response in responses.items()
+        }
+    )
+    stub_eurostat.start()
+
+    # when
+    try:
+        result = refresh(
+            cache=DataFrameFileCache(
+                data_folder=str(tmp_path / "data"),
+                archive_folder=str(tmp_path / "archive"),
+            ),
+            snapshot_folder=str(tmp_path / "snapshots"),
+            base_url=stub_eurostat.base_url,
+            geo_level="nuts3",
+        )
+    finally:
+        stub_eurostat.shutdown()
+        stub_eurostat.server_close()
+
+    # then
+    assert set(result.geos) == set(REGIONS) | {
+        "SE11",
+        "SE12",
+        "SE1",
+        "SE",
+        EU_AGGREGATE,
+    }
+    assert "geoLevel=nuts3" in stub_eurostat.requested_paths[-1]
+    assert (tmp_path / "data" / "mortality_data_nuts3.csv").is_file()
+    se_index, region_indices = result.geos.index("SE"), [
+        result.geos.index(region) for region in REGIONS
+    ]
+    np.testing.assert_allclose(
+        result.population[se_index], result.population[region_indices].sum(axis=0)
+    )
@@ -0,0 +1,101 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from mortality_monitor.models import get_model
+from mortality_monitor.result_store import ResultStore
+from mortality_monitor.snapshot import Snapshot
+
+
+@pytest.fixture
+def geo(size):
+    return size.geo_labels[0]
+
+
+@pytest.fixture
+def ages(size):
+    return list(size.age_codes[:2])
+
+
+def test_stored_prediction_is_read_after_a_restart(
+    tmp_path, snapshot, geo, ages, forbid_call
+):
+    # given
+    path = str(tmp_path / "results.sqlite")
+    expected = snapshot.get_prediction(geo=geo, ages=ages)
+    ResultStore(path=path).get_prediction(snapshot=snapshot, geo=geo, ages=ages)
+    forbid_call(Snapshot, "get_prediction")
+
+    # when
+    result = ResultStore(path=path).get_prediction(
+        snapshot=snapshot, geo=geo, ages=ages[::-1]
+    )
+
+    # then
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_predictions_are_keyed_by_version_geo_ages_and_model(
+    tmp_path, snapshot, size, geo, ages
+):
+    # given
+    store = ResultStore(path=str(tmp_path / "results.sqlite"))
+
+    # when
+    for model in (None, get_model(), get_model(lookback_years=4)):
+        for geo_label in size.geo_labels:
+            store.get_prediction(
+                snapshot=snapshot, geo=geo_label, ages=ages, model=model
+            )
+    store.get_prediction(snapshot=snapshot, geo=geo, ages=ages[:1])
+
+    # then
+    assert store.get_size()[0] == 2 * len(size.geo_labels) + 1
+
+
+def test_least_recently_used_predictions_are_evicted(
+    tmp_path, monkeypatch, snapshot, geo, ages, forbid_call
+):
+    # given
+    store = ResultStore(path=str(tmp_path / "results.sqlite"))
+    store.get_prediction(snapshot=snapshot, geo=geo, ages=ages)
+    entry_bytes = store.get_size()[1]
+    store.max_bytes = 2 * entry_bytes
+    monkeypatch.setattr("mortality_monitor.result_store._TOUCH_INTERVAL_SECONDS", 0)
+    store.get_prediction(snapshot=snapshot, geo=geo, ages=ages[:1])
+    store.get_prediction(snapshot=snapshot, geo=geo, ages=ages)
+
+    # when
+    store.get_prediction(snapshot=snapshot, geo=geo, ages=ages[1:])
+
+    # then
+    assert store.get_size()[0] == 2
+    forbid_call(Snapshot, "get_prediction")
+    store.get_prediction(snapshot=snapshot, geo=geo, ages=ages)
+    store.get_prediction(snapshot=snapshot, geo=geo, ages=ages[1:])
+
+
+def test_database_runs_in_write_ahead_logging_mode(tmp_path, snapshot, geo, ages):
+    # given
+    path = str(tmp_path / "results.sqlite")
+
+    # when
+    ResultStore(path=path).get_prediction(snapshot=snapshot, geo=geo, ages=ages)
+
+    # then
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+def test_prediction_is_computed_if_the_store_is_unavailable(
+    tmp_path, snapshot, geo, ages
+):
+    # given
+    store = ResultStore(path=str(tmp_path))
+
+    # when
+    result = store.get_prediction(snapshot=snapshot, geo=geo, ages=ages)
+
+    # then
+    pd.testing.assert_frame_equal(result, snapshot.get_prediction(geo=geo, ages=ages))
@@ -0,0 +1,251 @@
+import importlib
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+from mortality_monitor.snapshot import publish_snapshot
+from mortality_monitor.startup import (
+    FAILED,
+    LOADING,
+    READY,
+    BackgroundLoader,
+    NotReadyError,
+)
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("numpy", "pandas", "pyjstat")
+MAX_IMPORT_SECONDS = 2.0
+MAX_FIRST_RESPONSE_SECONDS = 5.0
+MAX_READY_SECONDS = 60.0
+
+
+def _run_python(code, cwd):
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=cwd,
+        env={**os.environ, "PYTHONPATH": REPOSITORY},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+
+
+def _get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def published_snapshot(tmp_path, snapshot):
+    publish_snapshot(snapshot=snapshot, folder=str(tmp_path / "snapshots"))
+    return tmp_path
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    sys.modules.pop("mortality_monitor.server", None)
+    return importlib.import_module("mortality_monitor.server")
+
+
+def test_background_loader_reports_progress():
+    # given
+    release = threading.Event()
+
+    def load(report_stage):
+        report_stage("waiting")
+        release.wait()
+        return 42
+
+    loader = BackgroundLoader(load=load)
+
+    # when
+    loader.start()
+    time.sleep(0.05)
+    status = loader.get_status()
+    release.set()
+    loader.wait(timeout_seconds=5)
+
+    # then
+    assert (status.state, status.stage) == (LOADING, "waiting")
+    assert loader.get_status().state == READY
+    assert loader.get() == 42
+
+
+def test_background_loader_reports_error():
+    # given
+    def load(report_stage):
+        raise FileNotFoundError("nothing published")
+
+    loader = BackgroundLoader(load=load)
+
+    # when
+    loader.start()
+    loader.wait(timeout_seconds=5)
+
+    # then
+    assert loader.get_status().state == FAILED
+    assert loader.get_status().error == "FileNotFoundError: nothing published"
+    with pytest.raises(NotReadyError):
+        loader.get()
+
+
+def test_importing_server_does_not_import_heavy_modules(published_snapshot):
+    # when
+    result = _run_python(
+        "import sys, time\n"
+        "start = time.perf_counter()\n"
+        "import mortality_monitor.server\n"
+        "print(time.perf_counter() - start)\n"
+        f"print(*[name for name in {HEAVY_MODULES} if name in sys.modules])\n",
+        cwd=str(published_snapshot),
+    ).splitlines()
+
+    # then
+    assert float(result[0]) < MAX_IMPORT_SECONDS
+    assert result[1] == ""
+
+
+def test_server_answers_before_the_snapshot_is_loaded(published_snapshot, size):
+    # given
+    port = _get_free_port()
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "from mortality_monitor.server import app; "
+            f"app.run(host='127.0.0.1', port={port}, threaded=True)",
+        ],
+        cwd=str(published_snapshot),
+        env={**os.environ, "PYTHONPATH": REPOSITORY},
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        # when
+        health = None
+        while health is None and time.perf_counter() - start < MAX_READY_SECONDS:
+            try:
+                health = requests.get(f"{url}/health", timeout=1)
+            except requests.ConnectionError:
+                time.sleep(0.01)
+        first_response_seconds = time.perf_counter() - start
+        ages = requests.get(f"{url}/available_ages", timeout=1)
+        while requests.get(f"{url}/ready", timeout=1).status_code != 200:
+            assert time.perf_counter() - start < MAX_READY_SECONDS
+            time.sleep(0.05)
+        geos = requests.get(f"{url}/available_geos", timeout=1)
+    finally:
+        process.terminate()
+        process.wait()
+
+    # then
+    assert health.status_code == 200
+    assert first_response_seconds < MAX_FIRST_RESPONSE_SECONDS
+    assert ages.status_code == 200
+    assert geos.json() == list(size.geo_labels)
+
+
+def test_background_loader_retries_failed_loads():
+    # given
+    attempts = []
+
+    def load(report_stage):
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise FileNotFoundError("nothing published")
+        return 42
+
+    loader = BackgroundLoader(load=load, retry_seconds=0.01)
+
+    # when
+    loader.start()
+    loader.wait(timeout_seconds=5)
+    status_after_first_attempt = loader.get_status()
+    deadline = time.perf_counter() + 5
+    while loader.get_status().state != READY and time.perf_counter() < deadline:
+        time.sleep(0.01)
+
+    # then
+    assert status_after_first_attempt.attempts >= 1
+    assert loader.get_status().attempts == 3
+    assert loader.get_status().error is None
+    assert loader.get() == 42
+
+
+def test_routes_needing_the_snapshot_return_503_while_it_is_loading(
+    server, published_snapshot, monkeypatch, size
+):
+    # given
+    release = threading.Event()
+
+    def load(report_stage):
+        report_stage("waiting")
+        release.wait()
+        return server._load_snapshot(report_stage)
+
+    monkeypatch.setattr(server, "_loader", BackgroundLoader(load=load))
+    client = server.app.test_client()
+    server.start_loading()
+    while server._loader.get_status().stage != "waiting":
+        time.sleep(0.01)
+
+    # when
+    loading = client.get("/available_geos")
+    release.set()
+    ready = server.wait_until_ready(timeout_seconds=30)
+    geos = client.get("/available_geos")
+
+    # then
+    assert loading.status_code == 503
+    assert loading.json["state"] == LOADING
+    assert loading.json["stage"] == "waiting"
+    assert ready
+    assert geos.status_code == 200
+    assert geos.json == list(size.geo_labels)
+
+
+def test_routes_needing_the_snapshot_return_503_if_loading_failed(server):
+    # given
+    client = server.app.test_client()
+
+    # when
+    server.wait_until_ready(timeout_seconds=30)
+    ready = client.get("/ready")
+    geos = client.get("/available_geos")
+
+    # then
+    assert client.get("/health").status_code == 200
+    assert client.get("/available_ages").status_code == 200
+    assert ready.status_code == 503
+    assert ready.json["state"] == FAILED
+    assert ready.json["error"].startswith("FileNotFoundError")
+    assert geos.status_code == 503
+    assert geos.headers["Retry-After"] == "1"
+
+
+def test_changes_return_410_for_unknown_versions(server, published_snapshot):
+    # given
+    client = server.app.test_client()
+    server.wait_until_ready(timeout_seconds=30)
+
+    # when
+    unchanged = client.get("/changes?since=v1")
+    unknown = client.get("/changes?since=v0")
+
+    # then
+    assert unchanged.status_code == 200
+    assert unchanged.json["to_version"] == "v1"
+    assert unchanged.json["changes"] == []
+    assert unknown.status_code == 410
+    assert client.get("/changes").status_code == 400
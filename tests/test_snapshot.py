@@ -0,0 +1,189 @@
+import dataclasses
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mortality_monitor.deaths import get_deaths
+from mortality_monitor.expected_deaths import get_expected_deaths
+from mortality_monitor.models import get_model
+from mortality_monitor.payloads import get_excess_deaths_payload
+from mortality_monitor.snapshot import (
+    InvalidSnapshotError,
+    build_snapshot,
+    list_versions,
+    load_latest_snapshot,
+    prune_snapshots,
+    publish_snapshot,
+    validate_snapshot,
+)
+
+
+@pytest.fixture
+def geo(size):
+    return size.geo_labels[1]
+
+
+@pytest.mark.parametrize(("age_slice"), [slice(None), slice(1, 3)])
+def test_get_deaths_matches_long_format_data(
+    snapshot, size, mortality_data, geo, age_slice
+):
+    # given
+    ages = size.age_codes[age_slice]
+
+    # when
+    result = snapshot.get_deaths(geo=geo, ages=ages)
+
+    # then
+    expected = get_deaths(mortality_data=mortality_data, geo=geo, ages=ages)
+    pd.testing.assert_series_equal(result, expected, check_freq=False)
+
+
+@pytest.mark.parametrize(("age_slice"), [slice(None), slice(1, 3)])
+def test_get_expected_deaths_matches_model(
+    snapshot, size, mortality_data, geo, age_slice
+):
+    # given
+    ages = size.age_codes[age_slice]
+
+    # when
+    result = snapshot.get_expected_deaths(geo=geo, ages=ages)
+
+    # then
+    expected = get_expected_deaths(
+        deaths=get_deaths(mortality_data=mortality_data, geo=geo, ages=ages)
+    )
+    pd.testing.assert_series_equal(result, expected, check_freq=False)
+
+
+def test_prediction_for_all_ages_is_read_from_the_precomputed_arrays(
+    snapshot, size, geo, forbid_call
+):
+    # given
+    prediction = snapshot.predict(model=get_model())
+    forbid_call(type(get_model()), "predict")
+
+    # when
+    result = snapshot.get_prediction(geo=geo, ages=size.age_codes)
+    payload = get_excess_deaths_payload(
+        snapshot=snapshot, geo=geo, ages=size.age_codes, year=2020, result_store=None
+    )
+
+    # then
+    positions = snapshot.periods.get_indexer(result.index)
+    geo_index = snapshot.geos.index(geo)
+    for column in ("expected", "lower", "upper"):
+        np.testing.assert_array_equal(
+            result[column].values, getattr(prediction, column)[geo_index, positions]
+        )
+    assert payload["expected_deaths_upper"]
+
+
+def test_published_snapshot_can_be_loaded(snapshot, tmp_path):
+    # given
+    folder = str(tmp_path / "snapshots")
+    publish_snapshot(snapshot=snapshot, folder=folder)
+
+    # when
+    result = load_latest_snapshot(folder=folder)
+
+    # then
+    assert result.version == snapshot.version
+    assert result.geos == snapshot.geos
+    assert result.ages == snapshot.ages
+    pd.testing.assert_index_equal(result.periods, snapshot.periods)
+    np.testing.assert_array_equal(result.deaths, snapshot.deaths)
+    np.testing.assert_array_equal(result.population, snapshot.population)
+    np.testing.assert_array_equal(result.expected_deaths, snapshot.expected_deaths)
+    np.testing.assert_array_equal(
+        result.expected_deaths_lower, snapshot.expected_deaths_lower
+    )
+    np.testing.assert_array_equal(
+        result.expected_deaths_upper, snapshot.expected_deaths_upper
+    )
+
+
+def test_latest_snapshot_is_the_last_published_one(snapshot, tmp_path):
+    # given
+    folder = str(tmp_path / "snapshots")
+    publish_snapshot(snapshot=snapshot, folder=folder)
+    publish_snapshot(
+        snapshot=dataclasses.replace(snapshot, version="v2"),
+        folder=folder,
+    )
+
+    # when
+    result = load_latest_snapshot(folder=folder)
+
+    # then
+    assert result.version == "v2"
+    assert not [name for name in os.listdir(folder) if name.startswith(".tmp")]
+
+
+def test_publishing_an_existing_version_marks_it_as_latest(snapshot, tmp_path):
+    # given
+    folder = str(tmp_path / "snapshots")
+    publish_snapshot(snapshot=snapshot, folder=folder)
+    publish_snapshot(
+        snapshot=dataclasses.replace(snapshot, version="v2"),
+        folder=folder,
+    )
+
+    # when
+    publish_snapshot(snapshot=snapshot, folder=folder)
+
+    # then
+    assert load_latest_snapshot(folder=folder).version == "v1"
+    assert list_versions(folder=folder) == ("v1", "v2")
+
+
+def test_list_versions_skips_leftover_temporary_folders(snapshot, tmp_path):
+    # given
+    folder = str(tmp_path / "snapshots")
+    publish_snapshot(snapshot=snapshot, folder=folder)
+    shutil.copytree(os.path.join(folder, "v1"), os.path.join(folder, ".tmp-v2-1"))
+
+    # when
+    result = list_versions(folder=folder)
+
+    # then
+    assert result == ("v1",)
+
+
+def test_prune_snapshots_keeps_newest_snapshots(snapshot, tmp_path):
+    # given
+    folder = str(tmp_path / "snapshots")
+    for version in ("v1", "v2", "v3"):
+        publish_snapshot(
+            snapshot=dataclasses.replace(snapshot, version=version),
+            folder=folder,
+        )
+
+    # when
+    result = prune_snapshots(folder=folder, keep=2)
+
+    # then
+    assert result == ("v1",)
+    assert list_versions(folder=folder) == ("v2", "v3")
+
+
+def test_load_latest_snapshot_raises_error_if_nothing_was_published(tmp_path):
+    # when and then
+    with pytest.raises(FileNotFoundError):
+        load_latest_snapshot(folder=str(tmp_path / "snapshots"))
+
+
+def test_validate_snapshot_raises_error_for_negative_deaths(
+    mortality_data, population_data
+):
+    # given
+    snapshot = build_snapshot(
+        mortality_data=mortality_data.assign(deaths=-1.0),
+        population_data=population_data,
+    )
+
+    # when and then
+    with pytest.raises(InvalidSnapshotError):
+        validate_snapshot(snapshot)
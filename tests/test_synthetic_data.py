@@ -0,0 +1,67 @@
+import pandas as pd
+import pytest
+from pyjstat import pyjstat  # type: ignore
+
+from benchmarks.run_benchmarks import compare_results
+from benchmarks.synthetic_data import (
+    DatasetSize,
+    generate_mortality_data,
+    generate_mortality_jsonstat,
+)
+from mortality_monitor.constants import AGE_COLUMN, GEO_COLUMN
+from mortality_monitor.eurostat import _preprocess_mortality_data
+
+SIZE = DatasetSize(num_geos=3, num_ages=4, num_years=2)
+
+
+def test_jsonstat_and_long_format_describe_the_same_data():
+    # given
+    jsonstat = generate_mortality_jsonstat(size=SIZE, seed=1)
+
+    # when
+    result = (
+        pyjstat.Dataset.read(jsonstat)
+        .write("dataframe")
+        .pipe(_preprocess_mortality_data)
+    )
+
+    # then
+    pd.testing.assert_frame_equal(result, generate_mortality_data(size=SIZE, seed=1))
+
+
+def test_long_format_data_scales_with_size():
+    # when
+    result = generate_mortality_data(size=SIZE, missing_fraction=0.0).reset_index()
+
+    # then
+    assert result[GEO_COLUMN].nunique() == SIZE.num_geos
+    assert result[AGE_COLUMN].nunique() == SIZE.num_ages
+    assert len(result) == SIZE.num_geos * SIZE.num_ages * (53 + 52)
+
+
+def test_compare_results_reports_regressions_beyond_tolerance():
+    # given
+    baseline = {
+        "size": {"num_geos": 1},
+        "results": {"fast": {"median_seconds": 1.0}, "slow": {"median_seconds": 1.0}},
+    }
+    current = {
+        "size": {"num_geos": 1},
+        "results": {"fast": {"median_seconds": 1.1}, "slow": {"median_seconds": 2.0}},
+    }
+
+    # when
+    result = compare_results(current=current, baseline=baseline, tolerance=0.2)
+
+    # then
+    assert [regression.name for regression in result] == ["slow"]
+
+
+def test_compare_results_raises_error_for_different_sizes():
+    # given
+    baseline = {"size": {"num_geos": 1}, "results": {}}
+    current = {"size": {"num_geos": 2}, "results": {}}
+
+    # when and then
+    with pytest.raises(ValueError):
+        compare_results(current=current, baseline=baseline)
@@ -0,0 +1,53 @@
+from concurrent import futures
+from time import sleep
+
+import pytest
+
+from mortality_monitor.worker_pool import BoundedProcessPool, PoolSaturatedError
+
+
+def test_run_returns_result_of_task():
+    # given
+    pool = BoundedProcessPool(max_workers=1)
+
+    # when
+    result = pool.run(pow, 2, 3)
+
+    # then
+    assert result == 8
+    pool.shutdown()
+
+
+def test_submit_raises_error_if_all_slots_are_taken():
+    # given
+    pool = BoundedProcessPool(max_workers=1, max_queued=1)
+    pool.submit(sleep, 0.5)
+    pool.submit(sleep, 0.5)
+
+    # when and then
+    with pytest.raises(PoolSaturatedError):
+        pool.submit(sleep, 0.5)
+    pool.shutdown()
+
+
+def test_slots_are_freed_once_tasks_are_done():
+    # given
+    pool = BoundedProcessPool(max_workers=1)
+    pool.run(sleep, 0.1)
+
+    # when
+    result = pool.run(pow, 2, 2)
+
+    # then
+    assert result == 4
+    pool.shutdown()
+
+
+def test_run_raises_error_if_task_does_not_finish_in_time():
+    # given
+    pool = BoundedProcessPool(max_workers=1, timeout_seconds=0.1)
+
+    # when and then
+    with pytest.raises(futures.TimeoutError):
+        pool.run(sleep, 1)
+    pool.shutdown()